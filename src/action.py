@@ -8,6 +8,7 @@ from dotenv import load_dotenv
 import openai
 from relevancy import generate_relevance_score, process_subject_fields
 from download_new_papers import get_papers
+import archive
 from datetime import date
 
 import ssl
@@ -294,6 +295,8 @@ def generate_body(topic, categories, interest, threshold):
             )
         else:
             raise RuntimeError("No supported AI API key found for paper analysis")
+        # Keep this run's scores for the historical archive (see archive.py)
+        archive.save_analysis(relevancy, interest=interest, source="digest")
 
         body = "<br><br>".join(
             [
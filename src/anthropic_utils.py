@@ -6,8 +6,11 @@ import os
 import json
 import logging
 import time
+from concurrent.futures import ThreadPoolExecutor
 from typing import List, Dict, Any, Optional
 
+import rate_limit
+
 try:
     import anthropic
     from anthropic.types import MessageParam
@@ -19,6 +22,19 @@ except ImportError:
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Papers analyzed at once, and the organization limits every Claude call in the
+# process shares: requests, input tokens and output tokens per minute (the
+# defaults are tier 1 limits for Sonnet; raise them to match your tier)
+CLAUDE_MAX_CONCURRENCY = int(os.environ.get("CLAUDE_MAX_CONCURRENCY", 4))
+CLAUDE_RPM = float(os.environ.get("CLAUDE_RPM", 50))
+CLAUDE_ITPM = float(os.environ.get("CLAUDE_ITPM", 40000))
+CLAUDE_OTPM = float(os.environ.get("CLAUDE_OTPM", 8000))
+# Retries of a paper after a rate limit (429) or overload (5xx/529) error
+CLAUDE_MAX_RETRIES = int(os.environ.get("CLAUDE_MAX_RETRIES", 4))
+
+_claude_limiter = rate_limit.ModelRateLimiter(CLAUDE_RPM, CLAUDE_ITPM, output_tpm=CLAUDE_OTPM)
+
+
 class ClaudeConfig:
     """Configuration for Claude API calls."""
     def __init__(
@@ -83,25 +99,152 @@ def get_claude_client(api_key: str) -> Optional[anthropic.Anthropic]:
         logger.error(f"Failed to get Anthropic client: {e}")
         return None
 
+def _create_with_limits(client, max_tokens: int, **kwargs):
+    """client.messages.create paced by the shared limits, retrying rate limit and overload errors."""
+    # Roughly four characters per token; output is booked at max_tokens and
+    # the unused part returned once the response reports its usage
+    input_tokens = (len(kwargs["system"]) + sum(len(m["content"]) for m in kwargs["messages"])) // 4
+    for attempt in range(CLAUDE_MAX_RETRIES + 1):
+        _claude_limiter.acquire(input_tokens, output_tokens=max_tokens)
+        try:
+            response = client.messages.create(max_tokens=max_tokens, **kwargs)
+        except (anthropic.RateLimitError, anthropic.InternalServerError) as e:
+            # A rejected request used none of its reservation
+            _claude_limiter.refund(input_tokens, output_tokens=max_tokens)
+            if attempt == CLAUDE_MAX_RETRIES:
+                raise
+            retry_after = rate_limit.retry_after_seconds(e.response.headers.get("retry-after"))
+            delay = rate_limit.backoff_delay(attempt, retry_after)
+            if retry_after is not None:
+                # The limit is per organization, so every worker waits
+                _claude_limiter.pause(delay)
+            logger.warning(f"Claude rate limit or overload ({e.status_code}); retrying in {delay:.1f}s")
+            time.sleep(delay)
+            continue
+        usage = getattr(response, "usage", None)
+        if usage is not None:
+            _claude_limiter.refund(max(0, input_tokens - usage.input_tokens),
+                                   output_tokens=max(0, max_tokens - usage.output_tokens))
+        return response
+
+def _analyze_paper(client, paper, query: Dict[str, str], config: ClaudeConfig, model_name: str, cache,
+                   cache_key: Optional[str]):
+    """Analyze one paper, recording any error on the paper instead of raising."""
+    from download_new_papers import get_paper_content
+    try:
+        # Prepare system prompt
+        system_prompt = f"""
+        You are a research assistant analyzing academic papers in AI and ML.
+        You provide comprehensive, accurate and unbiased analysis based on the user's research interests.
+        Your responses should be well-structured and factual, focusing on the paper's strengths, weaknesses, and relevance.
+        """
+        
+        # Prepare user prompt
+        user_prompt = f"""
+        Analyze this paper and provide insights based on the following research interests:
+        
+        Research interests: {query['interest']}
+        
+        Paper details:
+        Title: {paper['title']}
+        Authors: {paper['authors']}
+        Abstract: {paper['abstract']}
+        Content: {get_paper_content(paper, budget=5000)}
+        
+        Please provide your response as a single JSON object with the following structure:
+        {{
+          "Relevancy score": 1-10 (higher = more relevant),
+          "Reasons for match": "Detailed explanation of why this paper matches the interests",
+          "Key innovations": "List the main contributions of the paper",
+          "Critical analysis": "Evaluate strengths and weaknesses",
+          "Goal": "What problem does the paper address?",
+          "Data": "Description of datasets used",
+          "Methodology": "Technical approach and methods",
+          "Implementation details": "Model architecture, hyperparameters, etc.",
+          "Experiments & Results": "Key findings and comparisons",
+          "Discussion & Next steps": "Limitations and future work",
+          "Related work": "Connection to similar research",
+          "Practical applications": "Real-world uses of this research",
+          "Key takeaways": ["Point 1", "Point 2", "Point 3"]
+        }}
+        
+        Format your response as a valid JSON object and nothing else.
+        """
+        
+        # Just log that we're sending a prompt to Claude
+        print(f"Sending prompt to Claude for paper: {paper['title'][:50]}...")
+        
+        # Create message
+        messages: List[MessageParam] = [
+            {
+                "role": "user",
+                "content": user_prompt
+            }
+        ]
+        
+        # Call the API
+        response = _create_with_limits(
+            client,
+            model=model_name,
+            max_tokens=config.max_tokens,
+            temperature=config.temperature,
+            system=system_prompt,
+            messages=messages
+        )
+        
+        # Extract and parse the response
+        response_text = response.content[0].text if response.content else ""
+        
+        # Try to extract JSON
+        try:
+            start_idx = response_text.find('{')
+            end_idx = response_text.rfind('}') + 1
+            if start_idx >= 0 and end_idx > start_idx:
+                json_str = response_text[start_idx:end_idx]
+                claude_analysis = json.loads(json_str)
+                
+                # Add Claude analysis to paper; Paper keeps one copy of the
+                # fields, readable both directly and via paper['claude_analysis']
+                paper['claude_analysis'] = claude_analysis
+                cache.put(cache_key, claude_analysis)
+            else:
+                logger.warning(f"Could not extract JSON from Claude response for paper {paper['title']}")
+                paper['claude_analysis'] = {"error": "Failed to parse response"}
+        except json.JSONDecodeError:
+            logger.warning(f"Failed to parse Claude response as JSON for paper {paper['title']}")
+            paper['claude_analysis'] = {"error": "Failed to parse response"}
+        
+    except Exception as e:
+        logger.error(f"Claude API error: {e}")
+        paper['claude_analysis'] = {"error": f"Claude API error: {str(e)}"}
+    
+    return paper
+
 def analyze_papers_with_claude(
     papers: List[Dict[str, Any]], 
     query: Dict[str, str],
     config: Optional[ClaudeConfig] = None,
     model_name: str = "claude-3.5-sonnet-20240620",
-    api_key: str = None
+    api_key: str = None,
+    max_concurrency: Optional[int] = None
 ) -> List[Dict[str, Any]]:
     """
     Analyze papers using Claude.
     
+    Papers are analyzed concurrently, each request paced by the shared
+    CLAUDE_RPM/CLAUDE_ITPM/CLAUDE_OTPM limits. A failed paper gets an 'error'
+    analysis and does not affect the others.
+    
     Args:
         papers: List of paper dictionaries
         query: Dictionary with 'interest' key describing research interests
         config: ClaudeConfig object
         model_name: Name of the Claude model to use
         api_key: Anthropic API key (optional if already configured elsewhere)
+        max_concurrency: Requests in flight at once (default CLAUDE_MAX_CONCURRENCY, 1 for sequential)
         
     Returns:
-        List of papers with added analysis
+        List of papers with added analysis, in input order
     """
     if not ANTHROPIC_AVAILABLE:
         logger.error("Anthropic package not installed. Cannot analyze papers.")
@@ -124,102 +267,32 @@ def analyze_papers_with_claude(
     if not client:
         return papers
         
+    from paper import Paper
+    import llm_cache
     analyzed_papers = []
+    to_analyze = []
+    # The prompt is written inline in this file, so the file is its template
+    cache = llm_cache.get_cache()
+    prompt_hash = llm_cache.file_hash(__file__)
     
     for paper in papers:
-        try:
-            # Prepare system prompt
-            system_prompt = f"""
-            You are a research assistant analyzing academic papers in AI and ML.
-            You provide comprehensive, accurate and unbiased analysis based on the user's research interests.
-            Your responses should be well-structured and factual, focusing on the paper's strengths, weaknesses, and relevance.
-            """
-            
-            # Prepare user prompt
-            user_prompt = f"""
-            Analyze this paper and provide insights based on the following research interests:
-            
-            Research interests: {query['interest']}
-            
-            Paper details:
-            Title: {paper['title']}
-            Authors: {paper['authors']}
-            Abstract: {paper['abstract']}
-            Content: {paper['content'][:5000] if 'content' in paper else 'Not available'}
-            
-            Please provide your response as a single JSON object with the following structure:
-            {{
-              "Relevancy score": 1-10 (higher = more relevant),
-              "Reasons for match": "Detailed explanation of why this paper matches the interests",
-              "Key innovations": "List the main contributions of the paper",
-              "Critical analysis": "Evaluate strengths and weaknesses",
-              "Goal": "What problem does the paper address?",
-              "Data": "Description of datasets used",
-              "Methodology": "Technical approach and methods",
-              "Implementation details": "Model architecture, hyperparameters, etc.",
-              "Experiments & Results": "Key findings and comparisons",
-              "Discussion & Next steps": "Limitations and future work",
-              "Related work": "Connection to similar research",
-              "Practical applications": "Real-world uses of this research",
-              "Key takeaways": ["Point 1", "Point 2", "Point 3"]
-            }}
-            
-            Format your response as a valid JSON object and nothing else.
-            """
-            
-            # Just log that we're sending a prompt to Claude
-            print(f"Sending prompt to Claude for paper: {paper['title'][:50]}...")
-            
-            # Create message
-            messages: List[MessageParam] = [
-                {
-                    "role": "user",
-                    "content": user_prompt
-                }
-            ]
-            
-            # Call the API
-            response = client.messages.create(
-                model=model_name,
-                max_tokens=config.max_tokens,
-                temperature=config.temperature,
-                system=system_prompt,
-                messages=messages
-            )
-            
-            # Extract and parse the response
-            response_text = response.content[0].text if response.content else ""
-            
-            # Try to extract JSON
-            try:
-                start_idx = response_text.find('{')
-                end_idx = response_text.rfind('}') + 1
-                if start_idx >= 0 and end_idx > start_idx:
-                    json_str = response_text[start_idx:end_idx]
-                    claude_analysis = json.loads(json_str)
-                    
-                    # Add Claude analysis to paper
-                    paper['claude_analysis'] = claude_analysis
-                    
-                    # Directly copy fields to paper
-                    for key, value in claude_analysis.items():
-                        paper[key] = value
-                else:
-                    logger.warning(f"Could not extract JSON from Claude response for paper {paper['title']}")
-                    paper['claude_analysis'] = {"error": "Failed to parse response"}
-            except json.JSONDecodeError:
-                logger.warning(f"Failed to parse Claude response as JSON for paper {paper['title']}")
-                paper['claude_analysis'] = {"error": "Failed to parse response"}
-                
-            analyzed_papers.append(paper)
-            
-            # Avoid rate limiting
-            time.sleep(1)
-            
-        except Exception as e:
-            logger.error(f"Claude API error: {e}")
-            paper['claude_analysis'] = {"error": f"Claude API error: {str(e)}"}
-            analyzed_papers.append(paper)
+        paper = Paper.from_dict(paper)
+        analyzed_papers.append(paper)
+        cache_key = llm_cache.result_key(paper, query, model_name, "claude", prompt_hash)
+        cached = cache.get(cache_key)
+        if cached is not None:
+            paper['claude_analysis'] = cached
+        else:
+            to_analyze.append((paper, cache_key))
+    
+    if to_analyze:
+        max_workers = max(1, min(max_concurrency or CLAUDE_MAX_CONCURRENCY, len(to_analyze)))
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            # Papers are updated in place, so analyzed_papers keeps the input order
+            list(executor.map(
+                lambda item: _analyze_paper(client, item[0], query, config, model_name, cache, item[1]),
+                to_analyze
+            ))
             
     return analyzed_papers
 
@@ -1,8 +1,11 @@
 import gradio as gr
-from download_new_papers import get_papers
+from download_new_papers import get_papers, PaperStream
+import archive
+import search_index
 import utils
 from relevancy import generate_relevance_score, process_subject_fields
 
+import html
 import os
 import openai
 import datetime
@@ -566,21 +569,19 @@ def sample(email, topic, physics_topic, categories, interest, use_openai, use_ge
     if not (use_openai or use_gemini or use_anthropic):
         raise gr.Error("You must select at least one model provider (OpenAI, Gemini, or Claude)")
     
-    # Get papers based on categories
+    # Get papers based on categories. Papers are streamed so Stage 1 can start
+    # scoring the first batch while the rest of the listing is still ingesting.
+    all_papers = get_papers(abbr, stream=True)
     if categories:
-        all_papers = get_papers(abbr)
-        all_papers = [
+        all_papers = PaperStream(
             t for t in all_papers
-            if bool(set(process_subject_fields(t['subjects'])) & set(categories))]
-        print(f"Found {len(all_papers)} papers matching categories: {categories}")
+            if bool(set(process_subject_fields(t['subjects'])) & set(categories)))
+        print(f"Streaming papers matching categories: {categories}")
     else:
-        all_papers = get_papers(abbr)
-        print(f"Found {len(all_papers)} papers for topic: {topic}")
+        print(f"Streaming papers for topic: {topic}")
     
     # Always process all papers
     papers = all_papers
-    total_papers = len(all_papers)
-    print(f"Processing all {total_papers} papers")
     
     # Fixed parameters:
     # - Stage 1: 8 papers per batch for relevancy scoring (title & abstract only)
@@ -648,7 +649,8 @@ def sample(email, topic, physics_topic, categories, interest, use_openai, use_ge
         
         # Process papers directly instead of using model_manager
         print("\n===== ANALYZING PAPERS FOR EMAIL =====")
-        print(f"Processing {len(papers)} papers...")
+        if isinstance(papers, list):
+            print(f"Processing {len(papers)} papers...")
         relevancy = []
         hallucination = False
         
@@ -757,6 +759,9 @@ def sample(email, topic, physics_topic, categories, interest, use_openai, use_ge
                         if design_analysis and "error" not in design_analysis:
                             paper["design_analysis"] = design_analysis
         
+        # Keep this run's scores for the historical archive (see archive.py)
+        archive.save_analysis(relevancy, interest=interest, source="digest")
+        
         # Add specialized analysis if requested
         if special_analysis and len(relevancy) > 0:
             # Get topic clustering from Gemini if available
@@ -895,6 +900,25 @@ def change_physics(subject):
         return {"visible": True}
 
 
+def search_ingested_papers(query, category, days):
+    """BM25 search over every ingested paper; no API calls."""
+    since = None
+    if days:
+        since = (datetime.date.today() - datetime.timedelta(days=int(days))).isoformat()
+    results = search_index.search(query, limit=50, category=category.strip() or None, since=since)
+    if not results:
+        return "<p>No matching papers.</p>"
+    items = []
+    for paper in results:
+        # Snippets mark matches with <b></b>; everything else is escaped
+        snippet = html.escape(paper["snippet"] or "").replace("&lt;b&gt;", "<b>").replace("&lt;/b&gt;", "</b>")
+        items.append(
+            f'<li><a href="{html.escape(paper["main_page"])}" target="_blank">{html.escape(paper["title"])}</a> '
+            f'<small>({paper["announce_date"]}, score {paper["search_score"]:.1f})</small><br>{snippet}</li>'
+        )
+    return f"<p>{len(results)} papers</p><ol>{''.join(items)}</ol>"
+
+
 def register_openai_token(token):
     openai.api_key = token
     model_manager.register_openai(token)
@@ -1054,6 +1078,15 @@ with gr.Blocks(css=custom_css) as demo:
                 info="Papers are first filtered by relevance score, then analyzed in depth. HTML reports are saved to the 'digest' folder.",
                 show_label=True
             )
+
+        with gr.Accordion("Search ingested papers", open=False):
+            gr.Markdown("Full-text BM25 search over every paper downloaded so far. Runs locally, with no API cost.")
+            with gr.Row():
+                search_query = gr.Textbox(label="Search", placeholder="e.g. layout generation diffusion", scale=3)
+                search_category = gr.Textbox(label="Category", placeholder="e.g. cs.CV (optional)", scale=1)
+                search_days = gr.Number(label="Last N days (0 = all)", value=30, precision=0, scale=1)
+            search_btn = gr.Button("Search")
+            search_results = gr.HTML()
         
     # Define all input fields
     all_inputs = [
@@ -1098,4 +1131,9 @@ with gr.Blocks(css=custom_css) as demo:
     # Only allow updates when the button is clicked or interest is submitted directly
     interest.submit(fn=sample, inputs=all_inputs, outputs=sample_output)
 
+    # Local full-text search
+    search_inputs = [search_query, search_category, search_days]
+    search_btn.click(fn=search_ingested_papers, inputs=search_inputs, outputs=search_results)
+    search_query.submit(fn=search_ingested_papers, inputs=search_inputs, outputs=search_results)
+
 demo.launch(show_api=False)
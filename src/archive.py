@@ -0,0 +1,379 @@
+"""
+Columnar Parquet archive of historical papers and analysis scores.
+
+A compaction job rolls the daily paper files and saved analysis runs into
+Parquet partitioned by month and category:
+
+    data/archive/papers/month=2024-05/category=cs.CV/part-0.parquet
+    data/archive/scores/month=2024-05/category=cs.CV/part-0.parquet
+
+Paper rows take their full text from the paper store when the daily file has
+none, which is the normal case in lazy content mode, where crawled content is
+only written to SQLite.
+
+Only months whose source files or stored content changed since the last run are
+rewritten. The reader projects just the columns a report needs, so statistics
+over months of digests scan a few columns instead of re-parsing JSON.
+
+Run the compaction with:
+    python src/archive.py --compact
+"""
+import argparse
+import datetime
+import json
+import os
+import re
+import shutil
+from typing import Any, Dict, Iterable, List, Optional
+
+import jsonl_store
+import paper_store
+from page_cache import parse_arxiv_id
+from paper_store import categories_of, iso_date, parse_file_name
+from paths import DATA_DIR
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+
+ARCHIVE_DIR = os.path.join(DATA_DIR, "archive")
+ANALYSIS_DIR = os.path.join(DATA_DIR, "analysis")
+MANIFEST_NAME = "_manifest.json"
+
+# Analysis output fields (see relevancy.generate_relevance_score) -> score columns
+ANALYSIS_FIELDS = {
+    "Reasons for match": "reasons_for_match",
+    "Key innovations": "key_innovations",
+    "Critical analysis": "critical_analysis",
+    "Goal": "goal",
+    "Data": "data",
+    "Methodology": "methodology",
+    "Implementation details": "implementation_details",
+    "Experiments & Results": "experiments_results",
+    "Git": "git",
+    "Discussion & Next steps": "discussion_next_steps",
+    "Related work": "related_work",
+    "Practical applications": "practical_applications",
+    "Key takeaways": "key_takeaways",
+}
+
+_ANALYSIS_FILE = re.compile(r"^analysis_(?P<date>\d{4}-\d{2}-\d{2})_")
+
+
+def _require_pyarrow() -> None:
+    if not PYARROW_AVAILABLE:
+        raise ImportError("pyarrow is required for the Parquet archive: pip install pyarrow")
+
+
+def _schemas() -> Dict[str, "pa.Schema"]:
+    papers = pa.schema([
+        ("id", pa.string()),
+        ("announce_date", pa.date32()),
+        ("listing_field", pa.string()),
+        ("primary_category", pa.string()),
+        ("categories", pa.list_(pa.string())),
+        ("title", pa.string()),
+        ("authors", pa.string()),
+        ("subjects", pa.string()),
+        ("abstract", pa.string()),
+        ("content", pa.string()),
+        ("content_source", pa.string()),
+        ("content_tokens", pa.int32()),
+    ])
+    scores = pa.schema([
+        ("id", pa.string()),
+        ("analyzed_at", pa.timestamp("s")),
+        ("source", pa.string()),
+        ("interest", pa.string()),
+        ("primary_category", pa.string()),
+        ("categories", pa.list_(pa.string())),
+        ("title", pa.string()),
+        ("relevancy_score", pa.int32()),
+        ("design_category", pa.string()),
+        ("design_techniques", pa.list_(pa.string())),
+    ] + [(column, pa.string()) for column in ANALYSIS_FIELDS.values()])
+    return {"papers": papers, "scores": scores}
+
+
+def save_analysis(papers: Iterable[Dict[str, Any]], interest: str = "", source: str = "digest",
+                  analysis_dir: str = ANALYSIS_DIR) -> Optional[str]:
+    """
+    Save one analysis run (scored papers) for later compaction into the archive.
+
+    Args:
+        papers: Analyzed paper dicts, as returned by the relevancy/LLM stages
+        interest: The research interest the papers were scored against
+        source: Which tool produced the run, e.g. "digest" or "design"
+
+    Returns:
+        Path of the saved run, or None if there was nothing to save
+    """
+    now = datetime.datetime.now()
+    records = [
+        {**{key: value for key, value in paper.items() if key not in ("content", "sections")},
+         "interest": interest, "source": source, "analyzed_at": now.isoformat(timespec="seconds")}
+        for paper in papers
+    ]
+    if not records:
+        return None
+    os.makedirs(analysis_dir, exist_ok=True)
+    name = f"analysis_{now:%Y-%m-%d_%H%M%S}_{os.getpid()}.jsonl"
+    return jsonl_store.write_jsonl(os.path.join(analysis_dir, name), records)
+
+
+def _as_int(value) -> Optional[int]:
+    # Scores come back from LLMs as 7, "7" or "7/10"
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return int(value)
+    match = re.match(r"\s*(\d+)", str(value or ""))
+    return int(match.group(1)) if match else None
+
+
+def _as_text(value) -> Optional[str]:
+    if value is None:
+        return None
+    return value if isinstance(value, str) else json.dumps(value)
+
+
+def _paper_row(paper: Dict[str, Any], field: str, date: datetime.date,
+               store: Optional[paper_store.PaperStore] = None) -> Optional[Dict[str, Any]]:
+    arxiv_id = parse_arxiv_id(paper.get("main_page", ""))[0]
+    if arxiv_id is None:
+        return None
+    categories = categories_of(paper)
+    content, content_source = paper.get("content"), paper.get("content_source")
+    if not content and store is not None:
+        # Lazily crawled content is only in the store's paper_content table
+        stored = store.get_content(arxiv_id)
+        if stored is not None:
+            content, _, content_source = stored
+    content_tokens = (paper.get("token_counts") or {}).get("content")
+    if content_tokens is None and content:
+        from prefetch import token_counts
+        content_tokens = token_counts({"content": content})["content"]
+    return {
+        "id": arxiv_id,
+        "announce_date": date,
+        "listing_field": field,
+        "primary_category": categories[0] if categories else field,
+        "categories": categories,
+        "title": paper.get("title"),
+        "authors": paper.get("authors"),
+        "subjects": paper.get("subjects"),
+        "abstract": paper.get("abstract"),
+        "content": content,
+        "content_source": content_source,
+        "content_tokens": content_tokens,
+    }
+
+
+def _score_row(record: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    arxiv_id = parse_arxiv_id(record.get("main_page", ""))[0]
+    if arxiv_id is None:
+        return None
+    categories = categories_of(record)
+    row = {
+        "id": arxiv_id,
+        "analyzed_at": datetime.datetime.fromisoformat(record["analyzed_at"]),
+        "source": record.get("source"),
+        "interest": _as_text(record.get("interest")),
+        "primary_category": categories[0] if categories else None,
+        "categories": categories,
+        "title": record.get("title"),
+        "relevancy_score": _as_int(record.get("Relevancy score", record.get("relevancy_score"))),
+        "design_category": record.get("design_category"),
+        "design_techniques": [str(t) for t in record.get("design_techniques") or []],
+    }
+    for field, column in ANALYSIS_FIELDS.items():
+        row[column] = _as_text(record.get(field))
+    return row
+
+
+def _sources(data_dir: str, analysis_dir: str) -> Dict[str, Dict[str, List[str]]]:
+    """{kind: {month: [source files]}} for every paper file and analysis run."""
+    sources = {"papers": {}, "scores": {}}
+    for file_path in jsonl_store.list_files(data_dir):
+        parsed = parse_file_name(file_path)
+        if parsed is None:
+            continue
+        try:
+            month = iso_date(parsed[1])[:7]
+        except ValueError:
+            continue
+        sources["papers"].setdefault(month, []).append(file_path)
+    for file_path in jsonl_store.list_files(analysis_dir):
+        match = _ANALYSIS_FILE.match(os.path.basename(file_path))
+        if match:
+            sources["scores"].setdefault(match.group("date")[:7], []).append(file_path)
+    return sources
+
+
+def _month_rows(kind: str, files: List[str]) -> List[Dict[str, Any]]:
+    rows = []
+    if kind == "papers":
+        store = paper_store.get_store()
+        seen = set()
+        # Oldest listing first, so a cross-listed paper keeps its first announcement
+        dated = sorted(files, key=lambda path: iso_date(parse_file_name(path)[1]))
+        for file_path in dated:
+            field, date_str = parse_file_name(file_path)
+            date = datetime.date.fromisoformat(iso_date(date_str))
+            for paper in jsonl_store.iter_jsonl(file_path):
+                row = _paper_row(paper, field, date, store)
+                if row is not None and row["id"] not in seen:
+                    seen.add(row["id"])
+                    rows.append(row)
+    else:
+        for file_path in sorted(files):
+            rows += [row for row in map(_score_row, jsonl_store.iter_jsonl(file_path)) if row is not None]
+    return rows
+
+
+def _write_month(kind_dir: str, month: str, rows: List[Dict[str, Any]], schema: "pa.Schema") -> int:
+    by_category = {}
+    for row in rows:
+        by_category.setdefault(row["primary_category"] or "unknown", []).append(row)
+
+    # Build the new month next to the old one and swap, so readers never see a half-written month
+    final_dir = os.path.join(kind_dir, f"month={month}")
+    tmp_dir = f"{final_dir}.{os.getpid()}.tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    for category, category_rows in by_category.items():
+        part_dir = os.path.join(tmp_dir, f"category={category}")
+        os.makedirs(part_dir, exist_ok=True)
+        table = pa.Table.from_pylist(category_rows, schema=schema)
+        pq.write_table(table, os.path.join(part_dir, "part-0.parquet"), compression="zstd")
+    old_dir = f"{final_dir}.{os.getpid()}.old"
+    if os.path.exists(final_dir):
+        os.replace(final_dir, old_dir)
+    if by_category:
+        os.replace(tmp_dir, final_dir)
+    shutil.rmtree(old_dir, ignore_errors=True)
+    return len(rows)
+
+
+def compact(data_dir: str = DATA_DIR, analysis_dir: str = ANALYSIS_DIR, archive_dir: str = ARCHIVE_DIR,
+            full: bool = False) -> Dict[str, Dict[str, int]]:
+    """
+    Roll paper files and analysis runs into the partitioned Parquet archive.
+
+    Args:
+        full: Rewrite every month, not just months whose sources changed
+
+    Returns:
+        {kind: {month: rows written}} for the months that were rewritten
+    """
+    _require_pyarrow()
+    schemas = _schemas()
+    manifest_path = os.path.join(archive_dir, MANIFEST_NAME)
+    manifest = {}
+    if not full and os.path.exists(manifest_path):
+        with open(manifest_path, "r") as f:
+            manifest = json.load(f)
+
+    written = {}
+    new_manifest = {}
+    for kind, months in _sources(data_dir, analysis_dir).items():
+        kind_dir = os.path.join(archive_dir, kind)
+        written[kind] = {}
+        for month, files in sorted(months.items()):
+            stamps = {path: [os.path.getsize(path), os.path.getmtime(path)] for path in files}
+            if kind == "papers":
+                # Content crawled after a month was compacted changes no file
+                stamps["paper_content"] = paper_store.get_store().content_count(f"{month}-01", f"{month}-31")
+            key = f"{kind}/{month}"
+            new_manifest[key] = stamps
+            if manifest.get(key) == stamps:
+                continue
+            written[kind][month] = _write_month(kind_dir, month, _month_rows(kind, files), schemas[kind])
+
+    os.makedirs(archive_dir, exist_ok=True)
+    with open(manifest_path + ".tmp", "w") as f:
+        json.dump(new_manifest, f)
+    os.replace(manifest_path + ".tmp", manifest_path)
+    return written
+
+
+def read_table(
+    kind: str = "papers",
+    columns: Optional[List[str]] = None,
+    months: Optional[List[str]] = None,
+    categories: Optional[List[str]] = None,
+    archive_dir: str = ARCHIVE_DIR
+) -> "pa.Table":
+    """
+    Read the archive, projecting only the requested columns.
+
+    Args:
+        kind: "papers" or "scores"
+        columns: Columns to read (default: all). The partition columns "month"
+            and "category" can be requested like any other.
+        months: Only these months, e.g. ["2024-05"]
+        categories: Only these primary categories, e.g. ["cs.CV"]
+
+    Returns:
+        A pyarrow Table; empty if nothing has been archived yet
+    """
+    _require_pyarrow()
+    partitioning = ds.partitioning(pa.schema([("month", pa.string()), ("category", pa.string())]), flavor="hive")
+    schema = _schemas()[kind]
+    full_schema = pa.schema(list(schema) + list(partitioning.schema))
+    kind_dir = os.path.join(archive_dir, kind)
+    if not os.path.isdir(kind_dir):
+        empty = full_schema.empty_table()
+        return empty.select(columns) if columns else empty
+
+    dataset = ds.dataset(kind_dir, format="parquet", partitioning=partitioning, schema=full_schema)
+    expression = None
+    if months:
+        expression = ds.field("month").isin(months)
+    if categories:
+        category_filter = ds.field("category").isin(categories)
+        expression = category_filter if expression is None else expression & category_filter
+    return dataset.to_table(columns=columns, filter=expression)
+
+
+def score_stats(months: Optional[List[str]] = None, archive_dir: str = ARCHIVE_DIR) -> List[Dict[str, Any]]:
+    """Relevancy score count and mean per (month, category), read column-wise."""
+    table = read_table("scores", columns=["month", "category", "relevancy_score"], months=months,
+                       archive_dir=archive_dir)
+    stats = table.group_by(["month", "category"]).aggregate([
+        ("relevancy_score", "count"), ("relevancy_score", "mean")
+    ])
+    return sorted(stats.to_pylist(), key=lambda row: (row["month"], row["category"]))
+
+
+def technique_trends(months: Optional[List[str]] = None, archive_dir: str = ARCHIVE_DIR) -> List[Dict[str, Any]]:
+    """Papers per design technique per month, from the design_techniques column."""
+    table = read_table("scores", columns=["month", "design_techniques"], months=months, archive_dir=archive_dir)
+    techniques = table.column("design_techniques").combine_chunks()
+    flat = pa.table({
+        "month": pc.take(table.column("month"), pc.list_parent_indices(techniques)),
+        "technique": pc.list_flatten(techniques),
+    })
+    counts = flat.group_by(["month", "technique"]).aggregate([("technique", "count")])
+    return sorted(counts.to_pylist(), key=lambda row: (row["month"], -row["technique_count"]))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compact paper files and analysis runs into a Parquet archive.")
+    parser.add_argument("--compact", action="store_true", help="Roll changed months into the archive")
+    parser.add_argument("--full", action="store_true", help="Rewrite every month")
+    parser.add_argument("--stats", action="store_true", help="Print score statistics per month and category")
+    args = parser.parse_args()
+
+    if args.compact or args.full:
+        for kind, months in compact(full=args.full).items():
+            for month, rows in months.items():
+                print(f"{kind} {month}: {rows} rows")
+    if args.stats:
+        for row in score_stats():
+            print(f"{row['month']} {row['category']}: {row['relevancy_score_count']} scored, "
+                  f"mean {row['relevancy_score_mean']}")
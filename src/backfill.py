@@ -0,0 +1,131 @@
+"""
+Date-correct multi-day backfill of per-category paper files.
+
+Each (category, date) pair resolves to its own source: today's pair to the
+live /new listing, earlier days to an OAI-PMH harvest of that date range.
+Pairs already on disk are skipped, and the remaining work runs concurrently.
+All requests share the global per-host limiter in rate_limit, so concurrency
+never exceeds arXiv's allowed rate.
+"""
+import datetime
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, List, Optional, Tuple
+
+import pytz
+
+import jsonl_store
+import oai_harvester
+import paper_store
+from download_new_papers import _download_new_papers, paper_file_path
+from ingest_planner import plan_listings
+
+logger = logging.getLogger(__name__)
+
+BACKFILL_MAX_WORKERS = int(os.environ.get("ARXIV_BACKFILL_WORKERS", 4))
+
+# arXiv listing dates follow New York time
+ARXIV_TZ = pytz.timezone("America/New_York")
+
+
+def listing_dates(days_back: int = 7, today: Optional[datetime.date] = None) -> List[datetime.date]:
+    """The last `days_back` listing days, newest first, in arXiv's timezone."""
+    today = today or datetime.datetime.now(tz=ARXIV_TZ).date()
+    return [today - datetime.timedelta(days=i) for i in range(days_back)]
+
+
+def date_str(date: datetime.date) -> str:
+    """Format a date the way paper files are named, e.g. 'Wed, 10 May 23'."""
+    return date.strftime("%a, %d %b %y")
+
+
+def missing_pairs(categories: List[str], dates: List[datetime.date]) -> List[Tuple[str, datetime.date]]:
+    """(category, date) pairs that have no paper file yet, nor a stored field listing to view them from."""
+    store = paper_store.get_store()
+    return [
+        (category, date)
+        for category in categories
+        for date in dates
+        if not os.path.exists(paper_file_path(category, date_str(date)))
+        and store.view_source(category, date_str(date)) is None
+    ]
+
+
+def _harvest_range(categories: List[str], dates: List[datetime.date], base_url: str) -> int:
+    first, last = min(dates), max(dates)
+    written = oai_harvester.harvest(categories, first.isoformat(), last.isoformat(), base_url=base_url)
+    if not written:
+        return 0
+    # Days up to the newest harvested day that got no papers (weekends, holidays)
+    # get an empty file, so the next run treats them as done. Later days may just
+    # not be in the OAI feed yet, so they are left for the next run.
+    pair_dates = {paper_file_path(c, date_str(d)): d for c in categories for d in dates}
+    harvested = [pair_dates[path] for path in written if path in pair_dates]
+    if not harvested:
+        return len(written)
+    harvested_through = max(harvested)
+    for file_path, date in pair_dates.items():
+        if date <= harvested_through and not os.path.exists(file_path):
+            jsonl_store.write_jsonl(file_path, [])
+            paper_store.get_store().import_file(file_path)
+    return len(written)
+
+
+def backfill(
+    categories: List[str],
+    days_back: int = 7,
+    max_workers: int = BACKFILL_MAX_WORKERS,
+    base_url: str = oai_harvester.OAI_BASE_URL,
+    today: Optional[datetime.date] = None
+) -> Dict[str, int]:
+    """
+    Make sure every (category, date) file in the window exists on disk.
+
+    Today's missing categories are scraped from the /new listings planned by
+    ingest_planner, one task per listing page. Earlier missing days are harvested over OAI-PMH, one task per
+    OAI set covering just the dates still missing for that set.
+
+    Args:
+        categories: arXiv categories, e.g. ["cs.CV", "cs.GR"]
+        days_back: Number of listing days to cover, including today
+        max_workers: Concurrent tasks; requests stay paced by rate_limit
+        base_url: OAI-PMH endpoint for past days
+        today: Override today's date (arXiv timezone)
+
+    Returns:
+        Counts of pairs that were 'cached', 'fetched' or 'failed'
+    """
+    dates = listing_dates(days_back, today)
+    todays_date = dates[0]
+    missing = missing_pairs(categories, dates)
+    stats = {"cached": len(categories) * len(dates) - len(missing), "fetched": 0, "failed": 0}
+    if not missing:
+        return stats
+
+    tasks = {}
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        # One listing page per field when several of its categories are missing
+        todays_categories = sorted({c for c, d in missing if d == todays_date})
+        for page, page_categories in plan_listings(todays_categories, date_str(todays_date)).items():
+            tasks[executor.submit(_download_new_papers, page)] = [(c, todays_date) for c in page_categories]
+
+        past_by_set = {}
+        for category, date in missing:
+            if date != todays_date:
+                past_by_set.setdefault(oai_harvester.set_spec_for(category), []).append((category, date))
+        for pairs in past_by_set.values():
+            set_categories = sorted({c for c, _ in pairs})
+            set_dates = sorted({d for _, d in pairs})
+            tasks[executor.submit(_harvest_range, set_categories, set_dates, base_url)] = pairs
+
+        for future in as_completed(tasks):
+            pairs = tasks[future]
+            try:
+                future.result()
+                stats["fetched"] += len(pairs)
+            except Exception as e:
+                stats["failed"] += len(pairs)
+                logger.error(f"Backfill failed for {len(pairs)} (category, date) pairs starting {pairs[0]}: {e}")
+    logger.info(f"Backfill: {stats['cached']} cached, {stats['fetched']} fetched, {stats['failed']} failed")
+    return stats
@@ -2,8 +2,12 @@
 """
 Design Finder - A self-contained script to find AI/ML design automation papers on arXiv.
 
-This script requires only Python standard libraries and BeautifulSoup, making it very easy to run
-without complex dependencies.
+It is no longer self-contained: listings are fetched, backfilled and stored through the modules in
+src/ (backfill, oai_harvester, download_new_papers, paper_store, jsonl_store and http_client), so it
+needs the src/ tree next to it and their requirements: beautifulsoup4, pytz and tqdm, plus the
+standard library's sqlite3. aiohttp (pooled keep-alive HTTP, urllib otherwise), lxml (faster
+parsing) and pypdf (PDF full text) are used when installed. Only BeautifulSoup is installed on
+demand if missing.
 
 Usage:
     python design_finder.py [--days 7] [--output design_papers.json]
@@ -15,8 +19,6 @@ import json
 import argparse
 import datetime
 import re
-import time
-import urllib.request
 from typing import List, Dict, Any
 
 # Check for BeautifulSoup
@@ -48,6 +50,11 @@ DESIGN_AUTOMATION_KEYWORDS = [
     "user interface generation", "visual layout", "image composition", "AI design"
 ]
 
+def _add_src_to_path():
+    src_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    if src_dir not in sys.path:
+        sys.path.append(src_dir)
+
 class DesignPaperFinder:
     def __init__(self, days_back=7, categories=None, output_file="design_papers.json", 
                  html_file="design_papers.html", keyword=None, verbose=True):
@@ -68,38 +75,33 @@ class DesignPaperFinder:
     
     def get_date_range(self) -> List[str]:
         """Get list of dates to search in arXiv format."""
-        today = datetime.datetime.now()
-        dates = []
-        
-        for i in range(self.days_back):
-            date = today - datetime.timedelta(days=i)
-            date_str = date.strftime("%a, %d %b %y")
-            dates.append(date_str)
-            
-        return dates
+        _add_src_to_path()
+        from backfill import listing_dates, date_str
+        return [date_str(date) for date in listing_dates(self.days_back)]
     
     def download_papers(self, category: str, date_str: str) -> List[Dict[str, Any]]:
         """Download papers for a specific category and date."""
         # Check if we already have this data
-        # Import data directory at runtime to avoid circular imports
-        import sys
-        sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-        from paths import DATA_DIR
-        file_path = os.path.join(DATA_DIR, f"{category}_{date_str}.jsonl")
-        if os.path.exists(file_path):
+        # Import src modules at runtime to avoid circular imports
+        _add_src_to_path()
+        import http_client
+        import jsonl_store
+        import paper_store
+        stored = paper_store.load_listing(category, date_str)
+        if stored is not None:
             self.log(f"Loading cached papers for {category} on {date_str}")
-            papers = []
-            with open(file_path, "r") as f:
-                for line in f:
-                    papers.append(json.loads(line))
-            return papers
+            return list(stored)
+        if date_str != self.get_date_range()[0]:
+            # The /new listing only shows today; earlier days come from backfill()
+            self.log(f"No backfilled data for {category} on {date_str}")
+            return []
         
         # Download new papers
         self.log(f"Downloading papers for {category} on {date_str}")
         NEW_SUB_URL = f'https://arxiv.org/list/{category}/new'
         
         try:
-            page = urllib.request.urlopen(NEW_SUB_URL)
+            page = http_client.fetch(NEW_SUB_URL).body
         except Exception as e:
             self.log(f"Error downloading from {NEW_SUB_URL}: {e}")
             return []
@@ -134,7 +136,7 @@ class DesignPaperFinder:
                 
                 # Get a short excerpt of content (optional)
                 try:
-                    html = urllib.request.urlopen(arxiv_html + paper_number + "v1")
+                    html = http_client.fetch(arxiv_html + paper_number + "v1").body
                     soup_content = bs(html, 'html.parser')
                     content_div = soup_content.find('div', attrs={'class': 'ltx_page_content'})
                     if content_div:
@@ -151,10 +153,10 @@ class DesignPaperFinder:
                 if self.verbose:
                     self.log(f"Error processing paper {i}: {e}")
         
-        # Save papers to file
-        with open(file_path, "w") as f:
-            for paper in papers:
-                f.write(json.dumps(paper) + "\n")
+        # Save papers to file and the paper store
+        jsonl_store.write_jsonl(paper_store.listing_file_path(category, date_str), papers,
+                                key=jsonl_store.paper_key)
+        paper_store.get_store().add_listing(category, date_str, papers)
         
         return papers
     
@@ -219,6 +221,12 @@ class DesignPaperFinder:
         self.log(f"Looking for design papers in the past {self.days_back} days")
         self.log(f"Searching categories: {', '.join(self.categories)}")
         
+        # Fill in every (category, day) file first: today's listing plus an
+        # OAI-PMH harvest for earlier days, fetched concurrently
+        _add_src_to_path()
+        from backfill import backfill
+        backfill(self.categories, self.days_back)
+        
         # Get papers for each category and date
         dates = self.get_date_range()
         all_papers = []
@@ -228,8 +236,6 @@ class DesignPaperFinder:
                 try:
                     papers = self.download_papers(category, date_str)
                     all_papers.extend(papers)
-                    # Avoid hitting arXiv rate limits
-                    time.sleep(3)
                 except Exception as e:
                     self.log(f"Error downloading papers for {category} on {date_str}: {e}")
         
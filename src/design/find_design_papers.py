@@ -16,14 +16,17 @@ import argparse
 import datetime
 import logging
 import re
-import urllib.request
-import time
 from typing import List, Dict, Any, Optional, Tuple
 from bs4 import BeautifulSoup as bs
 
 # Add parent directory to path to allow imports from sibling modules
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from paths import DATA_DIR, DIGEST_DIR
+import archive
+import http_client
+import jsonl_store
+import paper_store
+from backfill import backfill, listing_dates, date_str as listing_date_str
 from model_manager import model_manager, ModelProvider
 
 # Configure logging
@@ -65,32 +68,26 @@ def download_papers(category: str, date_str: str = None) -> List[Dict[str, Any]]
         List of paper dictionaries
     """
     if not date_str:
-        date = datetime.datetime.now()
-        date_str = date.strftime("%a, %d %b %y")
+        date_str = get_date_range(1)[0]
     
     # Data directory is already created by paths.py
     pass
     
     # Check if we already have this data
-    file_path = os.path.join(DATA_DIR, f"{category}_{date_str}.jsonl")
-    if os.path.exists(file_path):
-        papers = []
-        with open(file_path, "r") as f:
-            for line in f:
-                papers.append(json.loads(line))
-        return papers
+    stored = paper_store.load_listing(category, date_str)
+    if stored is not None:
+        return list(stored)
+    if date_str != get_date_range(1)[0]:
+        # The /new listing only shows today; earlier days come from backfill()
+        logger.warning(f"No backfilled data for {category} on {date_str}")
+        return []
     
     # Download new papers
     logger.info(f"Downloading papers for {category} on {date_str}")
     NEW_SUB_URL = f'https://arxiv.org/list/{category}/new'
     
     try:
-        # Add user-agent header to appear more like a browser
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/121.0.0.0 Safari/537.36'
-        }
-        req = urllib.request.Request(NEW_SUB_URL, headers=headers)
-        page = urllib.request.urlopen(req)
+        page = http_client.fetch(NEW_SUB_URL).body
     except Exception as e:
         logger.error(f"Error downloading from {NEW_SUB_URL}: {e}")
         return []
@@ -125,12 +122,7 @@ def download_papers(category: str, date_str: str = None) -> List[Dict[str, Any]]
             
             # Get a short excerpt of content (optional)
             try:
-                # Add user-agent header to appear more like a browser
-                headers = {
-                    'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/121.0.0.0 Safari/537.36'
-                }
-                req = urllib.request.Request(arxiv_html + paper_number + "v1", headers=headers)
-                html = urllib.request.urlopen(req)
+                html = http_client.fetch(arxiv_html + paper_number + "v1").body
                 soup_content = bs(html, 'html.parser')
                 content_div = soup_content.find('div', attrs={'class': 'ltx_page_content'})
                 if content_div:
@@ -146,10 +138,9 @@ def download_papers(category: str, date_str: str = None) -> List[Dict[str, Any]]
         except Exception as e:
             logger.warning(f"Error processing paper {i}: {e}")
     
-    # Save papers to file
-    with open(file_path, "w") as f:
-        for paper in papers:
-            f.write(json.dumps(paper) + "\n")
+    # Save papers to file and the paper store
+    jsonl_store.write_jsonl(paper_store.listing_file_path(category, date_str), papers, key=jsonl_store.paper_key)
+    paper_store.get_store().add_listing(category, date_str, papers)
     
     return papers
 
@@ -243,15 +234,7 @@ def get_date_range(days_back: int = 7) -> List[str]:
     Returns:
         List of date strings in arXiv format
     """
-    today = datetime.datetime.now()
-    dates = []
-    
-    for i in range(days_back):
-        date = today - datetime.timedelta(days=i)
-        date_str = date.strftime("%a, %d %b %y")
-        dates.append(date_str)
-        
-    return dates
+    return [listing_date_str(date) for date in listing_dates(days_back)]
 
 def generate_html_report(papers: List[Dict[str, Any]], output_file: str, keyword: str = None, days_back: int = 7) -> None:
     """
@@ -534,6 +517,10 @@ def main():
     filtered_categories = [cat for cat in args.categories if pre_filter_category(cat, args.keyword)]
     logger.info(f"Pre-filtered categories: {', '.join(filtered_categories)}")
     
+    # Fill in every (category, day) file first: today's listing plus an
+    # OAI-PMH harvest for earlier days, fetched concurrently
+    backfill(filtered_categories, args.days)
+    
     # Get papers for each category and date
     dates = get_date_range(args.days)
     all_papers = []
@@ -554,8 +541,6 @@ def main():
                     logger.info(f"Found {len(papers)} papers matching keyword '{args.keyword}' in {category}")
                 
                 all_papers.extend(papers)
-                # Avoid hitting arXiv rate limits
-                time.sleep(5)
             except Exception as e:
                 logger.error(f"Error downloading papers for {category} on {date_str}: {e}")
     
@@ -594,6 +579,9 @@ def main():
             else:
                 logger.warning("Detailed analysis fields missing!")
     
+    # Keep this run for the historical archive (see archive.py)
+    archive.save_analysis(design_papers, interest=args.interest or "", source="design")
+    
     # Print summary to console
     for paper in design_papers[:10]:  # Print top 10
         print_paper_summary(paper)
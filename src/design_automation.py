@@ -166,6 +166,13 @@ def get_related_design_papers(paper_id: str, papers: List[Dict[str, Any]]) -> Li
         List of related papers
     """
     target_paper = next((p for p in papers if p.get("main_page", "").endswith(paper_id)), None)
+    if not target_paper:
+        # A reference paper from an earlier listing is read from its stored file
+        # through the offset index instead of scanning every data file
+        from ledger import get_ledger
+        from page_cache import parse_arxiv_id
+        arxiv_id = parse_arxiv_id("arxiv.org/abs/" + paper_id)[0]
+        target_paper = get_ledger().load_record(arxiv_id) if arxiv_id else None
     if not target_paper:
         return []
     
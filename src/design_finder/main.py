@@ -16,7 +16,8 @@ parent_dir = os.path.dirname(os.path.dirname(current_dir))
 if parent_dir not in sys.path:
     sys.path.append(parent_dir)
 
-from src.download_new_papers import get_papers, _download_new_papers
+from src.ingest_planner import category_views
+from src.backfill import backfill, listing_dates, date_str as listing_date_str
 from src.design_automation import (
     is_design_automation_paper,
     categorize_design_paper,
@@ -56,38 +57,21 @@ def get_date_range(days_back: int = 7) -> List[str]:
     Returns:
         List of date strings in arXiv format
     """
-    today = datetime.datetime.now()
-    dates = []
-    
-    for i in range(days_back):
-        date = today - datetime.timedelta(days=i)
-        date_str = date.strftime("%a, %d %b %y")
-        dates.append(date_str)
-        
-    return dates
+    return [listing_date_str(date) for date in listing_dates(days_back)]
 
 def ensure_data_files(categories: List[str], days_back: int = 7) -> None:
     """
     Make sure data files exist for the specified categories and date range.
+    Today's listing is scraped and earlier days are harvested over OAI-PMH,
+    concurrently and under the shared arXiv rate limit.
     
     Args:
         categories: List of arXiv category codes
         days_back: Number of days to look back
     """
-    dates = get_date_range(days_back)
-    
-    for category in categories:
-        for date_str in dates:
-            # Add a delay between requests to avoid being blocked
-            time.sleep(1)
-            file_path = os.path.join(DATA_DIR, f"{category}_{date_str}.jsonl")
-            
-            if not os.path.exists(file_path):
-                logger.info(f"Downloading papers for {category} on {date_str}")
-                try:
-                    _download_new_papers(category)
-                except Exception as e:
-                    logger.error(f"Error downloading {category} papers for {date_str}: {e}")
+    stats = backfill(categories, days_back)
+    if stats["failed"]:
+        logger.error(f"Could not download {stats['failed']} (category, date) pairs")
 
 def get_design_papers(categories: List[str], days_back: int = 7) -> List[Dict[str, Any]]:
     """
@@ -107,13 +91,15 @@ def get_design_papers(categories: List[str], days_back: int = 7) -> List[Dict[st
     all_papers = []
     dates = get_date_range(days_back)
     
-    for category in categories:
-        for date_str in dates:
-            try:
-                papers = get_papers(category)
+    for date_str in dates:
+        try:
+            # Categories of one field are views of a single listing page per day;
+            # cross-listed papers are only returned for the first category
+            views = category_views(categories, date_str=date_str, dedupe=True)
+            for papers in views.values():
                 all_papers.extend(papers)
-            except Exception as e:
-                logger.warning(f"Could not get papers for {category} on {date_str}: {e}")
+        except Exception as e:
+            logger.warning(f"Could not get papers for {date_str}: {e}")
     
     # Remove duplicates (papers can appear in multiple categories)
     unique_papers = {}
@@ -310,7 +296,8 @@ def main():
     # Save to JSON file in data directory
     output_path = os.path.join(DATA_DIR, args.output)
     with open(output_path, "w") as f:
-        json.dump(design_papers, f, indent=2)
+        # Papers from category_views are Paper records; write them as plain objects
+        json.dump(design_papers, f, indent=2, default=dict)
     
     logger.info(f"Saved {len(design_papers)} papers to {output_path}")
     
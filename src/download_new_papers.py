@@ -1,123 +1,453 @@
 # encoding: utf-8
 import os
-import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from urllib.error import HTTPError
+from urllib.parse import urlparse
 
 import tqdm
 from bs4 import BeautifulSoup as bs
-import urllib.request
-import json
 import datetime
 import pytz
 
 # Import standardized paths
 from paths import DATA_DIR
+import http_client
+import jsonl_store
+import listing_parser
+import page_cache
+import paper_store
+import pdf_extractor
+from paper import ANALYSIS_FIELDS, PROVIDER_KEYS, Paper
+import rate_limit
+import search_index
+from section_extractor import EXTRACT_CHAR_BUDGET, extract_sections, fit_sections, render_sections
+from ledger import get_ledger
 
-#Linh - add new def crawl_html_version(html_link) here
-def crawl_html_version(html_link):
-    main_content = []
+# Full-text crawl concurrency. arXiv asks crawlers to stay polite, so the
+# shared per-host rate limit (rate_limit.HostLimiter) applies on top of the worker count.
+CRAWL_MAX_WORKERS = int(os.environ.get("ARXIV_CRAWL_WORKERS", 8))
+CRAWL_MAX_PER_HOST_RPS = rate_limit.DEFAULT_RATE
+
+# "lazy" stores listing metadata only and crawls full text on first demand via
+# get_paper_content; "eager" crawls every paper's full text at ingest time.
+CONTENT_MODE = os.environ.get("ARXIV_CONTENT_MODE", "lazy")
+
+ARXIV_HTML_BASE = "https://arxiv.org/html/"
+
+# Extract text from the PDF when a paper has no HTML rendering (needs pypdf)
+PDF_FALLBACK = os.environ.get("ARXIV_PDF_FALLBACK", "1") != "0"
+
+
+def crawl_html_sections(html_link, budget=EXTRACT_CHAR_BUDGET):
+    """
+    Crawl the HTML version of a paper into a budget-bounded {section: text} dict.
+
+    Returns:
+        The sections dict, or an error string if the page can't be fetched or
+        has no LaTeXML content
+    """
     try:
-        # Add user-agent header to appear more like a browser
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/121.0.0.0 Safari/537.36'
-        }
-        req = urllib.request.Request(html_link, headers=headers)
-        html = urllib.request.urlopen(req)
+        # Served from the on-disk page cache when this version was fetched before
+        html = page_cache.get_page(html_link)
     except HTTPError as e:
         return f"Error accessing HTML: {str(e)}"
-    
-    soup = bs(html, features="html.parser")
-    content = soup.find('div', attrs={'class': 'ltx_page_content'})
-    if not content:
+
+    sections = extract_sections(html, budget=budget)
+    if not sections:
         return "Content not available in HTML format"
-    para_list = content.find_all("div", attrs={'class': 'ltx_para'})
+    return sections
 
-    for each in para_list:
-        main_content.append(each.text.strip())
-    return ' '.join(main_content)[:10000]
-    #if len(main_content >)
-    #return ''.join(main_content) if len(main_content) < 20000 else ''.join(main_content[:20000])
+
+def crawl_paper_content(html_link, budget=EXTRACT_CHAR_BUDGET):
+    """
+    Crawl a paper's full text: the HTML sections, or the PDF text when there is
+    no usable HTML rendering.
+
+    Returns:
+        A {section: text} dict from HTML, plain PDF text, or an error string
+    """
+    sections = crawl_html_sections(html_link, budget=budget)
+    if not isinstance(sections, str) or not PDF_FALLBACK:
+        return sections
+    arxiv_id, version = page_cache.parse_arxiv_id(html_link)
+    if arxiv_id is None:
+        return sections
+    text = pdf_extractor.crawl_pdf_text(pdf_extractor.pdf_link(arxiv_id, version), budget=budget)
+    if text.startswith(_CONTENT_ERROR_PREFIXES):
+        # Report the HTML failure; the PDF was only a fallback
+        return sections
+    return text
+
+
+#Linh - add new def crawl_html_version(html_link) here
+def crawl_html_version(html_link):
+    sections = crawl_html_sections(html_link)
+    if isinstance(sections, str):
+        return sections
+    return render_sections(sections)
 
 #Linh - add because cs sub does not have abstract displayed, will revert if it comes back
 def crawl_abstract(html_link):
     main_content = []
     try:
-        html = urllib.request.urlopen(html_link)
+        html = http_client.fetch(html_link).body
     except HTTPError as e:
         return ["None"]
     soup = bs(html, features="html.parser")
     content = soup.find('blockquote', attrs={'class': 'abstract'}).text.replace("Abstract:", "").strip()
     return content
-def _download_new_papers(field_abbr):
-    NEW_SUB_URL = f'https://arxiv.org/list/{field_abbr}/new'  # https://arxiv.org/list/cs/new
-    print(NEW_SUB_URL)
-    # Add user-agent header to appear more like a browser
-    headers = {
-        'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/121.0.0.0 Safari/537.36'
-    }
-    req = urllib.request.Request(NEW_SUB_URL, headers=headers)
-    page = urllib.request.urlopen(req)
-
-    soup = bs(page, features="html.parser")
-    content = soup.body.find("div", {'id': 'content'})
-
-    # find the first h3 element in content
-    h3 = content.find("h3").text   # e.g: New submissions for Wed, 10 May 23
-    date = h3.replace("New submissions for", "").strip()
-
-    dt_list = content.dl.find_all("dt")
-    dd_list = content.dl.find_all("dd")
-    arxiv_base = "https://arxiv.org/abs/"
-    arxiv_html = "https://arxiv.org/html/"
-
-    assert len(dt_list) == len(dd_list)
-    new_paper_list = []
-    for i in tqdm.tqdm(range(len(dt_list))):
-        paper = {}
-        ahref = dt_list[i].find('a', href = re.compile(r'[/]([a-z]|[A-Z])\w+')).attrs['href']
-        paper_number = ahref.strip().replace("/abs/", "")
-
-        paper['main_page'] = arxiv_base + paper_number
-        paper['pdf'] = arxiv_base.replace('abs', 'pdf') + paper_number
-
-        paper['title'] = dd_list[i].find("div", {"class": "list-title mathjax"}).text.replace("Title:\n", "").strip()
-        paper['authors'] = dd_list[i].find("div", {"class": "list-authors"}).text \
-                            .replace("Authors:\n", "").replace("\n", "").strip()
-        paper['subjects'] = dd_list[i].find("div", {"class": "list-subjects"}).text.replace("Subjects:\n", "").strip()
-        #print(dd_list[i].find("div", {"class": "list-subjects"}).text.replace("Subjects:\n", "").strip())
-
-        #TODO: edit the abstract part - it is currently moved
-        paper['abstract'] = dd_list[i].find("p", {"class": "mathjax"}).text.replace("\n", " ").strip()
+
+
+def iter_contents(html_links, max_workers=CRAWL_MAX_WORKERS, max_per_second=CRAWL_MAX_PER_HOST_RPS):
+    """
+    Crawl the HTML version of many papers with a bounded worker pool.
+    Workers share the keep-alive connection pool in http_client.
+
+    Args:
+        html_links: List of arxiv.org/html links
+        max_workers: Maximum number of concurrent fetches
+        max_per_second: Maximum requests per second sent to a single host
+
+    Yields:
+        Contents (see crawl_paper_content) in the same order as
+        html_links, each as soon as it and every earlier link are done. A failed
+        fetch yields an error string for that paper only.
+    """
+    # Pacing and retries happen in http_client, so cached pages skip the wait
+    limiter = rate_limit.get_limiter()
+    for host in {urlparse(link).netloc for link in html_links}:
+        if limiter.host_rates.get(host, limiter.default_rate) != max_per_second:
+            limiter.configure(host, max_per_second)
+
+    def _fetch(link):
         try:
-            paper['content'] = crawl_html_version(arxiv_html + paper_number + "v1")
+            return crawl_paper_content(link)
         except Exception as e:
-            paper['content'] = f"Error fetching content: {str(e)}"
-        new_paper_list.append(paper)
+            return f"Error fetching content: {str(e)}"
 
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        yield from tqdm.tqdm(executor.map(_fetch, html_links), total=len(html_links))
 
-    # DATA_DIR is already created by paths.py
 
-    # save new_paper_list to a jsonl file, with each line as the element of a dictionary
+def fetch_contents(html_links, max_workers=CRAWL_MAX_WORKERS, max_per_second=CRAWL_MAX_PER_HOST_RPS):
+    """Like iter_contents, but returns the full list of contents."""
+    return list(iter_contents(html_links, max_workers=max_workers, max_per_second=max_per_second))
+
+
+def today_str():
+    """Today's date in arXiv's listing timezone, formatted like 'Wed, 10 May 23'."""
     date = datetime.date.fromtimestamp(datetime.datetime.now(tz=pytz.timezone("America/New_York")).timestamp())
-    date = date.strftime("%a, %d %b %y")
-    file_path = os.path.join(DATA_DIR, f"{field_abbr}_{date}.jsonl")
-    with open(file_path, "w") as f:
+    return date.strftime("%a, %d %b %y")
+
+
+def paper_file_path(field_abbr, date_str=None):
+    """
+    Path of the JSONL file holding a field's listing for a date (default: today).
+
+    This is the stored variant when one exists (compressed or plain, see
+    jsonl_store), otherwise the compressed path a new file is written to.
+    """
+    return jsonl_store.resolve(os.path.join(DATA_DIR, f"{field_abbr}_{date_str or today_str()}.jsonl"))
+
+
+def paper_id(paper):
+    """Unversioned arXiv id of a paper dict, e.g. '2404.11972', or None."""
+    return page_cache.parse_arxiv_id(paper.get('main_page', ''))[0]
+
+
+# Placeholders written in place of content when a crawl fails
+_CONTENT_ERROR_PREFIXES = ("Error accessing HTML", "Error accessing PDF", "Error fetching content",
+                           "Content not available")
+
+
+def _has_content(paper):
+    content = paper.get('content')
+    return bool(content) and not content.startswith(_CONTENT_ERROR_PREFIXES)
+
+
+def paper_html_link(paper):
+    """Return the arxiv.org/html link for a paper dict, or None if its id can't be parsed."""
+    arxiv_id, version = page_cache.parse_arxiv_id(paper.get('main_page', ''))
+    if arxiv_id is None:
+        return None
+    # Listing entries are first versions; a pinned version is served from the page cache
+    return ARXIV_HTML_BASE + arxiv_id + (version or "v1")
+
+
+def _store_content(paper, content):
+    # Crawl results are a {section: text} dict, PDF text or an error string
+    if isinstance(content, dict):
+        paper['sections'] = content
+        paper['content'] = render_sections(content)
+    else:
+        paper['content'] = content
+
+
+def _set_content(paper, content):
+    if isinstance(content, dict):
+        _store_content(paper, content)
+    elif content and len(content) > 100 and not content.startswith(_CONTENT_ERROR_PREFIXES):
+        # Plain text only comes from the PDF fallback
+        paper['content'] = content
+        paper['content_source'] = 'pdf'
+    else:
+        # If the HTML version is unavailable, fall back to the abstract
+        paper['content'] = f"{paper.get('abstract', '')} {paper.get('title', '')}"
+        paper['content_source'] = 'abstract'
+    return paper['content']
+
+
+def _remember_content(paper):
+    # Keep lazily crawled text in the paper store; the abstract fallback is not
+    # stored, so a later call can still try the crawl again
+    if paper.get('content_source') != 'abstract':
+        paper_store.get_store().set_content(paper)
+
+
+def _content_excerpt(paper, budget):
+    if budget is None:
+        return paper['content']
+    if paper.get('sections'):
+        # Trim by section priority rather than keeping the first `budget` characters
+        return render_sections(fit_sections(paper['sections'], budget))
+    return paper['content'][:budget]
+
+
+def get_paper_content(paper, budget=None):
+    """
+    Shared accessor for a paper's full text.
+
+    Crawls the HTML version on first use and stores it in paper['content'] (and
+    the structured excerpt in paper['sections']), so content is fetched at most
+    once per paper. Papers without an HTML rendering use their PDF text, and
+    the abstract is the last resort.
+
+    Args:
+        paper: Paper dict
+        budget: Maximum characters to return, filled from the most useful
+            sections first (default: everything stored)
+    """
+    if not _has_content(paper):
+        html_link = paper_html_link(paper)
+        if html_link is None:
+            _set_content(paper, None)
+        else:
+            try:
+                content = crawl_paper_content(html_link)
+            except Exception as e:
+                content = f"Error fetching content: {str(e)}"
+            _set_content(paper, content)
+            _remember_content(paper)
+    return _content_excerpt(paper, budget)
+
+
+def ensure_contents(papers, max_workers=CRAWL_MAX_WORKERS, max_per_second=CRAWL_MAX_PER_HOST_RPS):
+    """
+    Fill in content for every paper that does not have it yet, fetching concurrently.
+
+    Returns:
+        The same list of papers
+    """
+    missing = [paper for paper in papers if not _has_content(paper)]
+    links = [paper_html_link(paper) for paper in missing]
+    contents = iter(fetch_contents([link for link in links if link],
+                                   max_workers=max_workers, max_per_second=max_per_second))
+    for paper, link in zip(missing, links):
+        _set_content(paper, next(contents) if link else None)
+        _remember_content(paper)
+    return papers
+
+
+class PaperStream:
+    """
+    Re-iterable view over a paper generator.
+
+    Papers are pulled from the source only when a consumer reaches them and are
+    cached, so later passes (or later pipeline stages) see the same papers
+    without re-reading or re-downloading anything. len() drains the source.
+    """
+    def __init__(self, source):
+        self._source = iter(source)
+        self._cache = []
+        self._lock = threading.Lock()
+        self._done = False
+
+    def __iter__(self):
+        index = 0
+        while True:
+            with self._lock:
+                if index < len(self._cache):
+                    paper = self._cache[index]
+                elif self._done:
+                    return
+                else:
+                    try:
+                        paper = next(self._source)
+                    except StopIteration:
+                        self._done = True
+                        return
+                    self._cache.append(paper)
+            index += 1
+            yield paper
+
+    def __len__(self):
+        return len(self.materialize())
+
+    def materialize(self):
+        """Drain the source and return every paper as a list."""
+        for _ in self:
+            pass
+        return self._cache
+
+
+def listing_url(field_abbr):
+    return f'https://arxiv.org/list/{field_abbr}/new'  # https://arxiv.org/list/cs/new
+
+
+def _iter_new_papers(field_abbr, max_workers=CRAWL_MAX_WORKERS, max_per_second=CRAWL_MAX_PER_HOST_RPS,
+                     content_mode=CONTENT_MODE, page=None, date_str=None, annotate=None):
+    """
+    Download today's listing for a field, yielding papers as they become ready.
+
+    In eager mode a paper is yielded once its full text is crawled, so consumers
+    can start on early papers while later ones are still downloading. The JSONL
+    file is written and recorded in the ledger after the last paper; a consumer
+    that stops early leaves no file behind. Consumers get a copy of each
+    paper, so per-query fields they add (relevancy scores, analyses) never
+    reach the stored listing.
+
+    Args:
+        page: Listing page bytes already fetched by the caller
+        date_str: Day to file the listing under (default: today)
+        annotate: Called with each paper (content included in eager mode)
+            before it is yielded; fields it sets are stored with the listing
+    """
+    if page is None:
+        NEW_SUB_URL = listing_url(field_abbr)
+        print(NEW_SUB_URL)
+        page = http_client.fetch(NEW_SUB_URL).body
+
+    # Listing parsing goes through listing_parser (lxml by default), which
+    # returns the same paper dicts the old full html.parser tree produced
+    date, parsed_papers = listing_parser.parse_listing(page)
+
+    ledger = get_ledger()
+    reused = 0
+    new_paper_list = []
+    html_links = []
+    for paper in parsed_papers:
+        paper_number = paper["main_page"].replace(listing_parser.ARXIV_ABS_BASE, "")
+
+        # Papers already ingested (cross-lists, earlier days) reuse their stored
+        # record, including any content crawled for it, instead of being crawled again
+        stored = ledger.load_record(paper_id(paper))
+        if stored is not None:
+            # Analysis fields stored by older versions are per query, not listing data
+            stored = {key: value for key, value in stored.items()
+                      if key not in ANALYSIS_FIELDS and key not in PROVIDER_KEYS}
+            paper = {**stored, **paper}
+            reused += 1
+        new_paper_list.append(Paper.from_dict(paper))
+        html_links.append(ARXIV_HTML_BASE + paper_number + "v1")
+    print(f"Reused {reused} previously ingested papers, {len(new_paper_list) - reused} new")
+
+    if content_mode == "eager":
+        # Fetch full text concurrently, only for papers without stored content;
+        # results come back in listing order
+        to_fetch = [i for i, paper in enumerate(new_paper_list) if not _has_content(paper)]
+        contents = iter_contents([html_links[i] for i in to_fetch], max_workers=max_workers, max_per_second=max_per_second)
+        fetch_set = set(to_fetch)
+        for i, paper in enumerate(new_paper_list):
+            if i in fetch_set:
+                _store_content(paper, next(contents))
+            if annotate is not None:
+                annotate(paper)
+            yield Paper.from_dict(paper.to_dict())
+    else:
         for paper in new_paper_list:
-            f.write(json.dumps(paper) + "\n")
+            if annotate is not None:
+                annotate(paper)
+            yield Paper.from_dict(paper.to_dict())
 
+    # DATA_DIR is already created by paths.py
 
-def get_papers(field_abbr, limit=None):
-    date = datetime.date.fromtimestamp(datetime.datetime.now(tz=pytz.timezone("America/New_York")).timestamp())
-    date = date.strftime("%a, %d %b %y")
-    file_path = os.path.join(DATA_DIR, f"{field_abbr}_{date}.jsonl")
-    if not os.path.exists(file_path):
-        _download_new_papers(field_abbr)
-    results = []
-    with open(file_path, "r") as f:
-        for i, line in enumerate(f.readlines()):
-            if limit and i == limit:
-                return results
-            results.append(json.loads(line))
-    return results
+    # save new_paper_list to a jsonl file, with each line as the element of a dictionary
+    # The sidecar offset index lets single papers be read back without a scan
+    file_path = jsonl_store.write_jsonl(paper_file_path(field_abbr, date_str), new_paper_list, key=paper_id)
+    ledger.record_file(file_path, new_paper_list)
+    paper_store.get_store().add_listing(field_abbr, date_str or today_str(), new_paper_list)
+    # The store's triggers index the new day; this also catches up older stores
+    search_index.get_index().sync()
+
+
+def _download_new_papers(field_abbr, max_workers=CRAWL_MAX_WORKERS, max_per_second=CRAWL_MAX_PER_HOST_RPS,
+                         content_mode=CONTENT_MODE):
+    for _ in _iter_new_papers(field_abbr, max_workers=max_workers, max_per_second=max_per_second,
+                              content_mode=content_mode):
+        pass
+
+
+def _iter_papers(field_abbr, limit=None, seen=None, date_str=None):
+    file_path = paper_file_path(field_abbr, date_str)
+    store = paper_store.get_store()
+    if store.has_listing(field_abbr, date_str or today_str()):
+        # Indexed listings come from SQLite; full text stays in the store until
+        # a Paper's content is first read, including content crawled lazily since
+        records = store.iter_listing(field_abbr, date_str or today_str(), with_content=False)
+        source, downloading = map(Paper.from_dict, records), False
+    elif os.path.exists(file_path):
+        # Decoded line by line, so a limit stops reading the file early
+        source, downloading = map(Paper.from_dict, jsonl_store.iter_jsonl(file_path)), False
+    elif store.view_source(field_abbr, date_str or today_str()) is not None:
+        # A subcategory of a field whose listing page was already fetched that
+        # day is a view of that listing (see ingest_planner)
+        field = paper_store.field_of(field_abbr)
+        records = store.iter_category(field_abbr, field, date_str or today_str(), with_content=False)
+        source, downloading = map(Paper.from_dict, records), False
+    elif date_str is not None and date_str != today_str():
+        # The /new listing only has today's papers; past days come from backfill.py
+        source, downloading = iter(()), False
+    else:
+        source, downloading = _iter_new_papers(field_abbr), True
+
+    count = 0
+    for paper in source:
+        if limit and count == limit:
+            if not downloading:
+                return
+            # Keep draining a download so its file still gets written
+            continue
+        if seen is not None and paper.id is not None:
+            if paper.id in seen:
+                continue
+            seen.add(paper.id)
+        count += 1
+        yield paper
+
+
+def get_papers(field_abbr, limit=None, seen=None, stream=False, date_str=None):
+    """
+    Load a day's papers for a field, downloading today's listing if needed.
+
+    Papers are paper.Paper records, which read and write like dicts and load
+    their full text from the paper store only when it is first used.
+
+    Args:
+        field_abbr: arXiv field or category, e.g. "cs" or "cs.CV"
+        limit: Maximum number of papers to return
+        seen: Set of arXiv ids already returned in this run. Papers in it are
+            skipped and returned papers are added to it, so a multi-category
+            caller passing one set gets each cross-listed paper once.
+        stream: Return a PaperStream that yields papers as they are parsed or
+            fetched instead of a list, so downstream stages can start before
+            ingestion finishes.
+        date_str: Listing day, e.g. "Wed, 10 May 23" (default: today). Past
+            days are only read from disk; fill them in with backfill.backfill.
+    """
+    papers = _iter_papers(field_abbr, limit=limit, seen=seen, date_str=date_str)
+    if stream:
+        return PaperStream(papers)
+    return list(papers)
 
 #crawl_html_version("https://arxiv.org/html/2404.11972v1")
@@ -5,12 +5,17 @@ This module provides functions to work with Google's Gemini API for paper analys
 import os
 import json
 import logging
+import re
 import time
+from concurrent.futures import ThreadPoolExecutor
 from typing import List, Dict, Any, Optional
 
+import rate_limit
+import utils
+
 try:
     import google.generativeai as genai
-    from google.api_core.exceptions import GoogleAPIError
+    from google.api_core.exceptions import GoogleAPIError, ResourceExhausted, ServiceUnavailable
     GEMINI_AVAILABLE = True
 except ImportError:
     GEMINI_AVAILABLE = False
@@ -19,6 +24,17 @@ except ImportError:
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Papers analyzed at once, and the project quota every Gemini call in the
+# process shares (requests and tokens per minute; set them to your tier's limits)
+GEMINI_MAX_CONCURRENCY = int(os.environ.get("GEMINI_MAX_CONCURRENCY", 8))
+GEMINI_RPM = float(os.environ.get("GEMINI_RPM", 60))
+GEMINI_TPM = float(os.environ.get("GEMINI_TPM", 1000000))
+# Retries of a paper after a quota (429) or overload (503) error
+GEMINI_MAX_RETRIES = int(os.environ.get("GEMINI_MAX_RETRIES", 4))
+
+_gemini_limiter = rate_limit.ModelRateLimiter(GEMINI_RPM, GEMINI_TPM)
+
+
 class GeminiConfig:
     """Configuration for Gemini API calls."""
     def __init__(
@@ -81,23 +97,156 @@ def get_gemini_model(model_name: str = "gemini-1.5-flash"):
         logger.error(f"Failed to get Gemini model: {e}")
         return None
 
+_RETRY_IN = re.compile(r"retry in ([\d.]+)\s*s", re.IGNORECASE)
+
+def _retry_delay(error) -> Optional[float]:
+    """Seconds the server asked us to wait, from the error's RetryInfo, Retry-After or message."""
+    for detail in getattr(error, "details", None) or []:
+        retry_delay = getattr(detail, "retry_delay", None)
+        if retry_delay is not None:
+            return retry_delay.seconds + retry_delay.nanos / 1e9
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    seconds = rate_limit.retry_after_seconds(headers.get("retry-after"))
+    if seconds is not None:
+        return seconds
+    match = _RETRY_IN.search(str(error))
+    return float(match.group(1)) if match else None
+
+def _generate_with_quota(model, prompt: str, generation_config: Dict[str, Any]):
+    """generate_content paced by the shared quota, retrying quota and overload errors."""
+    # Gemini counts prompt and response tokens; the response is booked at its
+    # maximum and the unused part returned once usage is known
+    prompt_tokens = utils.count_tokens(prompt)
+    output_tokens = generation_config["max_output_tokens"]
+    for attempt in range(GEMINI_MAX_RETRIES + 1):
+        _gemini_limiter.acquire(prompt_tokens, output_tokens=output_tokens)
+        try:
+            response = model.generate_content(prompt, generation_config=generation_config)
+        except (ResourceExhausted, ServiceUnavailable) as e:
+            # A rejected request used none of its reservation
+            _gemini_limiter.refund(prompt_tokens, output_tokens=output_tokens)
+            if attempt == GEMINI_MAX_RETRIES:
+                raise
+            retry_delay = _retry_delay(e)
+            delay = rate_limit.backoff_delay(attempt, retry_delay)
+            if retry_delay is not None:
+                # The quota is per project, so every worker waits
+                _gemini_limiter.pause(delay)
+            logger.warning(f"Gemini quota or overload error ({e}); retrying in {delay:.1f}s")
+            time.sleep(delay)
+            continue
+        usage = getattr(response, "usage_metadata", None)
+        if usage is not None:
+            _gemini_limiter.refund(max(0, prompt_tokens - (usage.prompt_token_count or 0)),
+                                   output_tokens=max(0, output_tokens - (usage.candidates_token_count or 0)))
+        return response
+
+def _analyze_paper(model, paper, query: Dict[str, str], config: GeminiConfig, cache, cache_key: Optional[str]):
+    """Analyze one paper, recording any error on the paper instead of raising."""
+    from download_new_papers import get_paper_content
+    try:
+        # Prepare prompt
+        prompt = f"""
+        You are a research assistant analyzing academic papers in AI and ML.
+        
+        Analyze this paper and provide insights based on the user's research interests.
+        
+        Research interests: {query['interest']}
+        
+        Paper details:
+        Title: {paper['title']}
+        Authors: {paper['authors']}
+        Abstract: {paper['abstract']}
+        Content: {get_paper_content(paper, budget=5000)}
+        
+        Please provide your response as a single JSON object with the following structure:
+        {{
+          "Relevancy score": 1-10 (higher = more relevant),
+          "Reasons for match": "Detailed explanation of why this paper matches the interests",
+          "Key innovations": "List the main contributions of the paper",
+          "Critical analysis": "Evaluate strengths and weaknesses",
+          "Goal": "What problem does the paper address?",
+          "Data": "Description of datasets used",
+          "Methodology": "Technical approach and methods",
+          "Implementation details": "Model architecture, hyperparameters, etc.",
+          "Experiments & Results": "Key findings and comparisons",
+          "Discussion & Next steps": "Limitations and future work",
+          "Related work": "Connection to similar research",
+          "Practical applications": "Real-world uses of this research",
+          "Key takeaways": ["Point 1", "Point 2", "Point 3"]
+        }}
+        
+        Format your response as a valid JSON object and nothing else.
+        """
+        
+        # Just log that we're sending a prompt to Gemini
+        print(f"Sending prompt to Gemini for paper: {paper['title'][:50]}...")
+        
+        generation_config = {
+            "temperature": config.temperature,
+            "top_p": config.top_p,
+            "top_k": config.top_k,
+            "max_output_tokens": config.max_output_tokens,
+        }
+        
+        response = _generate_with_quota(model, prompt, generation_config)
+        
+        # Extract and parse the response
+        response_text = response.text
+        
+        # Try to extract JSON
+        try:
+            start_idx = response_text.find('{')
+            end_idx = response_text.rfind('}') + 1
+            if start_idx >= 0 and end_idx > start_idx:
+                json_str = response_text[start_idx:end_idx]
+                gemini_analysis = json.loads(json_str)
+                
+                # Add Gemini analysis to paper; Paper keeps one copy of the
+                # fields, readable both directly and via paper['gemini_analysis']
+                paper['gemini_analysis'] = gemini_analysis
+                cache.put(cache_key, gemini_analysis)
+            else:
+                logger.warning(f"Could not extract JSON from Gemini response for paper {paper['title']}")
+                paper['gemini_analysis'] = {"error": "Failed to parse response"}
+        except json.JSONDecodeError:
+            logger.warning(f"Failed to parse Gemini response as JSON for paper {paper['title']}")
+            paper['gemini_analysis'] = {"error": "Failed to parse response"}
+        
+    except GoogleAPIError as e:
+        logger.error(f"Gemini API error: {e}")
+        paper['gemini_analysis'] = {"error": f"Gemini API error: {str(e)}"}
+        
+    except Exception as e:
+        logger.error(f"Error analyzing paper with Gemini: {e}")
+        paper['gemini_analysis'] = {"error": f"Error: {str(e)}"}
+    
+    return paper
+
 def analyze_papers_with_gemini(
     papers: List[Dict[str, Any]], 
     query: Dict[str, str],
     config: Optional[GeminiConfig] = None,
-    model_name: str = "gemini-1.5-flash"
+    model_name: str = "gemini-1.5-flash",
+    max_concurrency: Optional[int] = None
 ) -> List[Dict[str, Any]]:
     """
     Analyze papers using the Gemini model.
     
+    Papers are analyzed concurrently, each request paced by the shared
+    GEMINI_RPM/GEMINI_TPM quota. A failed paper gets an 'error' analysis and
+    does not affect the others.
+    
     Args:
         papers: List of paper dictionaries
         query: Dictionary with 'interest' key describing research interests
         config: GeminiConfig object
         model_name: Name of the Gemini model to use
+        max_concurrency: Papers in flight at once (default GEMINI_MAX_CONCURRENCY, 1 for sequential)
         
     Returns:
-        List of papers with added analysis
+        List of papers with added analysis, in input order
     """
     if not GEMINI_AVAILABLE:
         logger.error("Gemini package not installed. Cannot analyze papers.")
@@ -110,97 +259,30 @@ def analyze_papers_with_gemini(
     if not model:
         return papers
         
+    from paper import Paper
+    import llm_cache
     analyzed_papers = []
+    to_analyze = []
+    # The prompt is written inline in this file, so the file is its template
+    cache = llm_cache.get_cache()
+    prompt_hash = llm_cache.file_hash(__file__)
     
     for paper in papers:
-        try:
-            # Prepare prompt
-            prompt = f"""
-            You are a research assistant analyzing academic papers in AI and ML.
-            
-            Analyze this paper and provide insights based on the user's research interests.
-            
-            Research interests: {query['interest']}
-            
-            Paper details:
-            Title: {paper['title']}
-            Authors: {paper['authors']}
-            Abstract: {paper['abstract']}
-            Content: {paper['content'][:5000]}
-            
-            Please provide your response as a single JSON object with the following structure:
-            {{
-              "Relevancy score": 1-10 (higher = more relevant),
-              "Reasons for match": "Detailed explanation of why this paper matches the interests",
-              "Key innovations": "List the main contributions of the paper",
-              "Critical analysis": "Evaluate strengths and weaknesses",
-              "Goal": "What problem does the paper address?",
-              "Data": "Description of datasets used",
-              "Methodology": "Technical approach and methods",
-              "Implementation details": "Model architecture, hyperparameters, etc.",
-              "Experiments & Results": "Key findings and comparisons",
-              "Discussion & Next steps": "Limitations and future work",
-              "Related work": "Connection to similar research",
-              "Practical applications": "Real-world uses of this research",
-              "Key takeaways": ["Point 1", "Point 2", "Point 3"]
-            }}
-            
-            Format your response as a valid JSON object and nothing else.
-            """
-            
-            # Just log that we're sending a prompt to Gemini
-            print(f"Sending prompt to Gemini for paper: {paper['title'][:50]}...")
-            
-            generation_config = {
-                "temperature": config.temperature,
-                "top_p": config.top_p,
-                "top_k": config.top_k,
-                "max_output_tokens": config.max_output_tokens,
-            }
-            
-            response = model.generate_content(
-                prompt,
-                generation_config=generation_config
-            )
-            
-            # Extract and parse the response
-            response_text = response.text
-            
-            # Try to extract JSON
-            try:
-                start_idx = response_text.find('{')
-                end_idx = response_text.rfind('}') + 1
-                if start_idx >= 0 and end_idx > start_idx:
-                    json_str = response_text[start_idx:end_idx]
-                    gemini_analysis = json.loads(json_str)
-                    
-                    # Add Gemini analysis to paper
-                    paper['gemini_analysis'] = gemini_analysis
-                    
-                    # Directly copy fields to paper
-                    for key, value in gemini_analysis.items():
-                        paper[key] = value
-                else:
-                    logger.warning(f"Could not extract JSON from Gemini response for paper {paper['title']}")
-                    paper['gemini_analysis'] = {"error": "Failed to parse response"}
-            except json.JSONDecodeError:
-                logger.warning(f"Failed to parse Gemini response as JSON for paper {paper['title']}")
-                paper['gemini_analysis'] = {"error": "Failed to parse response"}
-                
-            analyzed_papers.append(paper)
-            
-            # Avoid rate limiting
-            time.sleep(1)
-            
-        except GoogleAPIError as e:
-            logger.error(f"Gemini API error: {e}")
-            paper['gemini_analysis'] = {"error": f"Gemini API error: {str(e)}"}
-            analyzed_papers.append(paper)
-            
-        except Exception as e:
-            logger.error(f"Error analyzing paper with Gemini: {e}")
-            paper['gemini_analysis'] = {"error": f"Error: {str(e)}"}
-            analyzed_papers.append(paper)
+        paper = Paper.from_dict(paper)
+        analyzed_papers.append(paper)
+        cache_key = llm_cache.result_key(paper, query, model_name, "gemini", prompt_hash)
+        cached = cache.get(cache_key)
+        if cached is not None:
+            paper['gemini_analysis'] = cached
+        else:
+            to_analyze.append((paper, cache_key))
+    
+    if to_analyze:
+        max_workers = max(1, min(max_concurrency or GEMINI_MAX_CONCURRENCY, len(to_analyze)))
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            # Papers are updated in place, so analyzed_papers keeps the input order
+            list(executor.map(lambda item: _analyze_paper(model, item[0], query, config, cache, item[1]),
+                              to_analyze))
             
     return analyzed_papers
 
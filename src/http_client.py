@@ -0,0 +1,256 @@
+"""
+Shared HTTP layer for arXiv I/O.
+This module provides one asyncio client with a pooled keep-alive connection pool,
+plus a sync facade so existing callers can keep making blocking calls. Pacing,
+retries and backoff are shared across all callers via rate_limit.
+"""
+import asyncio
+import atexit
+import logging
+import os
+import threading
+import urllib.request
+from email.message import Message
+from typing import Dict, List, Optional, Union
+from urllib.error import HTTPError, URLError
+from urllib.parse import urlparse
+
+import rate_limit
+
+try:
+    import aiohttp
+    AIOHTTP_AVAILABLE = True
+except ImportError:
+    AIOHTTP_AVAILABLE = False
+
+# Transport failures worth retrying; HTTP error statuses are handled separately
+_NETWORK_ERRORS = (URLError, ConnectionError, asyncio.TimeoutError, TimeoutError)
+if AIOHTTP_AVAILABLE:
+    _NETWORK_ERRORS += (aiohttp.ClientConnectionError, aiohttp.ClientPayloadError)
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_USER_AGENT = os.environ.get(
+    "ARXIV_USER_AGENT",
+    'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/121.0.0.0 Safari/537.36'
+)
+DEFAULT_TIMEOUT = float(os.environ.get("ARXIV_HTTP_TIMEOUT", 30))
+DEFAULT_POOL_SIZE = int(os.environ.get("ARXIV_HTTP_POOL_SIZE", 16))
+DEFAULT_KEEPALIVE = float(os.environ.get("ARXIV_HTTP_KEEPALIVE", 30))
+# Longest a request waits for an open circuit breaker before raising (0 = fail fast)
+DEFAULT_BREAKER_WAIT = float(os.environ.get("ARXIV_BREAKER_WAIT", 0))
+
+
+class HttpResponse:
+    """A fully read HTTP response."""
+    def __init__(self, url: str, status: int, headers: Dict[str, str], body: bytes):
+        self.url = url
+        self.status = status
+        # Header names are lower-cased so lookups are case-insensitive
+        self.headers = {key.lower(): value for key, value in headers.items()}
+        self.body = body
+
+    def text(self, encoding: str = "utf-8") -> str:
+        return self.body.decode(encoding, errors="replace")
+
+
+def _http_error(url: str, status: int, reason: str, headers: Dict[str, str]) -> HTTPError:
+    # Raise urllib's HTTPError so existing `except HTTPError` handlers keep working
+    hdrs = Message()
+    for key, value in headers.items():
+        hdrs[key] = value
+    return HTTPError(url, status, reason, hdrs, None)
+
+
+class AsyncHttpClient:
+    """
+    Asyncio HTTP client with a shared keep-alive connection pool.
+
+    Uses aiohttp when it is installed. Without it, requests fall back to urllib
+    in worker threads, which works but does not reuse connections.
+    """
+    def __init__(
+        self,
+        user_agent: str = DEFAULT_USER_AGENT,
+        timeout: float = DEFAULT_TIMEOUT,
+        pool_size: int = DEFAULT_POOL_SIZE,
+        keepalive_timeout: float = DEFAULT_KEEPALIVE,
+        max_retries: int = rate_limit.MAX_RETRIES
+    ):
+        self.user_agent = user_agent
+        self.timeout = timeout
+        self.pool_size = pool_size
+        self.keepalive_timeout = keepalive_timeout
+        self.max_retries = max_retries
+        self._session = None
+
+    async def _get_session(self):
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.pool_size,
+                limit_per_host=self.pool_size,
+                keepalive_timeout=self.keepalive_timeout
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+                headers={"User-Agent": self.user_agent}
+            )
+        return self._session
+
+    async def get(self, url: str, headers: Optional[Dict[str, str]] = None, allow_status=(),
+                  breaker_wait: float = DEFAULT_BREAKER_WAIT) -> HttpResponse:
+        """
+        GET a URL and read the whole body.
+
+        Requests are paced by the shared rate_limit.HostLimiter. Throttling
+        responses (429/503 and other 5xx) and connection errors are retried
+        with backoff, honouring Retry-After. A request that still fails after
+        its retries counts once towards the host's circuit breaker.
+
+        Args:
+            url: URL to fetch
+            headers: Extra request headers
+            allow_status: Status codes >= 400 to return instead of raising
+            breaker_wait: Seconds to wait for an open circuit breaker to let
+                requests through again before raising
+
+        Returns:
+            HttpResponse
+
+        Raises:
+            urllib.error.HTTPError for error statuses not in allow_status
+            rate_limit.CircuitOpenError if the host keeps failing
+        """
+        host = urlparse(url).netloc
+        limiter = rate_limit.get_limiter()
+        attempt = 0
+        waited = 0.0
+        while True:
+            try:
+                # Only the first attempt asks the breaker; retries belong to a request it let through
+                delay = limiter.reserve(host, check_breaker=attempt == 0)
+            except rate_limit.CircuitOpenError as e:
+                if waited + e.retry_in > breaker_wait:
+                    raise
+                await asyncio.sleep(e.retry_in)
+                waited += e.retry_in
+                continue
+            if delay > 0:
+                await asyncio.sleep(delay)
+            try:
+                response, reason = await self._request(url, headers)
+            except _NETWORK_ERRORS as e:
+                if attempt >= self.max_retries:
+                    limiter.record_request_failure(host)
+                    raise
+                backoff = limiter.record_failure(host, attempt)
+                logger.info(f"Request to {url} failed ({e!r}), retrying in {backoff:.1f}s")
+            else:
+                if response.status not in rate_limit.RETRY_STATUSES or response.status in allow_status:
+                    limiter.record_success(host)
+                    break
+                backoff = limiter.record_failure(host, attempt, response.headers.get("retry-after"))
+                if attempt >= self.max_retries:
+                    limiter.record_request_failure(host)
+                    break
+                logger.info(f"{url} returned {response.status}, retrying in {backoff:.1f}s")
+            await asyncio.sleep(backoff)
+            attempt += 1
+
+        if response.status >= 400 and response.status not in allow_status:
+            raise _http_error(url, response.status, reason, response.headers)
+        return response
+
+    async def _request(self, url: str, headers: Optional[Dict[str, str]]):
+        if AIOHTTP_AVAILABLE:
+            session = await self._get_session()
+            async with session.get(url, headers=headers) as resp:
+                body = await resp.read()
+                return HttpResponse(str(resp.url), resp.status, dict(resp.headers), body), resp.reason or ""
+        return await asyncio.to_thread(self._urllib_get, url, headers)
+
+    def _urllib_get(self, url: str, headers: Optional[Dict[str, str]]):
+        request_headers = {"User-Agent": self.user_agent}
+        request_headers.update(headers or {})
+        req = urllib.request.Request(url, headers=request_headers)
+        try:
+            with urllib.request.urlopen(req, timeout=self.timeout) as resp:
+                return HttpResponse(resp.geturl(), resp.status, dict(resp.headers), resp.read()), resp.reason
+        except HTTPError as e:
+            return HttpResponse(url, e.code, dict(e.headers or {}), b""), e.reason
+
+    async def get_many(
+        self,
+        urls: List[str],
+        concurrency: int = DEFAULT_POOL_SIZE,
+        headers: Optional[Dict[str, str]] = None
+    ) -> List[Union[HttpResponse, Exception]]:
+        """
+        GET many URLs concurrently.
+
+        Returns:
+            Responses in the same order as urls. A failed request yields its
+            exception in place of the response.
+        """
+        semaphore = asyncio.Semaphore(max(1, concurrency))
+
+        async def _one(url):
+            async with semaphore:
+                return await self.get(url, headers=headers)
+
+        return await asyncio.gather(*[_one(url) for url in urls], return_exceptions=True)
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+
+
+class _LoopThread:
+    """Background event loop that owns the shared client for sync callers."""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._loop = None
+        self._client = None
+
+    def _start(self):
+        self._loop = asyncio.new_event_loop()
+        self._client = AsyncHttpClient()
+        thread = threading.Thread(target=self._loop.run_forever, name="arxiv-http", daemon=True)
+        thread.start()
+        atexit.register(self.shutdown)
+
+    def run(self, coro_fn, *args, **kwargs):
+        with self._lock:
+            if self._loop is None:
+                self._start()
+        future = asyncio.run_coroutine_threadsafe(coro_fn(self._client, *args, **kwargs), self._loop)
+        return future.result()
+
+    def shutdown(self):
+        if self._loop is None:
+            return
+        try:
+            asyncio.run_coroutine_threadsafe(self._client.close(), self._loop).result(timeout=5)
+        except Exception as e:
+            logger.debug(f"Error closing HTTP client: {e}")
+        self._loop.call_soon_threadsafe(self._loop.stop)
+
+
+_shared = _LoopThread()
+
+
+def fetch(url: str, headers: Optional[Dict[str, str]] = None, allow_status=(),
+          breaker_wait: float = DEFAULT_BREAKER_WAIT) -> HttpResponse:
+    """Blocking GET through the shared connection pool. Safe to call from any thread."""
+    return _shared.run(AsyncHttpClient.get, url, headers=headers, allow_status=allow_status,
+                       breaker_wait=breaker_wait)
+
+
+def fetch_many(
+    urls: List[str],
+    concurrency: int = DEFAULT_POOL_SIZE,
+    headers: Optional[Dict[str, str]] = None
+) -> List[Union[HttpResponse, Exception]]:
+    """Blocking concurrent GET of many URLs, returned in input order."""
+    return _shared.run(AsyncHttpClient.get_many, urls, concurrency=concurrency, headers=headers)
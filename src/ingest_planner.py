@@ -0,0 +1,83 @@
+"""
+Plans which arXiv /new listing pages to fetch for a set of categories.
+
+A field's listing (/list/cs/new) contains every paper of its subcategories,
+cross-lists included, so scraping /list/cs.CV/new, /list/cs.GR/new and
+/list/cs.HC/new separately downloads the same papers several times. The
+planner picks the fewest pages covering the requested categories: a field page
+when two or more of its categories are needed, a single category's own page
+when that is the only one. Each page is fetched once per day; categories are
+then read as views of the stored field listing (paper_store.iter_category).
+"""
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+import paper_store
+from download_new_papers import _download_new_papers, get_papers, today_str
+
+
+def plan_listings(categories: List[str], date_str: Optional[str] = None) -> Dict[str, List[str]]:
+    """
+    Listing pages still to fetch for a day.
+
+    Args:
+        categories: Fields or categories, e.g. ["cs.CV", "cs.GR", "math"]
+        date_str: Listing day (default: today)
+
+    Returns:
+        {page: categories it covers}, e.g. {"cs": ["cs.CV", "cs.GR"]}. Categories
+        already stored, directly or as a view of their field, need no page.
+    """
+    date_str = date_str or today_str()
+    store = paper_store.get_store()
+    by_field = {}
+    for category in dict.fromkeys(categories):
+        if store.view_source(category, date_str) is None:
+            by_field.setdefault(paper_store.field_of(category), []).append(category)
+
+    plan = {}
+    for field, field_categories in by_field.items():
+        if len(field_categories) == 1:
+            plan[field_categories[0]] = field_categories
+        else:
+            plan[field] = field_categories
+    return plan
+
+
+def fetch_listings(categories: List[str], max_workers: int = 4) -> Dict[str, List[str]]:
+    """
+    Fetch today's planned listing pages, one download per page.
+
+    Returns:
+        The plan that was fetched ({page: categories})
+    """
+    plan = plan_listings(categories)
+    if plan:
+        print(f"Fetching {len(plan)} listing page(s) for {len(categories)} categories: {', '.join(plan)}")
+        with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+            list(executor.map(_download_new_papers, plan))
+    return plan
+
+
+def category_views(categories: List[str], date_str: Optional[str] = None,
+                   dedupe: bool = False) -> Dict[str, list]:
+    """
+    Papers per category for a day, fetching today's missing pages first.
+
+    Args:
+        categories: Fields or categories
+        date_str: Listing day (default: today); past days must already be
+            stored (see backfill.backfill)
+        dedupe: Return each paper only for the first requested category that
+            lists it, so cross-lists are not returned twice
+
+    Returns:
+        {category: papers}
+    """
+    if date_str is None or date_str == today_str():
+        fetch_listings(categories)
+    views = {}
+    seen = set() if dedupe else None
+    for category in dict.fromkeys(categories):
+        views[category] = get_papers(category, date_str=date_str, seen=seen)
+    return views
@@ -0,0 +1,379 @@
+"""
+Compressed JSONL storage for the paper files in DATA_DIR.
+
+Paper files are written zstd- or gzip-compressed ('cs_Wed, 10 May 23.jsonl.zst')
+and read back as a line stream, so a reader that stops early never decodes
+the rest of the file. Plain '.jsonl' files from before compression keep
+working: every lookup resolves a logical '.jsonl' path to whichever variant
+exists on disk.
+
+Records are compressed in small independent blocks (gzip members / zstd
+frames, which concatenate into an ordinary stream), and writers can emit a
+sidecar '.idx' file mapping each record's key (the arXiv id for paper files) to
+its block's byte offset. A single paper is then read with one seek and one
+block decompression instead of a scan of the whole file.
+
+Existing plain files can be compressed and indexed in place with:
+    python src/jsonl_store.py --compress
+"""
+import argparse
+import glob
+import gzip
+import io
+import json
+import mmap
+import os
+import threading
+from collections.abc import Mapping
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
+
+from paths import DATA_DIR
+
+try:
+    import zstandard
+    ZSTD_AVAILABLE = True
+except ImportError:
+    ZSTD_AVAILABLE = False
+
+# "zstd", "gzip" or "none"; new files use this, existing files keep their own format
+PAPER_COMPRESSION = os.environ.get("ARXIV_PAPER_COMPRESSION", "zstd" if ZSTD_AVAILABLE else "gzip")
+ZSTD_LEVEL = int(os.environ.get("ARXIV_ZSTD_LEVEL", 3))
+GZIP_LEVEL = int(os.environ.get("ARXIV_GZIP_LEVEL", 6))
+
+SUFFIXES = {"zstd": ".zst", "gzip": ".gz", "none": ""}
+
+# Records per compressed block: larger blocks compress better, smaller ones
+# make a random access decompress less
+INDEX_BLOCK_RECORDS = int(os.environ.get("ARXIV_INDEX_BLOCK_RECORDS", 32))
+INDEX_SUFFIX = ".idx"
+
+
+def compression_for(path: str) -> str:
+    """Compression of a file, from its suffix."""
+    for compression, suffix in SUFFIXES.items():
+        if suffix and path.endswith(suffix):
+            return compression
+    return "none"
+
+
+def base_path(path: str) -> str:
+    """Logical '.jsonl' path of a possibly compressed file."""
+    suffix = SUFFIXES[compression_for(path)]
+    return path[:-len(suffix)] if suffix else path
+
+
+def resolve(path: str, compression: Optional[str] = None) -> str:
+    """
+    Find the stored variant of a logical JSONL path.
+
+    Returns:
+        The existing file (compressed or plain) for path, or, if none exists
+        yet, the path a new file should be written to
+    """
+    compression = compression or PAPER_COMPRESSION
+    base = base_path(path)
+    preferred = base + SUFFIXES[compression]
+    for candidate in [preferred] + [base + suffix for suffix in SUFFIXES.values() if base + suffix != preferred]:
+        if os.path.exists(candidate):
+            return candidate
+    return preferred
+
+
+def exists(path: str) -> bool:
+    """Whether any variant of a logical JSONL path is on disk."""
+    return os.path.exists(resolve(path))
+
+
+def list_files(directory: str = DATA_DIR) -> List[str]:
+    """Every JSONL file in a directory, compressed or not, sorted by name."""
+    files = []
+    for suffix in SUFFIXES.values():
+        files += glob.glob(os.path.join(directory, "*.jsonl" + suffix))
+    return sorted(files)
+
+
+def open_text(path: str, mode: str = "r", compression: Optional[str] = None) -> io.TextIOBase:
+    """
+    Open a JSONL file as UTF-8 text, compressing or decompressing on the fly.
+
+    Args:
+        path: File path
+        mode: "r", "w" or "a"
+        compression: Override the compression implied by the suffix (for temp files)
+    """
+    compression = compression or compression_for(path)
+    if compression == "gzip":
+        return gzip.open(path, mode + "t", encoding="utf-8", compresslevel=GZIP_LEVEL)
+    if compression == "zstd":
+        if not ZSTD_AVAILABLE:
+            raise ImportError(f"zstandard is required to read or write {path}")
+        if mode == "r":
+            # Block-compressed files are a sequence of frames
+            reader = zstandard.ZstdDecompressor().stream_reader(open(path, "rb"), read_across_frames=True,
+                                                                 closefd=True)
+            return io.TextIOWrapper(reader, encoding="utf-8")
+        return zstandard.open(path, mode + "t", encoding="utf-8",
+                              cctx=zstandard.ZstdCompressor(level=ZSTD_LEVEL))
+    return open(path, mode, encoding="utf-8")
+
+
+def iter_jsonl(path: str) -> Iterator[Dict[str, Any]]:
+    """Yield records one line at a time; stopping early leaves the rest of the file unread."""
+    with open_text(path) as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def read_jsonl(path: str) -> List[Dict[str, Any]]:
+    return list(iter_jsonl(path))
+
+
+def index_path(path: str) -> str:
+    """Sidecar offset index of a JSONL file (shared by all its variants)."""
+    return base_path(path) + INDEX_SUFFIX
+
+
+def _json_default(value: Any) -> Any:
+    # Dict-like records such as paper.Paper are written as plain objects
+    if isinstance(value, Mapping):
+        return dict(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def _compress_block(data: bytes, compression: str) -> bytes:
+    if compression == "gzip":
+        return gzip.compress(data, compresslevel=GZIP_LEVEL)
+    if compression == "zstd":
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+    return data
+
+
+def _decompress_block(data: bytes, compression: str) -> bytes:
+    if compression == "gzip":
+        return gzip.decompress(data)
+    if compression == "zstd":
+        return zstandard.ZstdDecompressor().decompress(data)
+    return data
+
+
+class JsonlWriter:
+    """
+    Writes records to the stored variant of a logical JSONL path.
+
+    The file is built under a temporary name and renamed into place on
+    close(commit=True), and any other variant of the same file is removed, so
+    readers never see a partial file or two variants. With a key function the
+    writer also emits the sidecar offset index.
+    """
+    def __init__(self, path: str, compression: Optional[str] = None,
+                 key: Optional[Callable[[Dict[str, Any]], Optional[str]]] = None):
+        if compression is None:
+            compression = compression_for(path) if compression_for(path) != "none" else PAPER_COMPRESSION
+        if compression == "zstd" and not ZSTD_AVAILABLE:
+            raise ImportError(f"zstandard is required to write {path}")
+        self.compression = compression
+        self.path = base_path(path) + SUFFIXES[compression]
+        self.key = key
+        self._tmp_path = f"{self.path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        self._file = open(self._tmp_path, "wb")
+        self._lines = []
+        self._keys = []
+        self._offset = 0
+        self._index = {}
+        self.count = 0
+
+    def write(self, record: Dict[str, Any]) -> None:
+        self._lines.append((json.dumps(record, default=_json_default) + "\n").encode("utf-8"))
+        self._keys.append(self.key(record) if self.key else None)
+        self.count += 1
+        if len(self._lines) >= INDEX_BLOCK_RECORDS:
+            self._flush()
+
+    def _flush(self) -> None:
+        if not self._lines:
+            return
+        if self.compression == "none":
+            # Plain files: every line is its own block
+            blocks = [([line], [key]) for line, key in zip(self._lines, self._keys)]
+        else:
+            blocks = [(self._lines, self._keys)]
+        for lines, keys in blocks:
+            data = _compress_block(b"".join(lines), self.compression)
+            for position, key in enumerate(keys):
+                if key is not None:
+                    # [block offset, block length, line within block]; the first record wins
+                    self._index.setdefault(key, [self._offset, len(data), position])
+            self._file.write(data)
+            self._offset += len(data)
+        self._lines, self._keys = [], []
+
+    def close(self, commit: bool = True) -> Optional[str]:
+        """
+        Finish the file. Returns the path written, or None if discarded.
+        """
+        self._flush()
+        self._file.close()
+        if not commit:
+            os.remove(self._tmp_path)
+            return None
+        os.replace(self._tmp_path, self.path)
+        for suffix in SUFFIXES.values():
+            other = base_path(self.path) + suffix
+            if other != self.path and os.path.exists(other):
+                os.remove(other)
+
+        sidecar = index_path(self.path)
+        if self.key is None:
+            if os.path.exists(sidecar):
+                os.remove(sidecar)
+            return self.path
+        tmp_sidecar = f"{sidecar}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_sidecar, "w") as f:
+            json.dump({
+                "file": os.path.basename(self.path),
+                "size": self._offset,
+                "compression": self.compression,
+                "offsets": self._index,
+            }, f)
+        os.replace(tmp_sidecar, sidecar)
+        return self.path
+
+    def __enter__(self) -> "JsonlWriter":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.close(commit=exc_type is None)
+
+
+def write_jsonl(path: str, records: Iterable[Dict[str, Any]], compression: Optional[str] = None,
+                key: Optional[Callable[[Dict[str, Any]], Optional[str]]] = None) -> str:
+    """
+    Write records to the stored variant of a logical JSONL path, atomically.
+
+    Args:
+        compression: Override the configured compression
+        key: Record -> lookup key; when given, an offset index is written alongside
+
+    Returns:
+        The path written
+    """
+    with JsonlWriter(path, compression=compression, key=key) as writer:
+        for record in records:
+            writer.write(record)
+    return writer.path
+
+
+class OffsetIndex:
+    """
+    Random access to the records of one JSONL file through its sidecar index.
+
+    Lookups seek straight to a record's block (or slice it from an mmap of the
+    file) and decompress only that block.
+    """
+    def __init__(self, path: str, use_mmap: bool = False):
+        self.path = resolve(path)
+        self.offsets = {}
+        self.compression = compression_for(self.path)
+        self._file = None
+        self._mmap = None
+        try:
+            with open(index_path(self.path), "r") as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            return
+        # An index left behind by an older variant, or a rewritten file, is stale
+        if (index.get("file") != os.path.basename(self.path) or not os.path.exists(self.path)
+                or index.get("size") != os.path.getsize(self.path)):
+            return
+        self.offsets = index.get("offsets", {})
+        self._file = open(self.path, "rb")
+        if use_mmap and index["size"] > 0:
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    @property
+    def valid(self) -> bool:
+        return self._file is not None
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.offsets
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """The record stored under key, or None."""
+        location = self.offsets.get(key)
+        if location is None or self._file is None:
+            return None
+        offset, length, position = location
+        if self._mmap is not None:
+            data = self._mmap[offset:offset + length]
+        else:
+            self._file.seek(offset)
+            data = self._file.read(length)
+        lines = _decompress_block(data, self.compression).splitlines()
+        return json.loads(lines[position])
+
+    def close(self) -> None:
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self) -> "OffsetIndex":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.close()
+
+
+def read_record(path: str, key: str, use_mmap: bool = False) -> Optional[Dict[str, Any]]:
+    """
+    Read one record by key through the file's offset index.
+
+    Returns:
+        The record, or None if the file has no valid index or no such key
+    """
+    with OffsetIndex(path, use_mmap=use_mmap) as index:
+        return index.get(key)
+
+
+def paper_key(record: Dict[str, Any]) -> Optional[str]:
+    """Index key of a paper record: its unversioned arXiv id."""
+    # Imported here so the store has no network-layer dependency at import time
+    from page_cache import parse_arxiv_id
+    return parse_arxiv_id(record.get("main_page", ""))[0]
+
+
+def compress_file(path: str, compression: str = PAPER_COMPRESSION,
+                  key: Optional[Callable[[Dict[str, Any]], Optional[str]]] = paper_key) -> str:
+    """Rewrite a JSONL file with the given compression and an offset index. Returns the new path."""
+    if compression_for(path) == compression:
+        if key is None:
+            return path
+        with OffsetIndex(path) as index:
+            if index.valid:
+                return path
+    # Read fully first: the rewrite may replace the file being read
+    return write_jsonl(path, read_jsonl(path), compression=compression, key=key)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compress and index the JSONL paper files in DATA_DIR.")
+    parser.add_argument("--compress", action="store_true",
+                        help="Rewrite files with --compression and an offset index")
+    parser.add_argument("--compression", choices=sorted(SUFFIXES), default=PAPER_COMPRESSION)
+    parser.add_argument("--data-dir", default=DATA_DIR)
+    args = parser.parse_args()
+
+    before = after = 0
+    for file_path in list_files(args.data_dir):
+        if os.path.basename(file_path).startswith("seen_ids"):
+            continue
+        size = os.path.getsize(file_path)
+        if args.compress:
+            file_path = compress_file(file_path, args.compression)
+        before += size
+        after += os.path.getsize(file_path)
+        print(f"{os.path.basename(file_path)}: {size} -> {os.path.getsize(file_path)} bytes")
+    print(f"Total: {before} -> {after} bytes")
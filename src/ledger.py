@@ -0,0 +1,128 @@
+"""
+Persistent ledger of arXiv IDs that have already been ingested.
+Each entry remembers which data file and line holds the stored record, so a paper
+that shows up again (a cross-list in another category, or a later day's listing)
+can reuse that record instead of being crawled again.
+"""
+import json
+import os
+import threading
+from typing import Any, Dict, Iterable, Optional
+
+import jsonl_store
+from page_cache import parse_arxiv_id
+from paths import DATA_DIR
+
+LEDGER_PATH = os.path.join(DATA_DIR, "seen_ids.jsonl")
+
+
+def _paper_id(paper: Dict[str, Any]) -> Optional[str]:
+    return parse_arxiv_id(paper.get("main_page", ""))[0]
+
+
+class SeenLedger:
+    """Append-only JSONL ledger mapping arXiv id -> stored record location."""
+    def __init__(self, path: str = LEDGER_PATH, data_dir: str = DATA_DIR):
+        self.path = path
+        self.data_dir = data_dir
+        self._lock = threading.RLock()
+        self._entries = None
+
+    def _load(self) -> Dict[str, Dict[str, Any]]:
+        if self._entries is not None:
+            return self._entries
+        entries = {}
+        if os.path.exists(self.path):
+            with open(self.path, "r") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue  # tolerate a torn last line
+                    # The first sighting wins; later ones are cross-lists of it
+                    entries.setdefault(entry["id"], entry)
+            self._entries = entries
+        else:
+            self._entries = entries
+            self.rebuild()
+        return self._entries
+
+    def rebuild(self) -> int:
+        """Index every existing paper file in data_dir. Returns the number of ids recorded."""
+        count = 0
+        for file_path in jsonl_store.list_files(self.data_dir):
+            if os.path.abspath(file_path) == os.path.abspath(self.path):
+                continue
+            try:
+                papers = jsonl_store.read_jsonl(file_path)
+            except (OSError, ValueError, EOFError):
+                continue
+            count += self.record_file(file_path, papers)
+        return count
+
+    def __contains__(self, arxiv_id: str) -> bool:
+        return self.get(arxiv_id) is not None
+
+    def get(self, arxiv_id: str) -> Optional[Dict[str, Any]]:
+        """Return {'id', 'file', 'line'} for a known id, or None."""
+        with self._lock:
+            return self._load().get(arxiv_id)
+
+    def record_file(self, file_path: str, papers: Iterable[Dict[str, Any]]) -> int:
+        """
+        Record the ids in a freshly written paper file.
+
+        Args:
+            file_path: Path of the JSONL file the papers were written to
+            papers: Papers in file order
+
+        Returns:
+            Number of ids that were new to the ledger
+        """
+        file_name = os.path.basename(file_path)
+        new_entries = []
+        with self._lock:
+            entries = self._load()
+            for line_no, paper in enumerate(papers):
+                arxiv_id = _paper_id(paper)
+                if arxiv_id and arxiv_id not in entries:
+                    entry = {"id": arxiv_id, "file": file_name, "line": line_no}
+                    entries[arxiv_id] = entry
+                    new_entries.append(entry)
+            if new_entries:
+                with open(self.path, "a") as f:
+                    for entry in new_entries:
+                        f.write(json.dumps(entry) + "\n")
+        return len(new_entries)
+
+    def load_record(self, arxiv_id: str) -> Optional[Dict[str, Any]]:
+        """Read the stored paper record for a known id, or None if it is gone."""
+        entry = self.get(arxiv_id)
+        if entry is None:
+            return None
+        # The file may have been compressed since it was recorded
+        file_path = jsonl_store.resolve(os.path.join(self.data_dir, entry["file"]))
+        try:
+            record = jsonl_store.read_record(file_path, arxiv_id)
+            if record is not None:
+                return record
+            # No offset index (older files): scan to the recorded line
+            with jsonl_store.open_text(file_path) as f:
+                for line_no, line in enumerate(f):
+                    if line_no == entry["line"]:
+                        record = json.loads(line)
+                        return record if _paper_id(record) == arxiv_id else None
+        except (OSError, ValueError, EOFError):
+            return None
+        return None
+
+
+_default_ledger = None
+
+
+def get_ledger() -> SeenLedger:
+    """Return the shared ledger for DATA_DIR."""
+    global _default_ledger
+    if _default_ledger is None:
+        _default_ledger = SeenLedger()
+    return _default_ledger
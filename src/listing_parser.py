@@ -0,0 +1,197 @@
+"""
+Parsers for arXiv listing pages (https://arxiv.org/list/<field>/new).
+
+The original parser built a full BeautifulSoup html.parser tree for the whole
+multi-megabyte page. The backends here all return identical paper dicts:
+
+- "lxml": lxml.html tree walked with XPath (fastest, needs lxml)
+- "strainer": BeautifulSoup limited by a SoupStrainer to the h3/dl blocks
+- "html.parser": the original full-tree BeautifulSoup parse
+
+Benchmark them against a saved listing page with:
+    python src/listing_parser.py --benchmark path/to/listing.html
+"""
+import argparse
+import os
+import re
+import time
+from typing import Any, Dict, List, Tuple
+
+from bs4 import BeautifulSoup as bs
+from bs4 import SoupStrainer
+
+try:
+    import lxml.html
+    LXML_AVAILABLE = True
+except ImportError:
+    LXML_AVAILABLE = False
+
+ARXIV_ABS_BASE = "https://arxiv.org/abs/"
+ARXIV_PDF_BASE = "https://arxiv.org/pdf/"
+
+DEFAULT_BACKEND = os.environ.get("ARXIV_LISTING_PARSER", "lxml" if LXML_AVAILABLE else "strainer")
+
+_HREF_PATTERN = re.compile(r'[/]([a-z]|[A-Z])\w+')
+
+
+def _make_paper(href: str, title: str, authors: str, subjects: str, abstract: str) -> Dict[str, Any]:
+    # Field cleanup mirrors the original _download_new_papers exactly
+    paper_number = href.strip().replace("/abs/", "")
+    return {
+        'main_page': ARXIV_ABS_BASE + paper_number,
+        'pdf': ARXIV_PDF_BASE + paper_number,
+        'title': title.replace("Title:\n", "").strip(),
+        'authors': authors.replace("Authors:\n", "").replace("\n", "").strip(),
+        'subjects': subjects.replace("Subjects:\n", "").strip(),
+        'abstract': abstract.replace("\n", " ").strip(),
+    }
+
+
+def _parse_soup(content) -> Tuple[str, List[Dict[str, Any]]]:
+    return _parse_blocks(content.find("h3"), content.dl)
+
+
+def _parse_blocks(heading, dl) -> Tuple[str, List[Dict[str, Any]]]:
+    h3 = heading.text   # e.g: New submissions for Wed, 10 May 23
+    date = h3.replace("New submissions for", "").strip()
+
+    dt_list = dl.find_all("dt")
+    dd_list = dl.find_all("dd")
+    assert len(dt_list) == len(dd_list)
+
+    papers = []
+    for dt, dd in zip(dt_list, dd_list):
+        papers.append(_make_paper(
+            dt.find('a', href=_HREF_PATTERN).attrs['href'],
+            dd.find("div", {"class": "list-title mathjax"}).text,
+            dd.find("div", {"class": "list-authors"}).text,
+            dd.find("div", {"class": "list-subjects"}).text,
+            dd.find("p", {"class": "mathjax"}).text,
+        ))
+    return date, papers
+
+
+def _parse_html_parser(page) -> Tuple[str, List[Dict[str, Any]]]:
+    soup = bs(page, features="html.parser")
+    return _parse_soup(soup.body.find("div", {'id': 'content'}))
+
+
+def _parse_strainer(page) -> Tuple[str, List[Dict[str, Any]]]:
+    # Only build tree nodes for headings and definition lists; everything else
+    # on the page (navigation, scripts, footer) is skipped by the tokenizer
+    soup = bs(page, features="html.parser", parse_only=SoupStrainer(["h3", "dl"]))
+    # Headings and lists outside #content (e.g. the site header) are kept too,
+    # so start from the listing's own heading and the list that follows it
+    heading = soup.find(lambda tag: tag.name == "h3" and "New submissions" in tag.get_text())
+    if heading is None:
+        heading = soup.find("h3")
+    return _parse_blocks(heading, heading.find_next("dl"))
+
+
+def _class_xpath(tag: str, cls: str) -> str:
+    # Single class names match any element carrying that class, like bs4 does;
+    # multi-word values must equal the whole attribute
+    if " " in cls:
+        return f".//{tag}[@class='{cls}']"
+    return f".//{tag}[contains(concat(' ', normalize-space(@class), ' '), ' {cls} ')]"
+
+
+_TITLE_XPATH = _class_xpath("div", "list-title mathjax")
+_AUTHORS_XPATH = _class_xpath("div", "list-authors")
+_SUBJECTS_XPATH = _class_xpath("div", "list-subjects")
+_ABSTRACT_XPATH = _class_xpath("p", "mathjax")
+
+
+def _parse_lxml(page) -> Tuple[str, List[Dict[str, Any]]]:
+    if not LXML_AVAILABLE:
+        raise RuntimeError("lxml not installed. Run 'pip install lxml' or use another backend")
+    if isinstance(page, bytes):
+        # arXiv serves UTF-8; decode up front so lxml doesn't guess the charset
+        page = page.decode("utf-8", errors="replace")
+    doc = lxml.html.document_fromstring(page)
+    content = doc.xpath("//body//div[@id='content']")[0]
+
+    date = content.xpath(".//h3")[0].text_content().replace("New submissions for", "").strip()
+
+    dl = content.xpath(".//dl")[0]
+    dt_list = dl.xpath(".//dt")
+    dd_list = dl.xpath(".//dd")
+    assert len(dt_list) == len(dd_list)
+
+    def _first_text(node, xpath):
+        return node.xpath(xpath)[0].text_content()
+
+    papers = []
+    for dt, dd in zip(dt_list, dd_list):
+        href = next(a.get('href') for a in dt.iter('a') if a.get('href') and _HREF_PATTERN.search(a.get('href')))
+        papers.append(_make_paper(
+            href,
+            _first_text(dd, _TITLE_XPATH),
+            _first_text(dd, _AUTHORS_XPATH),
+            _first_text(dd, _SUBJECTS_XPATH),
+            _first_text(dd, _ABSTRACT_XPATH),
+        ))
+    return date, papers
+
+
+BACKENDS = {
+    "lxml": _parse_lxml,
+    "strainer": _parse_strainer,
+    "html.parser": _parse_html_parser,
+}
+
+
+def parse_listing(page, backend: str = DEFAULT_BACKEND) -> Tuple[str, List[Dict[str, Any]]]:
+    """
+    Parse an arXiv /new listing page.
+
+    Args:
+        page: Raw page bytes or text
+        backend: One of BACKENDS
+
+    Returns:
+        (date, papers) where date is the listing heading date (e.g. "Wed, 10 May 23")
+        and papers are dicts with main_page, pdf, title, authors, subjects, abstract
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown listing parser backend {backend}. Choose from {list(BACKENDS)}")
+    return BACKENDS[backend](page)
+
+
+def benchmark(page, repeat: int = 3) -> Dict[str, float]:
+    """
+    Time every available backend on a page and check they agree with html.parser.
+
+    Returns:
+        Mapping of backend name to best wall-clock seconds over `repeat` runs
+    """
+    reference = _parse_html_parser(page)
+    timings = {}
+    for name, parse in BACKENDS.items():
+        if name == "lxml" and not LXML_AVAILABLE:
+            continue
+        best = float("inf")
+        for _ in range(repeat):
+            start = time.perf_counter()
+            result = parse(page)
+            best = min(best, time.perf_counter() - start)
+        if result != reference:
+            raise AssertionError(f"Backend {name} produced different papers than html.parser")
+        timings[name] = best
+    return timings
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark arXiv listing page parsers.")
+    parser.add_argument("--benchmark", type=str, required=True, help="Saved /list/<field>/new HTML file")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per backend (best time is reported)")
+    args = parser.parse_args()
+
+    with open(args.benchmark, "rb") as f:
+        page = f.read()
+    timings = benchmark(page, repeat=args.repeat)
+    _, papers = parse_listing(page)
+    baseline = timings["html.parser"]
+    print(f"{len(papers)} papers, {len(page) / 1e6:.1f} MB page; all backends produce identical output")
+    for name, seconds in sorted(timings.items(), key=lambda x: x[1]):
+        print(f"  {name:12s} {seconds * 1000:8.1f} ms  ({baseline / seconds:.1f}x vs html.parser)")
@@ -0,0 +1,175 @@
+"""
+Persistent cache of parsed per-paper LLM results.
+
+Re-running a digest (a new threshold, a re-triggered action) used to send every
+paper to OpenAI, Gemini or Claude again. Parsed results are stored in SQLite
+under DATA_DIR, keyed by
+
+    (arXiv id, hash of the interest text, model name, stage, hash of the prompt template)
+
+so identical work is answered from disk with no tokens and no latency, while a
+change to any part of the key (editing a prompt file, switching models) misses
+and is sent to the model again. Entries older than LLM_CACHE_MAX_AGE_DAYS and,
+past LLM_CACHE_MAX_MB, the least recently used entries are evicted.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Mapping, Optional
+
+from page_cache import parse_arxiv_id
+from paths import DATA_DIR
+
+CACHE_PATH = os.environ.get("ARXIV_LLM_CACHE", os.path.join(DATA_DIR, "llm_cache.sqlite3"))
+# With ARXIV_LLM_CACHE_ENABLED=0 every key is None, so nothing is read or stored
+CACHE_ENABLED = os.environ.get("ARXIV_LLM_CACHE_ENABLED", "1") != "0"
+LLM_CACHE_MAX_AGE_DAYS = float(os.environ.get("ARXIV_LLM_CACHE_MAX_AGE_DAYS", 30))
+LLM_CACHE_MAX_MB = float(os.environ.get("ARXIV_LLM_CACHE_MAX_MB", 256))
+# Eviction runs when the cache is opened and after this many writes
+EVICT_EVERY = 200
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    key TEXT PRIMARY KEY,
+    paper_id TEXT NOT NULL,
+    stage TEXT NOT NULL,
+    model TEXT NOT NULL,
+    result TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    created REAL NOT NULL,
+    accessed REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS results_created ON results (created);
+CREATE INDEX IF NOT EXISTS results_accessed ON results (accessed);
+"""
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+
+
+_file_hashes = {}
+
+
+def file_hash(path: str) -> str:
+    """Hash of a prompt template file, re-read when the file changes."""
+    mtime = os.path.getmtime(path)
+    cached = _file_hashes.get(path)
+    if cached is None or cached[0] != mtime:
+        with open(path, "rb") as f:
+            cached = (mtime, hashlib.sha256(f.read()).hexdigest()[:16])
+        _file_hashes[path] = cached
+    return cached[1]
+
+
+def result_key(paper: Mapping[str, Any], query: Mapping[str, str], model_name: str, stage: str,
+               prompt_hash: str) -> Optional[str]:
+    """
+    Cache key of one paper's result for one stage.
+
+    Args:
+        paper: Paper dict
+        query: Query dict with the 'interest' text
+        model_name: Model the result comes from
+        stage: Pipeline stage, e.g. "filter", "analysis", "gemini", "claude"
+        prompt_hash: text_hash/file_hash of the prompt template
+
+    Returns:
+        The key, or None when caching is disabled or the paper has no arXiv id
+    """
+    arxiv_id = parse_arxiv_id(paper.get("main_page", ""))[0]
+    if arxiv_id is None or not CACHE_ENABLED:
+        return None
+    return "|".join((arxiv_id, text_hash(query.get("interest", "")), model_name, stage, prompt_hash))
+
+
+class LLMCache:
+    """Thread-safe SQLite store of parsed LLM results with age and size eviction."""
+    def __init__(self, path: str = CACHE_PATH, max_age_days: float = LLM_CACHE_MAX_AGE_DAYS,
+                 max_mb: float = LLM_CACHE_MAX_MB):
+        self.path = path
+        self.max_age = max_age_days * 86400
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._writes = 0
+        self.hits = self.misses = 0
+        with self._connect() as conn:
+            conn.executescript(_SCHEMA)
+        self.evict()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: Optional[str]) -> Optional[Dict[str, Any]]:
+        """The cached result for a key, or None."""
+        if key is None:
+            return None
+        now = time.time()
+        with self._connect() as conn:
+            row = conn.execute("SELECT result FROM results WHERE key = ? AND created >= ?",
+                               (key, now - self.max_age)).fetchone()
+            if row is not None:
+                conn.execute("UPDATE results SET accessed = ? WHERE key = ?", (now, key))
+        with self._lock:
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return json.loads(row[0])
+
+    def put(self, key: Optional[str], result: Mapping[str, Any]) -> None:
+        """Store a parsed result; evicts old entries every EVICT_EVERY writes."""
+        if key is None:
+            return
+        paper_id, _, model, stage, _ = key.split("|")
+        data = json.dumps(dict(result))
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO results (key, paper_id, stage, model, result, size, created, accessed) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, paper_id, stage, model, data, len(data), now, now)
+            )
+        with self._lock:
+            self._writes += 1
+            evict = self._writes % EVICT_EVERY == 0
+        if evict:
+            self.evict()
+
+    def evict(self) -> int:
+        """Drop expired entries, then least recently used ones past the size limit. Returns entries removed."""
+        with self._connect() as conn:
+            removed = conn.execute("DELETE FROM results WHERE created < ?", (time.time() - self.max_age,)).rowcount
+            removed += conn.execute(
+                "DELETE FROM results WHERE key IN (SELECT key FROM "
+                "(SELECT key, SUM(size) OVER (ORDER BY accessed DESC, key) AS kept FROM results) WHERE kept > ?)",
+                (self.max_bytes,)
+            ).rowcount
+        return removed
+
+    def clear(self) -> None:
+        with self._connect() as conn:
+            conn.execute("DELETE FROM results")
+
+
+_default_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache() -> LLMCache:
+    """Return the shared cache at CACHE_PATH."""
+    global _default_cache
+    with _cache_lock:
+        if _default_cache is None:
+            _default_cache = LLMCache()
+        return _default_cache
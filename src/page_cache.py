@@ -0,0 +1,142 @@
+"""
+Persistent on-disk cache for arXiv HTML pages.
+Pages are keyed by arXiv id + version, stored gzip-compressed under DATA_DIR,
+and revalidated with conditional GETs. A versioned page (e.g. 2404.11972v1) never
+changes once published, so it is served from disk without touching the network.
+"""
+import gzip
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from typing import Any, Dict, Optional
+
+import http_client
+from paths import DATA_DIR
+
+CACHE_DIR = os.path.join(DATA_DIR, "html_cache")
+
+# Matches new-style (2404.11972v1) and old-style (hep-th/9901001v2) identifiers
+ARXIV_ID_PATTERN = re.compile(r'arxiv\.org/(?:html|abs|pdf)/([a-z\-]+(?:\.[A-Z]{2})?/\d{7}|\d{4}\.\d{4,5})(v\d+)?')
+
+
+def parse_arxiv_id(url: str):
+    """
+    Extract the arXiv id and version from an arxiv.org URL.
+
+    Returns:
+        (arxiv_id, version) tuple. version is None for unversioned links and
+        both are None when the URL is not an arXiv paper link.
+    """
+    match = ARXIV_ID_PATTERN.search(url)
+    if not match:
+        return None, None
+    return match.group(1), match.group(2)
+
+
+def cache_key(url: str) -> str:
+    """Cache key for a page: 'html:<id><version>' for arXiv papers, the URL otherwise."""
+    arxiv_id, version = parse_arxiv_id(url)
+    if arxiv_id is None:
+        return url
+    kind = "pdf" if "/pdf/" in url else "html"
+    return f"{kind}:{arxiv_id}{version or ''}"
+
+
+class PageCache:
+    """Content-addressed page store with ETag/Last-Modified revalidation."""
+    def __init__(self, cache_dir: str = CACHE_DIR):
+        self.cache_dir = cache_dir
+
+    def _paths(self, key: str):
+        digest = hashlib.sha256(key.encode("utf-8")).hexdigest()
+        shard = os.path.join(self.cache_dir, digest[:2])
+        return os.path.join(shard, digest + ".gz"), os.path.join(shard, digest + ".json")
+
+    def load(self, key: str):
+        """Return (body, metadata) for a cached key, or (None, None)."""
+        body_path, meta_path = self._paths(key)
+        if not (os.path.exists(body_path) and os.path.exists(meta_path)):
+            return None, None
+        try:
+            with open(meta_path, "r") as f:
+                meta = json.load(f)
+            with gzip.open(body_path, "rb") as f:
+                body = f.read()
+        except (OSError, ValueError):
+            return None, None
+        return body, meta
+
+    def store(self, key: str, url: str, body: bytes, headers: Dict[str, str]) -> Dict[str, Any]:
+        body_path, meta_path = self._paths(key)
+        os.makedirs(os.path.dirname(body_path), exist_ok=True)
+        meta = {
+            "key": key,
+            "url": url,
+            "etag": headers.get("etag"),
+            "last_modified": headers.get("last-modified"),
+            "sha256": hashlib.sha256(body).hexdigest(),
+            "size": len(body),
+            "fetched_at": time.time(),
+        }
+        # Write to temp files first so concurrent readers never see a partial entry
+        tmp_body = f"{body_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with gzip.open(tmp_body, "wb") as f:
+            f.write(body)
+        os.replace(tmp_body, body_path)
+        self._write_meta(meta_path, meta)
+        return meta
+
+    def _write_meta(self, meta_path: str, meta: Dict[str, Any]) -> None:
+        tmp_meta = f"{meta_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_meta, "w") as f:
+            json.dump(meta, f)
+        os.replace(tmp_meta, meta_path)
+
+    def get(self, url: str, revalidate: Optional[bool] = None) -> bytes:
+        """
+        Return the page body for url, from disk when possible.
+
+        Args:
+            url: Page URL
+            revalidate: Force (True) or skip (False) a conditional GET. By default
+                versioned arXiv pages are trusted as immutable and everything
+                else is revalidated.
+
+        Raises:
+            urllib.error.HTTPError if the page has to be fetched and the request fails
+        """
+        key = cache_key(url)
+        body, meta = self.load(key)
+
+        if revalidate is None:
+            _, version = parse_arxiv_id(url)
+            revalidate = version is None
+        if body is not None and not revalidate:
+            return body
+
+        headers = {}
+        if meta:
+            if meta.get("etag"):
+                headers["If-None-Match"] = meta["etag"]
+            if meta.get("last_modified"):
+                headers["If-Modified-Since"] = meta["last_modified"]
+
+        response = http_client.fetch(url, headers=headers or None)
+        if response.status == 304 and body is not None:
+            meta["fetched_at"] = time.time()
+            self._write_meta(self._paths(key)[1], meta)
+            return body
+
+        self.store(key, url, response.body, response.headers)
+        return response.body
+
+
+_default_cache = PageCache()
+
+
+def get_page(url: str, revalidate: Optional[bool] = None) -> bytes:
+    """Fetch a page through the shared on-disk cache."""
+    return _default_cache.get(url, revalidate=revalidate)
@@ -0,0 +1,231 @@
+"""
+Compact in-memory paper record.
+
+Papers used to travel through the pipeline as plain dicts carrying their full
+text and every analysis field. Paper keeps the listing fields in __slots__,
+interns the strings shared by many papers (categories, subjects), loads full
+text from the paper store only when it is read, and keeps analysis fields in
+one dict. Gemini and Claude results stay under their own keys
+('gemini_analysis', 'claude_analysis'); a successful result's fields are also
+readable directly on the paper, sharing the same value objects.
+
+Paper is a MutableMapping, so existing code that reads and writes papers as
+dicts (paper['title'], paper.get(...), paper[key] = value, dict(paper), **paper)
+keeps working.
+"""
+import sys
+from collections.abc import Mapping, MutableMapping
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+import paper_store
+from page_cache import parse_arxiv_id
+
+# Listing fields stored in slots, in the order dict views list them
+CORE_FIELDS = ("main_page", "pdf", "title", "authors", "subjects", "abstract")
+
+# Fields produced by the LLM analysis stages (see relevancy.generate_relevance_score)
+ANALYSIS_FIELDS = frozenset((
+    "Relevancy score", "Reasons for match", "Key innovations", "Critical analysis",
+    "Goal", "Data", "Methodology", "Implementation details", "Experiments & Results",
+    "Git", "Discussion & Next steps", "Related work", "Practical applications",
+    "Key takeaways",
+))
+
+# Per-provider result keys, each holding that provider's own result dict
+PROVIDER_KEYS = ("gemini_analysis", "claude_analysis")
+
+
+def _intern(value):
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+class Paper(MutableMapping):
+    """
+    One arXiv paper.
+
+    Attributes:
+        id: Unversioned arXiv id, e.g. '2404.11972'
+        categories: Interned category codes, primary first
+        analysis: Analysis fields of the paper ('Relevancy score', ...), from
+            the OpenAI stages or the latest successful provider result
+        providers: {'gemini_analysis' | 'claude_analysis': result} as each provider returned it
+        extra: Any other per-paper fields (token counts, design labels, ...)
+    """
+    __slots__ = ("id", "main_page", "pdf", "title", "authors", "subjects", "abstract", "categories",
+                 "analysis", "providers", "extra", "_content", "_sections", "_content_source",
+                 "_content_loaded")
+
+    def __init__(self, main_page: str = "", pdf: Optional[str] = None, title: str = "", authors: str = "",
+                 subjects: str = "", abstract: str = "", categories: Optional[Tuple[str, ...]] = None,
+                 content: Optional[str] = None, sections: Optional[Dict[str, str]] = None,
+                 content_source: Optional[str] = None):
+        self.id = parse_arxiv_id(main_page)[0]
+        self.main_page = main_page
+        self.pdf = pdf
+        self.title = title
+        self.authors = authors
+        self.subjects = _intern(subjects)
+        self.abstract = abstract
+        if categories is None:
+            categories = paper_store.categories_of({"subjects": subjects})
+        self.categories = tuple(_intern(category) for category in categories)
+        self.analysis = {}
+        self.providers = {}
+        self.extra = {}
+        self._content = content
+        self._sections = sections
+        self._content_source = _intern(content_source)
+        # Content given up front, or no id to look it up by, means nothing to load
+        self._content_loaded = content is not None or self.id is None
+
+    @classmethod
+    def from_dict(cls, data: Mapping) -> "Paper":
+        """
+        Build a Paper from a paper dict.
+
+        Args:
+            data: Paper dict as stored in JSONL files or the paper store. Without
+                a 'content' field, content is loaded from the store on first access.
+        """
+        if isinstance(data, Paper):
+            return data
+        paper = cls(
+            main_page=data.get("main_page", ""),
+            pdf=data.get("pdf"),
+            title=data.get("title", ""),
+            authors=data.get("authors", ""),
+            subjects=data.get("subjects", ""),
+            abstract=data.get("abstract", ""),
+            categories=data.get("categories"),
+            content=data.get("content"),
+            sections=data.get("sections"),
+            content_source=data.get("content_source"),
+        )
+        for key, value in data.items():
+            if key not in CORE_FIELDS and key not in ("categories", "content", "sections", "content_source"):
+                paper[key] = value
+        return paper
+
+    def to_dict(self) -> Dict[str, Any]:
+        return dict(self)
+
+    # Full text
+
+    def _load_content(self) -> None:
+        if self._content_loaded:
+            return
+        self._content_loaded = True
+        stored = paper_store.get_store().get_content(self.id)
+        if stored is not None:
+            self._content, self._sections, self._content_source = stored
+            self._content_source = _intern(self._content_source)
+
+    @property
+    def content(self) -> Optional[str]:
+        """Full text, loaded from the paper store the first time it is read."""
+        self._load_content()
+        return self._content
+
+    @content.setter
+    def content(self, value: Optional[str]) -> None:
+        self._content = value
+        self._content_loaded = True
+
+    def release_content(self) -> None:
+        """Drop the in-memory full text; it is reloaded from the store if read again."""
+        if self.id is not None:
+            self._content = self._sections = None
+            self._content_loaded = False
+
+    # Mapping interface
+
+    def _keys(self) -> Iterator[str]:
+        yield from (field for field in CORE_FIELDS if getattr(self, field) is not None)
+        # Only content already in memory is listed; iterating never hits the store
+        if self._content is not None:
+            yield "content"
+        if self._sections:
+            yield "sections"
+        if self._content_source is not None:
+            yield "content_source"
+        yield from self.analysis
+        yield from self.providers
+        yield from (key for key in self.extra if key not in self.analysis)
+
+    def __iter__(self) -> Iterator[str]:
+        return self._keys()
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self._keys())
+
+    def __getitem__(self, key: str) -> Any:
+        if key in CORE_FIELDS:
+            value = getattr(self, key)
+        elif key == "content":
+            value = self.content
+        elif key == "sections":
+            self._load_content()
+            value = self._sections or None
+        elif key == "content_source":
+            self._load_content()
+            value = self._content_source
+        elif key in PROVIDER_KEYS:
+            return self.providers[key]
+        elif key in self.analysis:
+            return self.analysis[key]
+        else:
+            return self.extra[key]
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        if key in CORE_FIELDS:
+            setattr(self, key, _intern(value) if key == "subjects" else value)
+            if key == "main_page":
+                self.id = parse_arxiv_id(value)[0]
+        elif key == "content":
+            self.content = value
+        elif key == "sections":
+            self._sections = value
+        elif key == "content_source":
+            self._content_source = _intern(value)
+        elif key in PROVIDER_KEYS:
+            self.providers[key] = value
+            # Like the fields copied onto paper dicts before, a successful
+            # result's fields are readable directly; errors stay under the key
+            if isinstance(value, Mapping) and "error" not in value:
+                for field, field_value in value.items():
+                    self[field] = field_value
+        elif key in ANALYSIS_FIELDS or key in self.analysis:
+            self.analysis[key] = value
+            self.extra.pop(key, None)
+        else:
+            self.extra[key] = value
+
+    def __delitem__(self, key: str) -> None:
+        if key in CORE_FIELDS:
+            if getattr(self, key) is None:
+                raise KeyError(key)
+            setattr(self, key, None)
+        elif key == "content":
+            if self.content is None:
+                raise KeyError(key)
+            self._content = None
+        elif key == "sections":
+            self._sections = None
+        elif key == "content_source":
+            self._content_source = None
+        elif key in PROVIDER_KEYS:
+            del self.providers[key]
+        elif key in self.analysis:
+            del self.analysis[key]
+        else:
+            del self.extra[key]
+
+    def copy(self) -> Dict[str, Any]:
+        return dict(self)
+
+    def __repr__(self) -> str:
+        return f"Paper({self.id!r}, {self.title[:40]!r})"
+
@@ -0,0 +1,401 @@
+"""
+Embedded SQLite store for ingested papers.
+
+Every listing written to DATA_DIR is also recorded here, with indexed columns
+for the arXiv id, announce date and primary/secondary categories, so questions
+like "have we seen this id", "all cs.CV papers this month" or "papers
+cross-listed in cs.GR" are one indexed query instead of a scan over many
+JSONL files. Full text lives in its own table, so metadata queries never load
+it. The JSONL files remain the source of truth for older tools; existing ones
+are imported with:
+    python src/paper_store.py --import
+"""
+import argparse
+import datetime
+import json
+import os
+import re
+import sqlite3
+import threading
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import jsonl_store
+from page_cache import parse_arxiv_id
+from paths import DATA_DIR
+
+STORE_PATH = os.environ.get("ARXIV_PAPER_DB", os.path.join(DATA_DIR, "papers.sqlite3"))
+
+# Paper file names are '{field}_{date}.jsonl', with dates like 'Wed, 10 May 23'.
+# Legacy '{date}.jsonl' files (run_all_day_paper) are stored under field 'all'.
+LISTING_DATE_FORMAT = "%a, %d %b %y"
+LEGACY_FIELD = "all"
+_FILE_NAME = re.compile(r"^(?:(?P<field>[^_]+)_)?(?P<date>\w{3}, \d{2} \w{3} \d{2})\.jsonl$")
+# Category codes inside a subjects string, e.g. 'Machine Learning (cs.LG)'
+_CATEGORY = re.compile(r"\(([a-z\-]+(?:\.[A-Za-z\-]+)?)\)")
+
+# Paper fields kept in the content table rather than the record column
+_CONTENT_FIELDS = ("content", "sections", "content_source")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS papers (
+    id TEXT PRIMARY KEY,
+    announce_date TEXT,
+    primary_category TEXT,
+    title TEXT,
+    record TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS papers_announce_date ON papers (announce_date);
+CREATE INDEX IF NOT EXISTS papers_primary_category ON papers (primary_category, announce_date);
+
+CREATE TABLE IF NOT EXISTS paper_categories (
+    id TEXT NOT NULL,
+    category TEXT NOT NULL,
+    is_primary INTEGER NOT NULL,
+    PRIMARY KEY (id, category)
+);
+CREATE INDEX IF NOT EXISTS paper_categories_category ON paper_categories (category, is_primary);
+
+CREATE TABLE IF NOT EXISTS paper_content (
+    id TEXT PRIMARY KEY,
+    content TEXT,
+    sections TEXT,
+    content_source TEXT
+);
+
+CREATE TABLE IF NOT EXISTS listings (
+    field TEXT NOT NULL,
+    announce_date TEXT NOT NULL,
+    paper_count INTEGER NOT NULL,
+    PRIMARY KEY (field, announce_date)
+);
+
+CREATE TABLE IF NOT EXISTS listing_papers (
+    field TEXT NOT NULL,
+    announce_date TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    id TEXT NOT NULL,
+    PRIMARY KEY (field, announce_date, position)
+);
+CREATE INDEX IF NOT EXISTS listing_papers_id ON listing_papers (id);
+"""
+
+
+def iso_date(date_str: str) -> str:
+    """'Wed, 10 May 23' -> '2023-05-10'."""
+    return datetime.datetime.strptime(date_str, LISTING_DATE_FORMAT).date().isoformat()
+
+
+def listing_date_str(date: str) -> str:
+    """'2023-05-10' -> 'Wed, 10 May 23'."""
+    return datetime.date.fromisoformat(date).strftime(LISTING_DATE_FORMAT)
+
+
+def as_iso_date(date: str) -> str:
+    """A 'YYYY-MM-DD' or 'Wed, 10 May 23' date as 'YYYY-MM-DD'."""
+    return date if re.match(r"^\d{4}-\d{2}-\d{2}$", date) else iso_date(date)
+
+
+def field_of(category: str) -> str:
+    """The listing field (archive) of a category: 'cs.CV' -> 'cs', 'hep-th' -> 'hep-th'."""
+    return category.split(".", 1)[0]
+
+
+def categories_of(paper: Dict[str, Any]) -> List[str]:
+    """A paper's categories, primary first, from OAI 'categories' or the listing's subjects string."""
+    if paper.get("categories"):
+        return list(paper["categories"])
+    return _CATEGORY.findall(paper.get("subjects", ""))
+
+
+def parse_file_name(file_path: str) -> Optional[Tuple[str, str]]:
+    """(field, date_str) for a paper file path, or None if it is not one."""
+    match = _FILE_NAME.match(os.path.basename(jsonl_store.base_path(file_path)))
+    if not match:
+        return None
+    return match.group("field") or LEGACY_FIELD, match.group("date")
+
+
+def listing_file_path(field: str, date_str: str, data_dir: str = DATA_DIR) -> str:
+    """Stored JSONL file of a (field, date) listing (see jsonl_store.resolve)."""
+    name = f"{date_str}.jsonl" if field == LEGACY_FIELD else f"{field}_{date_str}.jsonl"
+    return jsonl_store.resolve(os.path.join(data_dir, name))
+
+
+class PaperStore:
+    """Thread-safe SQLite repository of papers, listings and full text."""
+    def __init__(self, path: str = STORE_PATH):
+        self.path = path
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.executescript(_SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def add_listing(self, field: str, date_str: str, papers: Iterable[Dict[str, Any]]) -> int:
+        """
+        Record a (field, date) listing and upsert its papers, replacing any
+        earlier version of that listing.
+
+        Returns:
+            Number of papers in the listing
+        """
+        date = iso_date(date_str)
+        count = 0
+        with self._connect() as conn:
+            conn.execute("DELETE FROM listing_papers WHERE field = ? AND announce_date = ?", (field, date))
+            for paper in papers:
+                arxiv_id = self._upsert(conn, paper, date)
+                if arxiv_id is None:
+                    continue
+                conn.execute("INSERT INTO listing_papers (field, announce_date, position, id) VALUES (?, ?, ?, ?)",
+                             (field, date, count, arxiv_id))
+                count += 1
+            conn.execute("INSERT OR REPLACE INTO listings (field, announce_date, paper_count) VALUES (?, ?, ?)",
+                         (field, date, count))
+        return count
+
+    def _upsert(self, conn: sqlite3.Connection, paper: Dict[str, Any], date: str) -> Optional[str]:
+        arxiv_id = parse_arxiv_id(paper.get("main_page", ""))[0]
+        if arxiv_id is None:
+            return None
+        categories = categories_of(paper)
+        record = {key: value for key, value in paper.items() if key not in _CONTENT_FIELDS}
+        # The first announcement of a paper is its announce date; cross-lists keep it.
+        # Records are merged, so fields added by other tools survive a re-listing.
+        conn.execute(
+            "INSERT INTO papers (id, announce_date, primary_category, title, record) VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT (id) DO UPDATE SET record = json_patch(papers.record, excluded.record), title = excluded.title, "
+            "announce_date = MIN(papers.announce_date, excluded.announce_date)",
+            (arxiv_id, date, categories[0] if categories else None, paper.get("title"), json.dumps(record))
+        )
+        conn.executemany(
+            "INSERT OR IGNORE INTO paper_categories (id, category, is_primary) VALUES (?, ?, ?)",
+            [(arxiv_id, category, int(i == 0)) for i, category in enumerate(categories)]
+        )
+        if paper.get("content"):
+            self._write_content(conn, arxiv_id, paper)
+        return arxiv_id
+
+    def _write_content(self, conn: sqlite3.Connection, arxiv_id: str, paper: Dict[str, Any]) -> None:
+        sections = paper.get("sections")
+        conn.execute(
+            "INSERT OR REPLACE INTO paper_content (id, content, sections, content_source) VALUES (?, ?, ?, ?)",
+            (arxiv_id, paper["content"], json.dumps(sections) if sections else None, paper.get("content_source"))
+        )
+
+    def set_content(self, paper: Dict[str, Any]) -> None:
+        """Store a paper's crawled content, e.g. after lazy extraction."""
+        arxiv_id = parse_arxiv_id(paper.get("main_page", ""))[0]
+        if arxiv_id is None or not paper.get("content"):
+            return
+        with self._connect() as conn:
+            self._write_content(conn, arxiv_id, paper)
+
+    def has_listing(self, field: str, date_str: str) -> bool:
+        row = self._connect().execute(
+            "SELECT 1 FROM listings WHERE field = ? AND announce_date = ?", (field, iso_date(date_str))
+        ).fetchone()
+        return row is not None
+
+    def view_source(self, category: str, date_str: str) -> Optional[str]:
+        """
+        The stored listing a category's papers for a day can be read from: the
+        category's own listing, else its field's listing, else None.
+        """
+        if self.has_listing(category, date_str):
+            return category
+        field = field_of(category)
+        if field != category and self.has_listing(field, date_str):
+            return field
+        return None
+
+    def _papers(self, joins: str, where: str, params: Tuple, with_content: bool) -> Iterator[Dict[str, Any]]:
+        columns = "p.record"
+        if with_content:
+            columns += ", c.content, c.sections, c.content_source"
+            joins += " LEFT JOIN paper_content c ON c.id = p.id"
+        # Rows are fetched now, on the calling thread's connection; records are
+        # decoded lazily, so the iterator may be consumed on another thread
+        rows = self._connect().execute(f"SELECT {columns} FROM papers p {joins} WHERE {where}", params).fetchall()
+        return (self._row_to_paper(row, with_content) for row in rows)
+
+    @staticmethod
+    def _row_to_paper(row: sqlite3.Row, with_content: bool) -> Dict[str, Any]:
+        paper = json.loads(row["record"])
+        if with_content and row["content"] is not None:
+            paper["content"] = row["content"]
+            if row["sections"]:
+                paper["sections"] = json.loads(row["sections"])
+            if row["content_source"]:
+                paper["content_source"] = row["content_source"]
+        return paper
+
+    def iter_listing(self, field: str, date_str: str, limit: Optional[int] = None,
+                     with_content: bool = True) -> Iterator[Dict[str, Any]]:
+        """Papers of a (field, date) listing in listing order."""
+        where = "l.field = ? AND l.announce_date = ? ORDER BY l.position"
+        params = (field, iso_date(date_str))
+        if limit:
+            where += " LIMIT ?"
+            params += (limit,)
+        return self._papers("JOIN listing_papers l ON l.id = p.id", where, params, with_content)
+
+    def iter_category(self, category: str, field: str, date_str: str, limit: Optional[int] = None,
+                      with_content: bool = True) -> Iterator[Dict[str, Any]]:
+        """
+        Papers of a field's (field, date) listing that are listed in category,
+        primary or cross-listed, in listing order: the category's view of a
+        listing page fetched once for the whole field.
+        """
+        where = ("l.field = ? AND l.announce_date = ? AND EXISTS "
+                 "(SELECT 1 FROM paper_categories pc WHERE pc.id = p.id AND pc.category = ?) ORDER BY l.position")
+        params = (field, iso_date(date_str), category)
+        if limit:
+            where += " LIMIT ?"
+            params += (limit,)
+        return self._papers("JOIN listing_papers l ON l.id = p.id", where, params, with_content)
+
+    def get(self, arxiv_id: str, with_content: bool = True) -> Optional[Dict[str, Any]]:
+        """The stored paper for an unversioned arXiv id, or None."""
+        return next(self._papers("", "p.id = ?", (arxiv_id,), with_content), None)
+
+    def get_content(self, arxiv_id: str) -> Optional[Tuple[str, Optional[Dict[str, str]], Optional[str]]]:
+        """(content, sections, content_source) for a paper, or None if no content is stored."""
+        row = self._connect().execute(
+            "SELECT content, sections, content_source FROM paper_content WHERE id = ?", (arxiv_id,)
+        ).fetchone()
+        if row is None or row["content"] is None:
+            return None
+        return row["content"], json.loads(row["sections"]) if row["sections"] else None, row["content_source"]
+
+    def content_count(self, since: str, until: str) -> int:
+        """Papers listed between two ISO dates (inclusive) that have stored full text."""
+        row = self._connect().execute(
+            "SELECT COUNT(DISTINCT c.id) FROM paper_content c JOIN listing_papers l ON l.id = c.id "
+            "WHERE l.announce_date BETWEEN ? AND ? AND c.content IS NOT NULL", (since, until)
+        ).fetchone()
+        return row[0]
+
+    def __contains__(self, arxiv_id: str) -> bool:
+        return self._connect().execute("SELECT 1 FROM papers WHERE id = ?", (arxiv_id,)).fetchone() is not None
+
+    def papers_in_category(
+        self,
+        category: str,
+        since: Optional[str] = None,
+        until: Optional[str] = None,
+        cross_lists: Optional[bool] = None,
+        with_content: bool = False
+    ) -> List[Dict[str, Any]]:
+        """
+        Papers in a category, newest first.
+
+        Args:
+            category: arXiv category, e.g. "cs.CV"
+            since, until: Inclusive announce dates, as 'YYYY-MM-DD' or 'Wed, 10 May 23'
+            cross_lists: True for cross-lists only, False for primary only, None for both
+            with_content: Also load full text
+        """
+        where = "pc.category = ?"
+        params = (category,)
+        if cross_lists is not None:
+            where += " AND pc.is_primary = ?"
+            params += (int(not cross_lists),)
+        if since:
+            where += " AND p.announce_date >= ?"
+            params += (as_iso_date(since),)
+        if until:
+            where += " AND p.announce_date <= ?"
+            params += (as_iso_date(until),)
+        where += " ORDER BY p.announce_date DESC, p.id"
+        return list(self._papers("JOIN paper_categories pc ON pc.id = p.id", where, params, with_content))
+
+    def import_file(self, file_path: str) -> Optional[int]:
+        """Import one paper file. Returns its paper count, or None if the name is not a paper file."""
+        parsed = parse_file_name(file_path)
+        if parsed is None:
+            return None
+        field, date_str = parsed
+        return self.add_listing(field, date_str, jsonl_store.iter_jsonl(file_path))
+
+    def import_jsonl(self, data_dir: str = DATA_DIR, overwrite: bool = False) -> Dict[str, int]:
+        """
+        One-shot import of every paper file in data_dir.
+
+        Args:
+            overwrite: Re-import listings that are already in the store
+
+        Returns:
+            {file path: papers imported}
+        """
+        imported = {}
+        for file_path in jsonl_store.list_files(data_dir):
+            parsed = parse_file_name(file_path)
+            if parsed is None or (not overwrite and self.has_listing(*parsed)):
+                continue
+            try:
+                imported[file_path] = self.import_file(file_path)
+            except (OSError, ValueError, EOFError) as e:
+                print(f"Skipping {file_path}: {e}")
+        return imported
+
+
+_default_store = None
+_store_lock = threading.Lock()
+
+
+def get_store() -> PaperStore:
+    """Return the shared store at STORE_PATH."""
+    global _default_store
+    with _store_lock:
+        if _default_store is None:
+            _default_store = PaperStore()
+        return _default_store
+
+
+def load_listing(field: str, date_str: str, limit: Optional[int] = None) -> Optional[Iterator[Dict[str, Any]]]:
+    """
+    Papers of a stored (field, date) listing, from SQLite when indexed and from
+    its JSONL file otherwise. A category without its own listing is read as a
+    view of its field's listing for that day, if that is stored.
+
+    Returns:
+        An iterator of papers, or None if the listing is not stored at all
+    """
+    store = get_store()
+    if store.has_listing(field, date_str):
+        return store.iter_listing(field, date_str, limit=limit)
+    file_path = listing_file_path(field, date_str)
+    if not os.path.exists(file_path):
+        source = store.view_source(field, date_str)
+        if source is not None:
+            return store.iter_category(field, source, date_str, limit=limit)
+        return None
+    papers = jsonl_store.iter_jsonl(file_path)
+    if limit:
+        return (paper for _, paper in zip(range(limit), papers))
+    return papers
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Import JSONL paper files into the SQLite paper store.")
+    parser.add_argument("--import", dest="import_files", action="store_true", help="Import paper files from --data-dir")
+    parser.add_argument("--data-dir", default=DATA_DIR)
+    parser.add_argument("--overwrite", action="store_true", help="Re-import listings already in the store")
+    args = parser.parse_args()
+
+    store = get_store()
+    if args.import_files:
+        imported = store.import_jsonl(args.data_dir, overwrite=args.overwrite)
+        print(f"Imported {sum(imported.values())} papers from {len(imported)} files into {store.path}")
+    conn = store._connect()
+    for table in ("papers", "paper_content", "listings"):
+        print(f"{table}: {conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]} rows")
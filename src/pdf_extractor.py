@@ -0,0 +1,167 @@
+"""
+PDF full-text fallback for papers without an arXiv HTML rendering.
+
+PDFs are downloaded through http_client and parsed with pypdf in a process
+pool, since text extraction is CPU-bound and would otherwise hold the GIL
+while the crawler threads wait. Each page contributes at most a fixed number
+of characters, reading stops at the references or once the overall budget is
+spent, and extracted text is cached on disk per paper version.
+
+Extraction can be checked against local files:
+    python src/pdf_extractor.py paper.pdf --page-budget 1500
+"""
+import argparse
+import io
+import os
+import re
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional
+from urllib.error import HTTPError
+
+import http_client
+import page_cache
+from paths import DATA_DIR
+from section_extractor import EXTRACT_CHAR_BUDGET
+
+try:
+    import pypdf
+    PYPDF_AVAILABLE = True
+except ImportError:
+    PYPDF_AVAILABLE = False
+
+# Characters kept per page, so one dense page cannot use up the whole budget
+PDF_PAGE_BUDGET = int(os.environ.get("ARXIV_PDF_PAGE_BUDGET", 2500))
+PDF_MAX_PAGES = int(os.environ.get("ARXIV_PDF_MAX_PAGES", 12))
+PDF_MAX_WORKERS = int(os.environ.get("ARXIV_PDF_WORKERS", min(4, os.cpu_count() or 1)))
+
+ARXIV_PDF_BASE = "https://arxiv.org/pdf/"
+TEXT_CACHE_DIR = os.path.join(DATA_DIR, "pdf_text_cache")
+
+_WHITESPACE = re.compile(r"\s+")
+# A line that starts the bibliography; nothing after it is worth prompt space
+_REFERENCES_HEADING = re.compile(r"^\s*(?:\d+\.?\s*)?(?:references|bibliography)\s*$", re.IGNORECASE | re.MULTILINE)
+
+_pool = None
+_pool_lock = threading.Lock()
+_text_cache = page_cache.PageCache(TEXT_CACHE_DIR)
+
+
+def pdf_link(arxiv_id: str, version: Optional[str] = None) -> str:
+    """arxiv.org/pdf link for a paper id, e.g. 'https://arxiv.org/pdf/2404.11972v1'."""
+    return ARXIV_PDF_BASE + arxiv_id + (version or "v1")
+
+
+def extract_pdf_text(
+    data: bytes,
+    page_budget: int = PDF_PAGE_BUDGET,
+    max_pages: int = PDF_MAX_PAGES,
+    budget: int = EXTRACT_CHAR_BUDGET
+) -> str:
+    """
+    Extract budget-bounded text from PDF bytes. Runs in the worker processes.
+
+    Args:
+        data: PDF file contents
+        page_budget: Maximum characters kept from each page
+        max_pages: Maximum number of pages read
+        budget: Maximum total characters
+
+    Returns:
+        The extracted text, pages separated by blank lines
+    """
+    reader = pypdf.PdfReader(io.BytesIO(data))
+    pages = []
+    remaining = budget
+    for page in reader.pages[:max_pages]:
+        text = page.extract_text() or ""
+        references = _REFERENCES_HEADING.search(text)
+        if references:
+            text = text[:references.start()]
+        text = _WHITESPACE.sub(" ", text).strip()[:min(page_budget, remaining)]
+        if text:
+            pages.append(text)
+            remaining -= len(text) + 2
+        if references or remaining <= 0:
+            break
+    return "\n\n".join(pages)
+
+
+def extract_pdf_file(path: str, page_budget: int = PDF_PAGE_BUDGET, max_pages: int = PDF_MAX_PAGES,
+                     budget: int = EXTRACT_CHAR_BUDGET) -> str:
+    """Extract text from a local PDF file in the process pool."""
+    with open(path, "rb") as f:
+        data = f.read()
+    return _extract_in_pool(data, page_budget, max_pages, budget)
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=max(1, PDF_MAX_WORKERS))
+        return _pool
+
+
+def _extract_in_pool(data: bytes, page_budget: int, max_pages: int, budget: int) -> str:
+    global _pool
+    pool = _get_pool()
+    try:
+        return pool.submit(extract_pdf_text, data, page_budget, max_pages, budget).result()
+    except BrokenProcessPool:
+        # A worker died (e.g. on a pathological PDF); start a fresh pool for the next paper
+        with _pool_lock:
+            if _pool is pool:
+                _pool = None
+        raise
+
+
+def crawl_pdf_text(
+    link: str,
+    page_budget: int = PDF_PAGE_BUDGET,
+    max_pages: int = PDF_MAX_PAGES,
+    budget: int = EXTRACT_CHAR_BUDGET
+) -> str:
+    """
+    Download a paper's PDF and extract its text, using the text cache when possible.
+
+    Returns:
+        The extracted text, or an error string if pypdf is missing or the PDF
+        can't be fetched or parsed
+    """
+    if not PYPDF_AVAILABLE:
+        return "Content not available in PDF format: pypdf is not installed"
+
+    # Versioned PDFs never change, so cached text only depends on the budgets
+    key = f"{page_cache.cache_key(link)}:{page_budget}:{max_pages}:{budget}"
+    cached, _ = _text_cache.load(key)
+    if cached is not None:
+        return cached.decode("utf-8")
+
+    try:
+        data = http_client.fetch(link).body
+    except HTTPError as e:
+        return f"Error accessing PDF: {str(e)}"
+    try:
+        text = _extract_in_pool(data, page_budget, max_pages, budget)
+    except Exception as e:
+        return f"Error fetching content: PDF extraction failed: {str(e)}"
+    if not text:
+        return "Content not available in PDF format"
+
+    _text_cache.store(key, link, text.encode("utf-8"), {})
+    return text
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Extract budget-bounded text from local PDF files.")
+    parser.add_argument("paths", nargs="+", help="PDF files")
+    parser.add_argument("--page-budget", type=int, default=PDF_PAGE_BUDGET)
+    parser.add_argument("--max-pages", type=int, default=PDF_MAX_PAGES)
+    parser.add_argument("--budget", type=int, default=EXTRACT_CHAR_BUDGET)
+    args = parser.parse_args()
+    for path in args.paths:
+        text = extract_pdf_file(path, args.page_budget, args.max_pages, args.budget)
+        print(f"== {path}: {len(text)} characters ==")
+        print(text)
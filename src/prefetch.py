@@ -0,0 +1,191 @@
+"""
+Background prefetch daemon that warms local paper data before digest time.
+
+After arXiv's daily announcement it polls each watched field's /new listing
+(cheap conditional GETs), and once a new listing appears it ingests it eagerly:
+the JSONL file, the full-text page cache and per-paper token counts. Gradio
+users and the scheduled action.py run then only read warm local data.
+
+Run with:
+    python -m src.prefetch                 # watch the config.yaml topic forever
+    python -m src.prefetch --fields cs math --once
+"""
+import argparse
+import datetime
+import logging
+import os
+import sys
+import time
+from typing import Dict, List, Optional
+
+import pytz
+import yaml
+
+# Modules in src/ import each other by bare name
+src_dir = os.path.dirname(os.path.abspath(__file__))
+if src_dir not in sys.path:
+    sys.path.insert(0, src_dir)
+
+import listing_parser
+import page_cache
+import paper_store
+import utils
+from download_new_papers import _iter_new_papers, listing_url, paper_file_path, today_str
+from paths import ROOT_DIR
+
+logger = logging.getLogger(__name__)
+
+ARXIV_TZ = pytz.timezone("America/New_York")
+# New listings go out at 20:00 ET, Sunday through Thursday
+ANNOUNCE_HOUR = 20
+ANNOUNCE_WEEKDAYS = (6, 0, 1, 2, 3)
+
+POLL_INTERVAL = float(os.environ.get("ARXIV_PREFETCH_POLL", 300))
+# Give up on a day's announcement this long after it was due
+POLL_WINDOW = float(os.environ.get("ARXIV_PREFETCH_WINDOW", 4 * 3600))
+TOKEN_MODEL = os.environ.get("ARXIV_PREFETCH_TOKEN_MODEL", "gpt-3.5-turbo")
+
+# config.yaml topic names (as in action.py) -> arXiv field
+TOPIC_FIELDS = {
+    "Mathematics": "math",
+    "Computer Science": "cs",
+    "Quantitative Biology": "q-bio",
+    "Quantitative Finance": "q-fin",
+    "Statistics": "stat",
+    "Electrical Engineering and Systems Science": "eess",
+    "Economics": "econ",
+    "Astrophysics": "astro-ph",
+    "Condensed Matter": "cond-mat",
+    "General Relativity and Quantum Cosmology": "gr-qc",
+    "High Energy Physics - Experiment": "hep-ex",
+    "High Energy Physics - Lattice": "hep-lat",
+    "High Energy Physics - Phenomenology": "hep-ph",
+    "High Energy Physics - Theory": "hep-th",
+    "Mathematical Physics": "math-ph",
+    "Nonlinear Sciences": "nlin",
+    "Nuclear Experiment": "nucl-ex",
+    "Nuclear Theory": "nucl-th",
+    "Physics": "physics",
+    "Quantum Physics": "quant-ph",
+}
+
+
+def configured_fields(config_path: str = os.path.join(ROOT_DIR, "config.yaml")) -> List[str]:
+    """Fields to watch: ARXIV_PREFETCH_FIELDS (comma separated), else the config.yaml topic."""
+    env_fields = os.environ.get("ARXIV_PREFETCH_FIELDS")
+    if env_fields:
+        return [field.strip() for field in env_fields.split(",") if field.strip()]
+    try:
+        with open(config_path, "r") as f:
+            topic = yaml.safe_load(f).get("topic")
+    except (OSError, yaml.YAMLError, AttributeError):
+        topic = None
+    return [TOPIC_FIELDS.get(topic, "cs")]
+
+
+def next_announcement(now: Optional[datetime.datetime] = None) -> datetime.datetime:
+    """The next listing announcement time (timezone-aware, arXiv time) at or after now."""
+    now = now or datetime.datetime.now(tz=ARXIV_TZ)
+    day = now.date()
+    while True:
+        announce = ARXIV_TZ.localize(datetime.datetime.combine(day, datetime.time(ANNOUNCE_HOUR)))
+        if day.weekday() in ANNOUNCE_WEEKDAYS and announce >= now:
+            return announce
+        day += datetime.timedelta(days=1)
+
+
+def token_counts(paper: Dict, model_name: str = TOKEN_MODEL) -> Dict[str, int]:
+    """Prompt cost of a paper: stage 1 (title + abstract) and stage 2 content."""
+    return {
+        "title_abstract": utils.count_tokens(f"{paper.get('title', '')}\n{paper.get('abstract', '')}", model_name),
+        "content": utils.count_tokens(paper.get("content", ""), model_name),
+    }
+
+
+def warm_field(field: str) -> Optional[str]:
+    """
+    Ingest a field's current listing if it is not on disk yet.
+
+    The listing page is revalidated through the page cache, so polling an
+    unchanged listing costs a 304.
+
+    Returns:
+        The listing date that was ingested, or None if it was already warm
+    """
+    page = page_cache.get_page(listing_url(field), revalidate=True)
+    date, _ = listing_parser.parse_listing(page)
+    try:
+        paper_store.iso_date(date)
+    except (TypeError, ValueError):
+        # Filing under an unparseable heading would fail after the crawl, on every poll
+        logger.warning(f"Unrecognized {field} listing date {date!r}, filing under today")
+        date = today_str()
+    if os.path.exists(paper_file_path(field, date)):
+        return None
+
+    logger.info(f"Prefetching {field} listing for {date}")
+    def add_token_counts(paper):
+        paper["token_counts"] = token_counts(paper)
+
+    count = 0
+    # The ingester stores each paper with its token counts once the listing is done
+    for _ in _iter_new_papers(field, content_mode="eager", page=page, date_str=date,
+                              annotate=add_token_counts):
+        count += 1
+    logger.info(f"Prefetched {count} {field} papers for {date}")
+    return date
+
+
+def run_once(fields: List[str]) -> Dict[str, Optional[str]]:
+    """Warm every field once. Returns field -> listing date ingested (None if already warm or failed)."""
+    results = {}
+    for field in fields:
+        try:
+            results[field] = warm_field(field)
+        except Exception as e:
+            logger.error(f"Prefetch failed for {field}: {e}")
+            results[field] = None
+    return results
+
+
+def run_forever(fields: List[str], poll_interval: float = POLL_INTERVAL, poll_window: float = POLL_WINDOW) -> None:
+    """Catch up now, then after each announcement poll until every field has its new listing."""
+    run_once(fields)
+    while True:
+        announce = next_announcement()
+        wait = (announce - datetime.datetime.now(tz=ARXIV_TZ)).total_seconds()
+        logger.info(f"Next announcement {announce:%a %d %b %H:%M %Z}, sleeping {wait / 3600:.1f}h")
+        time.sleep(max(0.0, wait))
+
+        pending = list(fields)
+        deadline = time.monotonic() + poll_window
+        while pending and time.monotonic() < deadline:
+            results = run_once(pending)
+            pending = [field for field in pending if results[field] is None]
+            if pending:
+                time.sleep(poll_interval)
+        if pending:
+            logger.warning(f"No new listing for {', '.join(pending)} within {poll_window / 3600:.1f}h")
+        # Step past this announcement before computing the next one
+        time.sleep(60)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prefetch arXiv listings, full text and token counts.")
+    parser.add_argument("--fields", type=str, nargs="+", default=None,
+                        help="Fields or categories to watch (default: ARXIV_PREFETCH_FIELDS or config.yaml topic)")
+    parser.add_argument("--once", action="store_true", help="Warm the current listings and exit")
+    parser.add_argument("--poll", type=float, default=POLL_INTERVAL, help="Seconds between polls after an announcement")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    fields = args.fields or configured_fields()
+    logger.info(f"Watching fields: {', '.join(fields)}")
+    if args.once:
+        run_once(fields)
+    else:
+        run_forever(fields, poll_interval=args.poll)
+
+
+if __name__ == "__main__":
+    main()
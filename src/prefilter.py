@@ -0,0 +1,177 @@
+"""
+Local similarity pre-filter run before the stage 1 LLM.
+
+Every paper used to be sent to the stage 1 relevancy prompt, including papers
+that share nothing with the interest text. Papers (title and abstract) and the
+interest are embedded as TF-IDF weighted, hashed word unigrams and bigrams in a
+SciPy sparse matrix and ranked by cosine similarity in one vectorized pass;
+only the best PREFILTER_TOP_N papers at or above PREFILTER_MIN_SIMILARITY go on
+to the LLM, in listing order. Nothing leaves the machine and a day of papers
+takes milliseconds.
+
+The pre-filter is off unless ARXIV_PREFILTER=1. Ranking needs every paper, so a
+paper stream (get_papers(..., stream=True)) is not ranked; each paper is scored
+against the interest as it arrives and only the similarity floor applies, so
+stage 1 still starts before ingestion finishes.
+"""
+import os
+import re
+import zlib
+from collections import Counter
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence
+
+import numpy as np
+
+try:
+    import scipy.sparse as sp
+    SCIPY_AVAILABLE = True
+except ImportError:
+    SCIPY_AVAILABLE = False
+
+# Set ARXIV_PREFILTER=1 to rank papers locally before stage 1
+PREFILTER_ENABLED = os.environ.get("ARXIV_PREFILTER", "0") == "1"
+# Most papers forwarded to stage 1 (0 = no cap; lists only, streams are not ranked)
+PREFILTER_TOP_N = int(os.environ.get("ARXIV_PREFILTER_TOP_N", 150))
+# Cosine similarity a paper needs to be forwarded (0 = no floor)
+PREFILTER_MIN_SIMILARITY = float(os.environ.get("ARXIV_PREFILTER_MIN_SIMILARITY", 0.0))
+# Hashed feature space; collisions are rare at this size for a few thousand abstracts
+N_FEATURES = 2 ** 20
+# Titles count this many times as much as the abstract
+TITLE_WEIGHT = 2
+
+_WORD = re.compile(r"[a-z0-9]+")
+_STOP_WORDS = frozenset("""
+a about above after again against all also am an and any are as at be because been before being below
+between both but by can could did do does doing down during each few for from further had has have
+having he her here hers him his how i if in into is it its itself just more most my no nor not now of
+off on once only or other our ours out over own paper papers propose proposed same she should show so
+some such than that the their theirs them then there these they this those through to too under until
+up very via was we were what when where which while who whom why will with would you your
+""".split())
+
+
+def tokens(text: str) -> List[str]:
+    """Lowercased words without stop words, followed by their adjacent-word bigrams."""
+    words = [word for word in _WORD.findall(text.lower()) if word not in _STOP_WORDS and len(word) > 1]
+    return words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+
+def _feature(token: str) -> int:
+    # crc32 is stable across processes, unlike hash()
+    return zlib.crc32(token.encode("utf-8")) % N_FEATURES
+
+
+def paper_text(paper: Dict[str, Any]) -> str:
+    return " ".join([paper.get("title", "")] * TITLE_WEIGHT + [paper.get("abstract", "")])
+
+
+def vectorize(texts: Sequence[str]) -> "sp.csr_matrix":
+    """
+    L2-normalized TF-IDF matrix of hashed unigram/bigram features, one row per text.
+    Term frequencies are sublinear (1 + log tf); IDF is smoothed and computed over texts.
+    """
+    rows, cols = [], []
+    for row, text in enumerate(texts):
+        features = [_feature(token) for token in tokens(text)]
+        rows.extend([row] * len(features))
+        cols.extend(features)
+    matrix = sp.csr_matrix(
+        (np.ones(len(cols), dtype=np.float32), (np.asarray(rows, dtype=np.int32), np.asarray(cols, dtype=np.int32))),
+        shape=(len(texts), N_FEATURES)
+    )
+    matrix.sum_duplicates()
+    matrix.data = 1.0 + np.log(matrix.data)
+
+    document_frequency = np.bincount(matrix.indices, minlength=N_FEATURES)
+    idf = np.log((1.0 + len(texts)) / (1.0 + document_frequency)) + 1.0
+    matrix.data *= idf[matrix.indices].astype(np.float32)
+
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+    norms[norms == 0] = 1.0
+    return sp.diags(1.0 / norms).dot(matrix).tocsr()
+
+
+def similarities(papers: Sequence[Dict[str, Any]], interest: str) -> np.ndarray:
+    """Cosine similarity of each paper's title and abstract to the interest text."""
+    # The interest is vectorized with the papers so it shares their IDF weights
+    matrix = vectorize([paper_text(paper) for paper in papers] + [interest])
+    return np.asarray(matrix[:-1].dot(matrix[-1].T).todense()).ravel()
+
+
+def _tf_vector(text: str) -> Dict[int, float]:
+    """L2-normalized sublinear TF vector of a single text, as {feature: weight}."""
+    counts = Counter(_feature(token) for token in tokens(text))
+    weights = {feature: 1.0 + np.log(count) for feature, count in counts.items()}
+    norm = np.sqrt(sum(weight * weight for weight in weights.values())) or 1.0
+    return {feature: weight / norm for feature, weight in weights.items()}
+
+
+def _iter_above_floor(papers: Iterable[Dict[str, Any]], interest: str,
+                      min_similarity: float) -> Iterator[Dict[str, Any]]:
+    # No IDF: it would need the whole stream, so papers are scored on term overlap alone
+    interest_vector = _tf_vector(interest)
+    kept = total = 0
+    for paper in papers:
+        total += 1
+        vector = _tf_vector(paper_text(paper))
+        similarity = sum(weight * interest_vector.get(feature, 0.0) for feature, weight in vector.items())
+        if similarity < min_similarity:
+            continue
+        paper["prefilter_similarity"] = round(float(similarity), 4)
+        kept += 1
+        yield paper
+    print(f"Similarity pre-filter kept {kept} of {total} streamed papers for stage 1 "
+          f"({total - kept} below similarity {min_similarity})")
+
+
+def prefilter_papers(
+    papers: Iterable[Dict[str, Any]],
+    interest: str,
+    top_n: Optional[int] = None,
+    min_similarity: Optional[float] = None
+) -> Iterable[Dict[str, Any]]:
+    """
+    Papers plausibly relevant to the interest, in listing order.
+
+    Args:
+        papers: Paper dicts. A list is ranked and cut to top_n; any other
+            iterable (a paper stream) is filtered lazily by min_similarity only.
+        interest: The user's research interest text
+        top_n: Most papers to keep from a list (default PREFILTER_TOP_N, 0 for all)
+        min_similarity: Lowest cosine similarity to keep (default PREFILTER_MIN_SIMILARITY)
+
+    Returns:
+        The kept papers, a list for a list and a generator for a stream. Each
+        gets a 'prefilter_similarity' field.
+    """
+    top_n = PREFILTER_TOP_N if top_n is None else top_n
+    min_similarity = PREFILTER_MIN_SIMILARITY if min_similarity is None else min_similarity
+    if not interest.strip():
+        return papers
+    if not isinstance(papers, list):
+        return _iter_above_floor(papers, interest, min_similarity)
+    if not papers:
+        return papers
+    if not SCIPY_AVAILABLE:
+        print("scipy is not installed; skipping the similarity pre-filter")
+        return papers
+
+    scores = similarities(papers, interest)
+    # Stable sort keeps listing order among equal scores
+    order = np.argsort(-scores, kind="stable")
+    if min_similarity > 0:
+        order = order[scores[order] >= min_similarity]
+    above_floor = len(order)
+    if top_n:
+        order = order[:top_n]
+
+    kept = []
+    # The most similar papers are kept, but handed on in listing order
+    for index in np.sort(order):
+        paper = papers[index]
+        paper["prefilter_similarity"] = round(float(scores[index]), 4)
+        kept.append(paper)
+    print(f"Similarity pre-filter kept {len(kept)} of {len(papers)} papers for stage 1, dropped "
+          f"{len(papers) - above_floor} below similarity {min_similarity} and "
+          f"{above_floor - len(kept)} past the top {top_n}")
+    return kept
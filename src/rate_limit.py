@@ -0,0 +1,301 @@
+"""
+Shared request pacing for arXiv I/O and LLM APIs.
+Every HTTP request made through http_client passes through one HostLimiter,
+which combines a token bucket per host, exponential backoff that honours
+Retry-After on 429/503 responses, and a small per-host circuit breaker.
+LLM providers are paced by a ModelRateLimiter per provider, which keeps both
+their requests-per-minute and tokens-per-minute limits.
+"""
+import email.utils
+import os
+import random
+import threading
+import time
+from typing import Dict, Optional
+from urllib.error import URLError
+
+# Steady-state requests per second per host, and the burst allowed on top
+DEFAULT_RATE = float(os.environ.get("ARXIV_CRAWL_RPS", 4))
+DEFAULT_BURST = float(os.environ.get("ARXIV_CRAWL_BURST", 4))
+# Hosts with their own published limits (the export API asks for one request every 3 seconds)
+HOST_RATES = {
+    "export.arxiv.org": 1 / 3,
+}
+
+# Responses that mean "slow down / try again later"
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+MAX_RETRIES = int(os.environ.get("ARXIV_HTTP_RETRIES", 4))
+BACKOFF_BASE = float(os.environ.get("ARXIV_BACKOFF_BASE", 1.0))
+BACKOFF_CAP = float(os.environ.get("ARXIV_BACKOFF_CAP", 60.0))
+# Longest Retry-After we are willing to wait on a single attempt
+MAX_RETRY_AFTER = float(os.environ.get("ARXIV_MAX_RETRY_AFTER", 300.0))
+
+BREAKER_THRESHOLD = int(os.environ.get("ARXIV_BREAKER_THRESHOLD", 5))
+BREAKER_RESET = float(os.environ.get("ARXIV_BREAKER_RESET", 60.0))
+
+
+class CircuitOpenError(URLError):
+    """Raised instead of sending a request to a host whose circuit breaker is open."""
+    def __init__(self, host: str, retry_in: float):
+        super().__init__(f"circuit open for {host}, retry in {retry_in:.0f}s")
+        self.host = host
+        self.retry_in = retry_in
+
+
+class TokenBucket:
+    """Thread-safe token bucket. reserve() books capacity and says how long to wait for it."""
+    def __init__(self, rate: float, burst: float = 1.0):
+        self.rate = rate
+        self.burst = max(1.0, burst)
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, cost: float = 1.0) -> float:
+        """
+        Take `cost` tokens, going into debt if needed.
+
+        Returns:
+            Seconds the caller must wait before using the reservation
+        """
+        if self.rate <= 0:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= cost
+            return max(0.0, -self._tokens / self.rate)
+
+    def acquire(self, cost: float = 1.0) -> None:
+        """Blocking version of reserve()."""
+        delay = self.reserve(cost)
+        if delay > 0:
+            time.sleep(delay)
+
+
+class ModelRateLimiter:
+    """
+    Client-side requests/minute and tokens/minute buckets for one LLM provider.
+    Providers that limit output tokens separately (Anthropic's OTPM) get a third bucket.
+    """
+    def __init__(self, rpm: float, tpm: float, output_tpm: Optional[float] = None):
+        # Bursts of up to a tenth of a minute's budget, then a steady rate
+        self.requests = TokenBucket(rpm / 60, burst=rpm / 10)
+        self.tokens = TokenBucket(tpm / 60, burst=tpm / 10)
+        self.output_tokens = TokenBucket(output_tpm / 60, burst=output_tpm / 10) if output_tpm else None
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens: int, output_tokens: int = 0) -> None:
+        """
+        Wait until one request fits under every limit.
+
+        Args:
+            tokens: Estimated tokens of the request (prompt, plus the response
+                when the provider counts both in one limit)
+            output_tokens: Most tokens the response can use; counted against
+                tpm when there is no separate output limit
+        """
+        if self.output_tokens is None:
+            tokens += output_tokens
+        delays = [self.requests.reserve(1), self.tokens.reserve(tokens)]
+        if self.output_tokens is not None:
+            delays.append(self.output_tokens.reserve(output_tokens))
+        with self._lock:
+            delays.append(self._paused_until - time.monotonic())
+        delay = max(delays)
+        if delay > 0:
+            time.sleep(delay)
+
+    def refund(self, tokens: int = 0, output_tokens: int = 0) -> None:
+        """Give back tokens reserved by acquire() but not used, e.g. max_tokens minus actual output."""
+        if self.output_tokens is None:
+            tokens += output_tokens
+        elif output_tokens > 0:
+            self.output_tokens.reserve(-output_tokens)
+        if tokens > 0:
+            self.tokens.reserve(-tokens)
+
+    def pause(self, seconds: float) -> None:
+        """Hold every request for `seconds`, e.g. after a 429 with Retry-After."""
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive failures and rejects calls for
+    `reset_timeout` seconds, then lets a single trial call through (half-open).
+    """
+    def __init__(self, failure_threshold: int = BREAKER_THRESHOLD, reset_timeout: float = BREAKER_RESET):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._state(time.monotonic())
+
+    def _state(self, now: float) -> str:
+        if self._opened_at is None:
+            return "closed"
+        if now - self._opened_at >= self.reset_timeout:
+            return "half-open"
+        return "open"
+
+    def allow(self) -> float:
+        """
+        Returns:
+            0 if a call may proceed, otherwise seconds until the breaker half-opens
+        """
+        with self._lock:
+            now = time.monotonic()
+            state = self._state(now)
+            if state == "closed":
+                return 0.0
+            if state == "half-open" and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return 0.0
+            return max(1.0, self.reset_timeout - (now - self._opened_at))
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if self._trial_in_flight or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+            self._trial_in_flight = False
+
+
+def retry_after_seconds(value: Optional[str]) -> Optional[float]:
+    """Parse a Retry-After header (delta-seconds or HTTP-date) into seconds."""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, when.timestamp() - time.time())
+
+
+def backoff_delay(attempt: int, retry_after: Optional[float] = None,
+                  base: float = BACKOFF_BASE, cap: float = BACKOFF_CAP) -> float:
+    """
+    Delay before retry number `attempt` (0-based): the server's Retry-After when
+    given, otherwise exponential backoff with full jitter.
+    """
+    if retry_after is not None:
+        return min(retry_after, MAX_RETRY_AFTER)
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+class _HostState:
+    def __init__(self, rate: float, burst: float):
+        self.bucket = TokenBucket(rate, burst)
+        self.breaker = CircuitBreaker()
+        self.paused_until = 0.0
+
+
+class HostLimiter:
+    """Per-host token buckets, Retry-After pauses and circuit breakers."""
+    def __init__(self, default_rate: float = DEFAULT_RATE, default_burst: float = DEFAULT_BURST,
+                 host_rates: Optional[Dict[str, float]] = None):
+        self.default_rate = default_rate
+        self.default_burst = default_burst
+        self.host_rates = dict(HOST_RATES if host_rates is None else host_rates)
+        self._hosts = {}
+        self._lock = threading.Lock()
+
+    def _host(self, host: str) -> _HostState:
+        with self._lock:
+            state = self._hosts.get(host)
+            if state is None:
+                rate = self.host_rates.get(host, self.default_rate)
+                burst = self.default_burst if host not in self.host_rates else 1.0
+                state = self._hosts[host] = _HostState(rate, burst)
+            return state
+
+    def configure(self, host: str, rate: float, burst: Optional[float] = None) -> None:
+        """Set the request rate for a host (requests per second; 0 disables pacing)."""
+        with self._lock:
+            self.host_rates[host] = rate
+            self._hosts.pop(host, None)
+        if burst is not None:
+            self._host(host).bucket.burst = max(1.0, burst)
+
+    def reserve(self, host: str, check_breaker: bool = True) -> float:
+        """
+        Book the next request slot for a host.
+
+        Args:
+            host: Host name
+            check_breaker: Consult the host's circuit breaker; retries of a
+                request that was already let through skip it
+
+        Returns:
+            Seconds to wait before sending
+
+        Raises:
+            CircuitOpenError if the host's breaker is open
+        """
+        state = self._host(host)
+        if check_breaker:
+            retry_in = state.breaker.allow()
+            if retry_in:
+                raise CircuitOpenError(host, retry_in)
+        pause = max(0.0, state.paused_until - time.monotonic())
+        return pause + state.bucket.reserve()
+
+    def wait(self, host: str) -> None:
+        """Blocking version of reserve()."""
+        delay = self.reserve(host)
+        if delay > 0:
+            time.sleep(delay)
+
+    def record_success(self, host: str) -> None:
+        self._host(host).breaker.record_success()
+
+    def record_failure(self, host: str, attempt: int, retry_after: Optional[str] = None) -> float:
+        """
+        Record a throttled or failed attempt.
+
+        Returns:
+            Seconds to back off before retrying. A Retry-After pauses every
+            request to the host, not just this one.
+        """
+        state = self._host(host)
+        seconds = retry_after_seconds(retry_after)
+        delay = backoff_delay(attempt, seconds)
+        if seconds is not None:
+            with self._lock:
+                state.paused_until = max(state.paused_until, time.monotonic() + delay)
+        return delay
+
+    def record_request_failure(self, host: str) -> None:
+        """
+        Record a request that failed after all its retries. Only these count
+        towards the circuit breaker, so one bad URL retried MAX_RETRIES times
+        does not open the breaker for every other URL on the host.
+        """
+        self._host(host).breaker.record_failure()
+
+
+_default_limiter = HostLimiter()
+
+
+def get_limiter() -> HostLimiter:
+    """Return the limiter shared by every fetch path."""
+    return _default_limiter
@@ -6,16 +6,23 @@ python -m relevancy run_all_day_paper \
 import time
 import json
 import os
+import queue
 import random
 import re
 import string
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
 import numpy as np
 import tqdm
+import llm_cache
+import paper_store
+import prefilter
 import utils
 
-from paths import DATA_DIR
+PROMPT_FILE = "src/relevancy_prompt.txt"
+FILTER_PROMPT_FILE = "src/relevancy_filter_prompt.txt"
 
 
 def encode_prompt(query, prompt_papers, include_content=True):
@@ -27,13 +34,9 @@ def encode_prompt(query, prompt_papers, include_content=True):
         prompt_papers: List of paper dictionaries
         include_content: Whether to include the full content field (False for stage 1 filtering)
     """
-    # Use different prompt templates for each stage
-    if include_content:
-        # Stage 2: Full analysis with content
-        prompt = open("src/relevancy_prompt.txt").read() + "\n"
-    else:
-        # Stage 1: Quick relevancy scoring with just title and abstract
-        prompt = open("src/relevancy_filter_prompt.txt").read() + "\n"
+    # Use different prompt templates for each stage: full analysis with content
+    # for stage 2, quick relevancy scoring with just title and abstract for stage 1
+    prompt = open(PROMPT_FILE if include_content else FILTER_PROMPT_FILE).read() + "\n"
     
     prompt += query['interest']
 
@@ -117,9 +120,12 @@ def extract_json_from_string(text):
     print(f"Found {len(json_objects)} JSON objects in the response")
     return json_objects
 
-def post_process_chat_gpt_response(paper_data, response, threshold_score=0):
+def post_process_chat_gpt_response(paper_data, response, threshold_score=0, cache_keys=None):
     """
     Completely rewritten parsing function that handles the OpenAI response better
+
+    cache_keys, if given, holds an llm_cache key per paper; parsed results are
+    stored under them when the response has exactly one result per paper.
     """
     selected_data = []
     if response is None:
@@ -178,6 +184,13 @@ def post_process_chat_gpt_response(paper_data, response, threshold_score=0):
                     pass
     
     print(f"Found {len(score_items)} score items from response")
+
+    # Only cache a response whose results line up one-to-one with the papers;
+    # default and fallback items below are never cached
+    if cache_keys is not None and len(score_items) == len(paper_data):
+        cache = llm_cache.get_cache()
+        for key, inst in zip(cache_keys, score_items):
+            cache.put(key, inst)
     
     # If we have no score items but have paper data, create default ones
     if len(score_items) == 0 and len(paper_data) > 0:
@@ -210,14 +223,6 @@ def post_process_chat_gpt_response(paper_data, response, threshold_score=0):
     else:
         hallucination = False
 
-    # Define expected analysis fields we want to ensure are copied to the paper objects
-    analysis_fields = [
-        "Relevancy score", "Reasons for match", "Key innovations", "Critical analysis",
-        "Goal", "Data", "Methodology", "Implementation details", "Experiments & Results",
-        "Git", "Discussion & Next steps", "Related work", "Practical applications", 
-        "Key takeaways"
-    ]
-
     print(f"DEBUG: Processing {len(score_items)} score items for {len(paper_data)} papers")
     
     # If we don't have any score items but have papers, something went wrong with parsing
@@ -256,29 +261,7 @@ def post_process_chat_gpt_response(paper_data, response, threshold_score=0):
             print(f"DEBUG: Skipping paper {idx+1} with score {relevancy_score} < threshold {threshold_score}")
             continue
             
-        # Create detailed output string for logging and console display
-        output_str = "Subject: " + paper_data[idx]["subjects"] + "\n"
-        output_str += "Title: " + paper_data[idx]["title"] + "\n"
-        output_str += "Authors: " + paper_data[idx]["authors"] + "\n"
-        output_str += "Link: " + paper_data[idx]["main_page"] + "\n"
-        
-        # Copy all fields from the analysis to the paper object
-        for key, value in inst.items():
-            paper_data[idx][key] = value
-            output_str += str(key) + ": " + str(value) + "\n"
-            
-        # Ensure all expected analysis fields are present in the paper object
-        # This ensures fields used in the HTML template like "Key innovations" are set
-        for field in analysis_fields:
-            if field in inst:
-                # Double-check the field got copied (should be redundant with the loop above)
-                paper_data[idx][field] = inst[field]
-                print(f"Found and copied field: {field}")
-            else:
-                print(f"Missing analysis field: {field}")
-                paper_data[idx][field] = "Not available in analysis"
-        
-        paper_data[idx]['summarized_text'] = output_str
+        apply_result(paper_data[idx], inst)
         selected_data.append(paper_data[idx])
         print(f"DEBUG: Added paper {idx+1} to selected_data (now has {len(selected_data)} papers)")
         
@@ -288,6 +271,68 @@ def post_process_chat_gpt_response(paper_data, response, threshold_score=0):
     return selected_data, hallucination
 
 
+# Expected analysis fields we want to ensure are copied to the paper objects
+ANALYSIS_FIELDS = [
+    "Relevancy score", "Reasons for match", "Key innovations", "Critical analysis",
+    "Goal", "Data", "Methodology", "Implementation details", "Experiments & Results",
+    "Git", "Discussion & Next steps", "Related work", "Practical applications", 
+    "Key takeaways"
+]
+
+
+def apply_result(paper, inst):
+    """Copy one parsed analysis result onto a paper, filling in missing fields."""
+    # Create detailed output string for logging and console display
+    output_str = "Subject: " + paper["subjects"] + "\n"
+    output_str += "Title: " + paper["title"] + "\n"
+    output_str += "Authors: " + paper["authors"] + "\n"
+    output_str += "Link: " + paper["main_page"] + "\n"
+    
+    # Copy all fields from the analysis to the paper object
+    for key, value in inst.items():
+        paper[key] = value
+        output_str += str(key) + ": " + str(value) + "\n"
+        
+    # Ensure all expected analysis fields are present in the paper object
+    # This ensures fields used in the HTML template like "Key innovations" are set
+    for field in ANALYSIS_FIELDS:
+        if field in inst:
+            # Double-check the field got copied (should be redundant with the loop above)
+            paper[field] = inst[field]
+            print(f"Found and copied field: {field}")
+        else:
+            print(f"Missing analysis field: {field}")
+            paper[field] = "Not available in analysis"
+    
+    paper['summarized_text'] = output_str
+    return paper
+
+
+def cached_results(papers, query, model_name, include_content):
+    """
+    Answer papers from the LLM result cache where possible.
+
+    Returns:
+        (cached papers with their stored results applied, papers still to send,
+        cache keys of the papers to send)
+    """
+    stage = "analysis" if include_content else "filter"
+    prompt_hash = llm_cache.file_hash(PROMPT_FILE if include_content else FILTER_PROMPT_FILE)
+    cache = llm_cache.get_cache()
+    hits, misses, miss_keys = [], [], []
+    for paper in papers:
+        key = llm_cache.result_key(paper, query, model_name, stage, prompt_hash)
+        result = cache.get(key)
+        if result is None:
+            misses.append(paper)
+            miss_keys.append(key)
+        else:
+            hits.append(apply_result(paper, result))
+    if hits:
+        print(f"{len(hits)} of {len(papers)} papers answered from the LLM result cache")
+    return hits, misses, miss_keys
+
+
 def find_word_in_string(w, s):
     return re.compile(r"\b({0})\b".format(w), flags=re.IGNORECASE).search(s)
 
@@ -297,36 +342,58 @@ def process_subject_fields(subjects):
     all_subjects = [s.split(" (")[0] for s in all_subjects]
     return all_subjects
 
-def filter_papers_by_relevance(
-    all_papers,
-    query,
-    model_name="gpt-3.5-turbo-16k",
-    threshold_score=2,
-    num_paper_in_prompt=8,  # Fixed at 8 papers per prompt as requested
-    temperature=0.3,  # Lower temperature for more consistent relevancy scoring
-    top_p=1.0,
-    max_papers=10  # Try to find at least this many papers that meet the threshold
-):
+def _batched(papers, size):
+    batch = []
+    for paper in papers:
+        batch.append(paper)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _prefetched(papers, max_buffer=256):
     """
-    Stage 1: Filter papers by relevance using only title and abstract
-    Returns only papers that meet or exceed the threshold score
+    Pull papers from a (possibly slow) iterable on a background thread, so
+    listing parsing and crawling keep going while an LLM request is in flight.
     """
-    filtered_papers = []
-    print(f"\n===== STAGE 1: FILTERING PAPERS BY RELEVANCE (THRESHOLD >= {threshold_score}) =====")
-    
-    for id in tqdm.tqdm(range(0, len(all_papers), num_paper_in_prompt), desc="Stage 1: Relevancy filtering"):
-        batch_papers = all_papers[id:id+num_paper_in_prompt]
-        
+    buffer = queue.Queue(maxsize=max_buffer)
+    done = object()
+
+    def _produce():
+        try:
+            for paper in papers:
+                buffer.put(paper)
+        except Exception as e:
+            buffer.put(e)
+        buffer.put(done)
+
+    threading.Thread(target=_produce, name="paper-prefetch", daemon=True).start()
+    while True:
+        item = buffer.get()
+        if item is done:
+            return
+        if isinstance(item, Exception):
+            raise item
+        yield item
+
+
+def _score_batch(batch_papers, query, model_name, temperature, top_p):
+    """Stage 1 scores for one batch of papers, from the cache or one LLM request."""
+    # Papers scored before for this interest, model and prompt cost nothing
+    batch_data, papers_to_send, cache_keys = cached_results(batch_papers, query, model_name, include_content=False)
+    if papers_to_send:
         # Create prompt without content for quick relevancy filtering
-        prompt = encode_prompt(query, batch_papers, include_content=False)
-        
+        prompt = encode_prompt(query, papers_to_send, include_content=False)
+
         decoding_args = utils.OpenAIDecodingArguments(
             temperature=temperature,
             n=1,
             max_tokens=512,  # Less tokens needed for just scoring
             top_p=top_p,
         )
-        
+
         request_start = time.time()
         response = utils.openai_completion(
             prompts=prompt,
@@ -335,17 +402,64 @@ def filter_papers_by_relevance(
             decoding_args=decoding_args,
             logit_bias={"100257": -100},  # prevent the <|endoftext|> from being generated
         )
-        
+
         request_duration = time.time() - request_start
         print(f"Stage 1 batch took {request_duration:.2f}s")
-        
+
         # Extract just the relevancy scores
-        process_start = time.time()
-        batch_data, _ = post_process_chat_gpt_response(
-            batch_papers, 
+        sent_data, _ = post_process_chat_gpt_response(
+            papers_to_send, 
             response, 
-            threshold_score=0  # Don't filter yet, we want all scores
+            threshold_score=0,  # Don't filter yet, we want all scores
+            cache_keys=cache_keys
         )
+        batch_data = batch_data + sent_data
+    return batch_data
+
+
+def filter_papers_by_relevance(
+    all_papers,
+    query,
+    model_name="gpt-3.5-turbo-16k",
+    threshold_score=2,
+    num_paper_in_prompt=8,  # Fixed at 8 papers per prompt as requested
+    temperature=0.3,  # Lower temperature for more consistent relevancy scoring
+    top_p=1.0,
+    max_papers=10,  # Try to find at least this many papers that meet the threshold
+    use_prefilter=None
+):
+    """
+    Stage 1: Filter papers by relevance using only title and abstract
+    Returns only papers that meet or exceed the threshold score
+
+    all_papers may be a list or any iterable (e.g. get_papers(..., stream=True));
+    a batch is sent as soon as num_paper_in_prompt papers have arrived.
+
+    With use_prefilter (default: prefilter.PREFILTER_ENABLED, off unless
+    ARXIV_PREFILTER=1), papers are first compared with the interest locally and
+    only the plausible ones are sent: a list is ranked and cut to the top
+    PREFILTER_TOP_N, a stream keeps streaming and only the similarity floor applies.
+    """
+    filtered_papers = []
+    seen_papers = []
+    print(f"\n===== STAGE 1: FILTERING PAPERS BY RELEVANCE (THRESHOLD >= {threshold_score}) =====")
+    
+    if prefilter.PREFILTER_ENABLED if use_prefilter is None else use_prefilter:
+        all_papers = prefilter.prefilter_papers(all_papers, query["interest"])
+    
+    paper_source = all_papers if isinstance(all_papers, list) else _prefetched(all_papers)
+    # Batches are sent as soon as they fill up and run concurrently (utils paces
+    # the requests); their results are handled in listing order below
+    scored_batches = []
+    with ThreadPoolExecutor(max_workers=utils.OPENAI_MAX_CONCURRENCY) as executor:
+        for batch_papers in _batched(paper_source, num_paper_in_prompt):
+            seen_papers.extend(batch_papers)
+            future = executor.submit(_score_batch, batch_papers, query, model_name, temperature, top_p)
+            scored_batches.append((batch_papers, future))
+    
+    for batch_papers, future in tqdm.tqdm(scored_batches, desc="Stage 1: Relevancy filtering"):
+        batch_data = future.result()
+        process_start = time.time()
         
         # Keep only papers that meet or exceed the threshold
         # Make sure we have the same number of scores as papers
@@ -396,15 +510,15 @@ def filter_papers_by_relevance(
                     print(f"FILTERED OUT: Paper '{paper['title'][:50]}...' with score {relevancy_score}")
                 
         print(f"Post-processing took {time.time() - process_start:.2f}s")
-        print(f"Filtered papers so far: {len(filtered_papers)} out of {id + len(batch_papers)}")
+        print(f"Filtered papers so far: {len(filtered_papers)} out of {len(seen_papers)}")
     
-    print(f"\nStage 1 complete: {len(filtered_papers)} papers met the threshold of {threshold_score} out of {len(all_papers)}")
+    print(f"\nStage 1 complete: {len(filtered_papers)} papers met the threshold of {threshold_score} out of {len(seen_papers)}")
     
     # If we didn't find enough papers, adjust threshold downward and include more
     if len(filtered_papers) < max_papers and threshold_score > 1:
         # Find the highest-scored papers that didn't meet the threshold
-        remaining_scores = {}
-        for paper in all_papers:
+        remaining_scores = []
+        for paper in seen_papers:
             if paper not in filtered_papers:
                 score = paper.get("Relevancy score", 0)
                 if isinstance(score, str):
@@ -412,15 +526,14 @@ def filter_papers_by_relevance(
                         score = int(score)
                     except (ValueError, TypeError):
                         score = 0
-                remaining_scores[paper] = score
+                remaining_scores.append((score, paper))
         
-        # Sort the remaining papers by score (descending)
-        sorted_papers = sorted(remaining_scores.keys(), key=lambda p: remaining_scores[p], reverse=True)
+        # Sort the remaining papers by score (descending); paper dicts aren't hashable
+        remaining_scores.sort(key=lambda item: item[0], reverse=True)
         
         # Add the highest-scored papers until we reach max_papers or run out of papers
-        papers_to_add = sorted_papers[:max_papers - len(filtered_papers)]
-        for paper in papers_to_add:
-            score = remaining_scores[paper]
+        papers_to_add = remaining_scores[:max_papers - len(filtered_papers)]
+        for score, paper in papers_to_add:
             print(f"Adding paper '{paper['title'][:50]}...' with score {score} (below threshold) to meet minimum paper count")
             filtered_papers.append(paper)
         
@@ -454,35 +567,47 @@ def analyze_papers_in_depth(
             model_name=model_name
         )
     
-    # Otherwise use OpenAI
-    for id in tqdm.tqdm(range(0, len(filtered_papers), num_paper_in_prompt), desc="Stage 2: Detailed analysis"):
+    # Otherwise use OpenAI. Cached papers are answered from disk; the rest go
+    # out as one prompt per batch, sent concurrently and returned in order
+    batches = []
+    for id in range(0, len(filtered_papers), num_paper_in_prompt):
         batch_papers = filtered_papers[id:id+num_paper_in_prompt]
         
-        # Create prompt with content for detailed analysis
-        prompt = encode_prompt(query, batch_papers, include_content=True)
-        
-        decoding_args = utils.OpenAIDecodingArguments(
-            temperature=temperature,
-            n=1,
-            max_tokens=1024*num_paper_in_prompt,
-            top_p=top_p,
-        )
-        
-        request_start = time.time()
-        response = utils.openai_completion(
-            prompts=prompt,
-            model_name=model_name,
-            batch_size=1,
-            decoding_args=decoding_args,
-            logit_bias={"100257": -100},  # prevent the <|endoftext|> from being generated
-        )
-        
-        request_duration = time.time() - request_start
-        print(f"Stage 2 batch took {request_duration:.2f}s")
-        
+        cached_papers, batch_papers, cache_keys = cached_results(batch_papers, query, model_name, include_content=True)
+        analyzed_papers.extend(cached_papers)
+        if batch_papers:
+            batches.append((batch_papers, cache_keys))
+    if not batches:
+        print(f"\nStage 2 complete: {len(analyzed_papers)} papers fully analyzed")
+        return analyzed_papers
+    
+    # Create prompts with content for detailed analysis
+    prompts = [encode_prompt(query, batch_papers, include_content=True) for batch_papers, _ in batches]
+    
+    decoding_args = utils.OpenAIDecodingArguments(
+        temperature=temperature,
+        n=1,
+        max_tokens=1024*num_paper_in_prompt,
+        top_p=top_p,
+    )
+    
+    request_start = time.time()
+    responses = utils.openai_completion(
+        prompts=prompts,
+        model_name=model_name,
+        batch_size=1,
+        decoding_args=decoding_args,
+        logit_bias={"100257": -100},  # prevent the <|endoftext|> from being generated
+    )
+    
+    request_duration = time.time() - request_start
+    print(f"Stage 2 requests took {request_duration:.2f}s for {len(prompts)} batches")
+    
+    for (batch_papers, cache_keys), response in tqdm.tqdm(zip(batches, responses), desc="Stage 2: Detailed analysis",
+                                                           total=len(batches)):
         # Process the detailed analysis
         process_start = time.time()
-        batch_data, _ = post_process_chat_gpt_response(batch_papers, response, threshold_score=0)
+        batch_data, _ = post_process_chat_gpt_response(batch_papers, response, threshold_score=0, cache_keys=cache_keys)
         analyzed_papers.extend(batch_data)
         
         print(f"Post-processing took {time.time() - process_start:.2f}s")
@@ -526,48 +651,16 @@ def generate_relevance_score(
         print("No papers passed the relevance threshold. Returning empty results.")
         return [], False
     
-    # Before Stage 2: Extract HTML content for papers that passed the filter
+    # Before Stage 2: Fetch full content, only for papers that passed the filter.
+    # Ingestion stores metadata only, so this is the first and only crawl per paper.
     print(f"\n===== EXTRACTING HTML CONTENT FOR {len(filtered_papers)} PAPERS =====")
-    for i, paper in enumerate(filtered_papers):
-        try:
-            # Extract HTML content from the paper URL
-            from download_new_papers import crawl_html_version
-            
-            # Get the paper ID from the main_page URL
-            paper_id = None
-            main_page = paper.get("main_page", "")
-            if main_page:
-                # Extract paper ID (e.g., 2401.12345)
-                import re
-                id_match = re.search(r'/abs/([0-9v.]+)', main_page)
-                if id_match:
-                    paper_id = id_match.group(1)
-            
-            if paper_id:
-                # Construct HTML link
-                html_link = f"https://arxiv.org/html/{paper_id}"
-                print(f"Fetching HTML content for paper {i+1}/{len(filtered_papers)}: {paper['title'][:50]}...")
-                print(f"HTML link: {html_link}")
-                
-                # Try to get content
-                content = crawl_html_version(html_link)
-                if content and len(content) > 100 and "Error accessing HTML" not in content:
-                    paper["content"] = content
-                    print(f"✅ Successfully extracted {len(content)} characters of content")
-                else:
-                    # If HTML version fails, use the abstract + more details
-                    paper["content"] = f"{paper.get('abstract', '')} {paper.get('title', '')}"
-                    print(f"⚠️ Failed to extract content, using abstract instead. Error: {content[:100]}...")
-                time.sleep(3)
-            else:
-                print(f"⚠️ Couldn't parse paper ID from URL: {main_page}")
-                paper["content"] = paper.get("abstract", "No content available")
-                
-        except Exception as e:
-            print(f"❌ Error extracting HTML content: {str(e)}")
-            # Fallback to using the abstract
-            paper["content"] = paper.get("abstract", "No content available")
-            
+    from download_new_papers import ensure_contents
+    ensure_contents(filtered_papers)
+    for paper in filtered_papers:
+        if paper.get("content_source") == "abstract":
+            print(f"⚠️ No HTML content for '{paper['title'][:50]}...', using abstract instead")
+        elif paper.get("content_source") == "pdf":
+            print(f"No HTML content for '{paper['title'][:50]}...', using PDF text instead")
     print(f"Content extraction complete for {len(filtered_papers)} papers.")
     
     # Stage 2: In-depth analysis (Gemini or fallback to OpenAI)
@@ -600,8 +693,10 @@ def run_all_day_paper(
         # string format such as Wed, 10 May 23
     print ("the date for the arxiv data is: ", date)
 
-    file_path = os.path.join(DATA_DIR, f"{date}.jsonl")
-    all_papers = [json.loads(l) for l in open(file_path, "r")]
+    papers = paper_store.load_listing(paper_store.LEGACY_FIELD, date)
+    if papers is None:
+        raise FileNotFoundError(paper_store.listing_file_path(paper_store.LEGACY_FIELD, date))
+    all_papers = list(papers)
     print (f"We found {len(all_papers)}.")
 
     all_papers_in_subjects = [
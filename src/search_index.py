@@ -0,0 +1,230 @@
+"""
+Local BM25 full-text search over ingested papers.
+
+Titles, abstracts and full text from the paper store are kept in an SQLite
+FTS5 index inside the same database, ranked with BM25 (title matches weigh
+most, then the abstract, then the body). Triggers on the store's tables keep
+the index current as listings are ingested and content is crawled, so ad-hoc
+queries over weeks of papers take milliseconds and no API calls:
+
+    python src/search_index.py "layout generation diffusion" --category cs.CV --since 2024-10-01
+
+Stores created before the index existed are indexed on first use, and
+    python src/search_index.py --rebuild
+re-indexes everything from scratch.
+"""
+import argparse
+import json
+import re
+import sqlite3
+import threading
+from typing import Any, Dict, List, Optional
+
+import paper_store
+
+# BM25 column weights for title, abstract and content
+TITLE_WEIGHT = 10.0
+ABSTRACT_WEIGHT = 4.0
+CONTENT_WEIGHT = 1.0
+SNIPPET_TOKENS = 24
+
+# The index row of a paper shares its rowid with the papers table
+_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS papers_fts USING fts5(
+    title, abstract, content, tokenize = 'porter unicode61 remove_diacritics 2'
+);
+
+CREATE TRIGGER IF NOT EXISTS papers_fts_insert AFTER INSERT ON papers BEGIN
+    INSERT INTO papers_fts (rowid, title, abstract, content)
+    VALUES (new.rowid, new.title, json_extract(new.record, '$.abstract'),
+            (SELECT content FROM paper_content WHERE id = new.id));
+END;
+
+CREATE TRIGGER IF NOT EXISTS papers_fts_update AFTER UPDATE OF title, record ON papers BEGIN
+    UPDATE papers_fts SET title = new.title, abstract = json_extract(new.record, '$.abstract')
+    WHERE rowid = new.rowid;
+END;
+
+CREATE TRIGGER IF NOT EXISTS paper_content_fts_insert AFTER INSERT ON paper_content BEGIN
+    UPDATE papers_fts SET content = new.content WHERE rowid = (SELECT rowid FROM papers WHERE id = new.id);
+END;
+
+CREATE TRIGGER IF NOT EXISTS paper_content_fts_update AFTER UPDATE OF content ON paper_content BEGIN
+    UPDATE papers_fts SET content = new.content WHERE rowid = (SELECT rowid FROM papers WHERE id = new.id);
+END;
+"""
+
+# Papers newer than the index (rowids only grow; papers are never deleted)
+_CATCH_UP = """
+INSERT INTO papers_fts (rowid, title, abstract, content)
+SELECT p.rowid, p.title, json_extract(p.record, '$.abstract'), c.content
+FROM papers p LEFT JOIN paper_content c ON c.id = p.id
+WHERE p.rowid > (SELECT COALESCE(MAX(rowid), 0) FROM papers_fts)
+"""
+
+# Words, optionally with a trailing '*' for prefix search
+_TERM = re.compile(r"\w+\*?")
+
+
+def build_query(text: str, match_any: bool = False) -> Optional[str]:
+    """
+    Turn free text into an FTS5 query.
+
+    Each word is quoted, so punctuation and FTS5 operators in user input are
+    matched literally; a trailing '*' keeps prefix matching ('segment*').
+
+    Args:
+        text: Search terms
+        match_any: Match papers containing any term instead of all of them
+
+    Returns:
+        The query, or None if the text has no searchable words
+    """
+    terms = []
+    for term in _TERM.findall(text):
+        prefix = term.endswith("*")
+        terms.append('"' + term.rstrip("*") + '"' + ("*" if prefix else ""))
+    if not terms:
+        return None
+    return (" OR " if match_any else " ").join(terms)
+
+
+class SearchIndex:
+    """BM25 index over a PaperStore, stored in the same SQLite database."""
+    def __init__(self, store: Optional[paper_store.PaperStore] = None):
+        self.store = store or paper_store.get_store()
+        self.available = True
+        try:
+            with self.store._connect() as conn:
+                conn.executescript(_SCHEMA)
+        except sqlite3.OperationalError as e:
+            # SQLite builds without FTS5
+            print(f"Full-text search unavailable: {e}")
+            self.available = False
+            return
+        self.sync()
+
+    def sync(self) -> int:
+        """
+        Index papers stored since the index was last updated. The triggers do
+        this as papers are written; this covers stores written before they existed.
+
+        Returns:
+            Number of papers added to the index
+        """
+        if not self.available:
+            return 0
+        with self.store._connect() as conn:
+            return conn.execute(_CATCH_UP).rowcount
+
+    def rebuild(self) -> int:
+        """Re-index every stored paper. Returns the number of papers indexed."""
+        if not self.available:
+            return 0
+        with self.store._connect() as conn:
+            conn.execute("DELETE FROM papers_fts")
+            indexed = conn.execute(_CATCH_UP).rowcount
+            conn.execute("INSERT INTO papers_fts (papers_fts) VALUES ('optimize')")
+        return indexed
+
+    def search(
+        self,
+        query: str,
+        limit: int = 20,
+        category: Optional[str] = None,
+        since: Optional[str] = None,
+        until: Optional[str] = None,
+        match_any: bool = False
+    ) -> List[Dict[str, Any]]:
+        """
+        Papers matching a query, best BM25 match first.
+
+        Args:
+            query: Search terms, e.g. "layout generation diffusion"
+            limit: Maximum number of papers
+            category: Only papers listed in this category, e.g. "cs.CV" (including cross-lists)
+            since, until: Inclusive announce dates, as 'YYYY-MM-DD' or 'Wed, 10 May 23'
+            match_any: Match any term instead of all terms
+
+        Returns:
+            Paper dicts (without full text), each with 'announce_date',
+            'search_score' (higher is better) and a 'snippet' of the best
+            matching passage, with matches wrapped in <b></b>
+        """
+        match = build_query(query, match_any)
+        if not self.available or match is None:
+            return []
+        joins = "JOIN papers p ON p.rowid = papers_fts.rowid"
+        where = "papers_fts MATCH ?"
+        params = (match,)
+        if category:
+            joins += " JOIN paper_categories pc ON pc.id = p.id"
+            where += " AND pc.category = ?"
+            params += (category,)
+        if since:
+            where += " AND p.announce_date >= ?"
+            params += (paper_store.as_iso_date(since),)
+        if until:
+            where += " AND p.announce_date <= ?"
+            params += (paper_store.as_iso_date(until),)
+        sql = (
+            f"SELECT p.record, p.announce_date, "
+            f"bm25(papers_fts, {TITLE_WEIGHT}, {ABSTRACT_WEIGHT}, {CONTENT_WEIGHT}) AS score, "
+            f"snippet(papers_fts, -1, '<b>', '</b>', '…', {SNIPPET_TOKENS}) AS snippet "
+            f"FROM papers_fts {joins} WHERE {where} ORDER BY score LIMIT ?"
+        )
+        rows = self.store._connect().execute(sql, params + (limit,)).fetchall()
+        results = []
+        for row in rows:
+            paper = json.loads(row["record"])
+            paper["announce_date"] = row["announce_date"]
+            # FTS5's bm25() is negative, lower being better
+            paper["search_score"] = round(-row["score"], 3)
+            paper["snippet"] = row["snippet"]
+            results.append(paper)
+        return results
+
+
+_default_index = None
+_index_lock = threading.Lock()
+
+
+def get_index() -> SearchIndex:
+    """Return the search index of the shared paper store."""
+    global _default_index
+    with _index_lock:
+        if _default_index is None:
+            _default_index = SearchIndex()
+        return _default_index
+
+
+def search(query: str, limit: int = 20, category: Optional[str] = None, since: Optional[str] = None,
+           until: Optional[str] = None, match_any: bool = False) -> List[Dict[str, Any]]:
+    """Search the shared paper store; see SearchIndex.search."""
+    return get_index().search(query, limit=limit, category=category, since=since, until=until,
+                              match_any=match_any)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Search ingested papers with BM25")
+    parser.add_argument("query", nargs="?", help="Search terms")
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--category", help="Restrict to a category, e.g. cs.CV")
+    parser.add_argument("--since", help="Earliest announce date, YYYY-MM-DD")
+    parser.add_argument("--until", help="Latest announce date, YYYY-MM-DD")
+    parser.add_argument("--any", action="store_true", help="Match any term instead of all terms")
+    parser.add_argument("--rebuild", action="store_true", help="Re-index every stored paper")
+    args = parser.parse_args()
+
+    if args.rebuild:
+        print(f"Indexed {get_index().rebuild()} papers")
+    if args.query:
+        for paper in search(args.query, limit=args.limit, category=args.category, since=args.since,
+                            until=args.until, match_any=args.any):
+            print(f"{paper['search_score']:7.2f}  {paper['announce_date']}  {paper['main_page']}  {paper['title']}")
+    elif not args.rebuild:
+        parser.error("a query or --rebuild is required")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,257 @@
+"""
+Section-aware full-text extraction for arXiv HTML (LaTeXML) papers.
+
+Instead of joining every paragraph of the document and keeping the first N
+characters (usually just the introduction), the extractor walks the LaTeXML
+section structure, fills a character budget from the most useful sections
+first, and stops reading paragraphs once the budget is spent. The result is a
+{section title: text} dict in document order.
+"""
+import os
+import re
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from bs4 import BeautifulSoup as bs
+
+try:
+    import lxml.html
+    LXML_AVAILABLE = True
+except ImportError:
+    LXML_AVAILABLE = False
+
+# Default character budget per paper; roughly 4 characters per token
+EXTRACT_CHAR_BUDGET = int(os.environ.get("ARXIV_CONTENT_BUDGET", 10000))
+CHARS_PER_TOKEN = 4
+
+# Section kinds filled first, in this order; everything else follows in document order
+DEFAULT_PRIORITY = ("abstract", "method", "experiments", "conclusion")
+
+# Title keywords for each section kind, checked top to bottom
+_SECTION_KINDS = [
+    ("abstract", ("abstract",)),
+    ("introduction", ("introduction",)),
+    ("related", ("related work", "background", "prior work", "literature")),
+    ("conclusion", ("conclusion", "concluding", "summary", "future work")),
+    ("experiments", ("experiment", "evaluation", "result", "benchmark", "ablation")),
+    ("method", ("method", "approach", "framework", "model", "architecture", "algorithm", "proposed")),
+    ("discussion", ("discussion", "limitation", "analysis")),
+]
+# Sections never worth prompt space
+_SKIPPED_TITLES = ("acknowledg", "reference", "bibliography")
+
+# Shortest cut-off paragraph start worth keeping
+_MIN_PIECE = 40
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def section_kind(title: str) -> str:
+    """Classify a section heading, e.g. 'Proposed Approach' -> 'method'. Unknown headings are 'other'."""
+    lowered = title.lower()
+    for kind, keywords in _SECTION_KINDS:
+        if any(keyword in lowered for keyword in keywords):
+            return kind
+    return "other"
+
+
+def _clean(text: str) -> str:
+    return _WHITESPACE.sub(" ", text).strip()
+
+
+def _class_xpath(tag: str, cls: str) -> str:
+    # Whole-token class match, so 'ltx_para' does not also match 'ltx_paragraph'
+    return f"{tag}[contains(concat(' ', normalize-space(@class), ' '), ' {cls} ')]"
+
+
+def _sections_lxml(html) -> List[Tuple[str, Callable[[], Iterator[str]]]]:
+    if isinstance(html, bytes):
+        html = html.decode("utf-8", errors="replace")
+    doc = lxml.html.document_fromstring(html)
+    pages = doc.xpath("//" + _class_xpath("div", "ltx_page_content"))
+    if not pages:
+        return []
+    page = pages[0]
+
+    def _paragraphs(node, xpath):
+        def _iter():
+            for para in node.xpath(xpath):
+                text = _clean(para.text_content())
+                if text:
+                    yield text
+        return _iter
+
+    sections = []
+    for abstract in page.xpath(".//" + _class_xpath("div", "ltx_abstract")):
+        sections.append(("Abstract", _paragraphs(abstract, ".//" + _class_xpath("p", "ltx_p"))))
+
+    for section in page.xpath(".//" + _class_xpath("section", "ltx_section")):
+        headings = section.xpath("./*[self::h2 or self::h3][contains(@class, 'ltx_title')]")
+        if not headings:
+            continue
+        heading = headings[0]
+        title = _clean(heading.text_content())
+        tags = heading.xpath(".//" + _class_xpath("span", "ltx_tag"))
+        if tags:
+            # Drop the section number LaTeXML renders in front of the title
+            tag = _clean(tags[0].text_content())
+            if title.startswith(tag):
+                title = title[len(tag):].strip()
+        sections.append((title, _paragraphs(section, ".//" + _class_xpath("div", "ltx_para"))))
+
+    if len(sections) <= 1:
+        # Papers without \section structure: treat the whole body as one section
+        sections.append(("Body", _paragraphs(page, ".//" + _class_xpath("div", "ltx_para"))))
+    return sections
+
+
+def _sections_bs4(html) -> List[Tuple[str, Callable[[], Iterator[str]]]]:
+    soup = bs(html, features="html.parser")
+    page = soup.find("div", attrs={"class": "ltx_page_content"})
+    if not page:
+        return []
+
+    def _paragraphs(nodes):
+        def _iter():
+            for para in nodes:
+                text = _clean(para.get_text())
+                if text:
+                    yield text
+        return _iter
+
+    sections = []
+    for abstract in page.find_all("div", attrs={"class": "ltx_abstract"}):
+        sections.append(("Abstract", _paragraphs(abstract.find_all("p", attrs={"class": "ltx_p"}))))
+
+    for section in page.find_all("section", attrs={"class": "ltx_section"}):
+        heading = section.find(["h2", "h3"], attrs={"class": "ltx_title"}, recursive=False)
+        if heading is None:
+            continue
+        title = _clean(heading.get_text())
+        tag = heading.find("span", attrs={"class": "ltx_tag"})
+        if tag is not None:
+            tag_text = _clean(tag.get_text())
+            if title.startswith(tag_text):
+                title = title[len(tag_text):].strip()
+        sections.append((title, _paragraphs(section.find_all("div", attrs={"class": "ltx_para"}))))
+
+    if len(sections) <= 1:
+        sections.append(("Body", _paragraphs(page.find_all("div", attrs={"class": "ltx_para"}))))
+    return sections
+
+
+def _truncate(text: str, limit: int) -> str:
+    if len(text) <= limit:
+        return text
+    cut = text[:limit]
+    # Prefer ending on a word boundary
+    space = cut.rfind(" ")
+    return cut[:space] if space > limit // 2 else cut
+
+
+def _allocate(
+    sections: List[Tuple[str, Callable[[], Iterator[str]]]],
+    budget: int,
+    priority: Sequence[str]
+) -> Dict[str, str]:
+    # Unique keys, in document order
+    titles = []
+    for title, _ in sections:
+        key, n = title or "Untitled", 2
+        while key in titles:
+            key, n = f"{title} ({n})", n + 1
+        titles.append(key)
+
+    order = []
+    for kind in priority:
+        order += [i for i, (title, _) in enumerate(sections) if section_kind(title) == kind and i not in order]
+    order += [i for i in range(len(sections)) if i not in order]
+    order = [i for i in order if not sections[i][0].lower().startswith(_SKIPPED_TITLES)]
+
+    texts = {i: [] for i in order}
+    used = {i: 0 for i in order}
+    readers = {i: sections[i][1]() for i in order}
+    pending = {}  # rest of a paragraph cut off by a section's share
+    remaining = budget
+
+    def _fill(i, limit):
+        nonlocal remaining
+        # Paragraphs are only read until this section's share is used up
+        while remaining > 0 and used[i] < limit:
+            continued = i in pending and bool(texts[i])
+            paragraph = pending.pop(i) if i in pending else next(readers[i], None)
+            if paragraph is None:
+                return
+            # A section's first piece also pays for its "title: " prefix and the
+            # blank line render_sections puts before it
+            header = 0 if texts[i] else len(titles[i]) + 4
+            room = min(limit - used[i], remaining) - header
+            piece = _truncate(paragraph, max(room, 0))
+            if not piece.strip() or (not continued and len(piece) < min(len(paragraph), _MIN_PIECE, limit // 2)):
+                # Not worth starting a paragraph with only a few characters of room
+                pending[i] = paragraph
+                return
+            if continued:
+                texts[i][-1] += piece
+            else:
+                texts[i].append(piece)
+            used[i] += header + len(piece) + 1
+            remaining -= header + len(piece) + 1
+            if len(piece) < len(paragraph):
+                pending[i] = paragraph[len(piece):]
+                return
+
+    # Pass 1: priority sections share the budget so one long method section
+    # cannot crowd out the experiments and conclusion
+    prioritized = [i for i in order if section_kind(sections[i][0]) in priority]
+    if prioritized:
+        share = budget // len(prioritized)
+        for i in prioritized:
+            _fill(i, share)
+    # Pass 2: spend what is left in priority order
+    for i in order:
+        if remaining <= 0:
+            break
+        _fill(i, budget)
+
+    return {titles[i]: " ".join(texts[i]) for i in sorted(texts) if texts[i]}
+
+
+def extract_sections(
+    html,
+    budget: int = EXTRACT_CHAR_BUDGET,
+    max_tokens: Optional[int] = None,
+    priority: Sequence[str] = DEFAULT_PRIORITY
+) -> Dict[str, str]:
+    """
+    Extract a budget-bounded, section-structured excerpt of an arXiv HTML paper.
+
+    Args:
+        html: LaTeXML page bytes or text
+        budget: Maximum characters of the rendered excerpt (see render_sections), titles included
+        max_tokens: Token budget instead of a character budget (approximate)
+        priority: Section kinds to fill first (see section_kind)
+
+    Returns:
+        {section title: text} in document order; empty if the page has no
+        LaTeXML content
+    """
+    if max_tokens is not None:
+        budget = max_tokens * CHARS_PER_TOKEN
+    sections = _sections_lxml(html) if LXML_AVAILABLE else _sections_bs4(html)
+    return _allocate(sections, budget, priority)
+
+
+def fit_sections(
+    sections: Dict[str, str],
+    budget: int,
+    priority: Sequence[str] = DEFAULT_PRIORITY
+) -> Dict[str, str]:
+    """Trim an already extracted {section: text} dict so it renders within a smaller budget."""
+    def _reader(text):
+        return lambda: iter([text])
+    return _allocate([(title, _reader(text)) for title, text in sections.items()], budget, priority)
+
+
+def render_sections(sections: Dict[str, str]) -> str:
+    """Flatten sections into prompt text, one titled block per section."""
+    return "\n\n".join(f"{title}: {text}" for title, text in sections.items())
@@ -6,12 +6,21 @@ import io
 import sys
 import time
 import json
+from concurrent.futures import ThreadPoolExecutor
 from typing import Optional, Sequence, Union, Dict, Any
 
 import openai
 import tqdm
 import copy
 
+import rate_limit
+
+try:
+    import tiktoken
+    TIKTOKEN_AVAILABLE = True
+except ImportError:
+    TIKTOKEN_AVAILABLE = False
+
 # Handle both old and new OpenAI SDK versions
 try:
     from openai import openai_object
@@ -28,6 +37,30 @@ if openai_org is not None:
     logging.warning(f"Switching to organization: {openai_org} for OAI API key.")
 
 
+# Concurrent requests per openai_completion call, and the account limits every
+# call in the process shares (requests and tokens per minute)
+OPENAI_MAX_CONCURRENCY = int(os.environ.get("OPENAI_MAX_CONCURRENCY", 12))
+OPENAI_RPM = float(os.environ.get("OPENAI_RPM", 500))
+OPENAI_TPM = float(os.environ.get("OPENAI_TPM", 200000))
+
+
+_openai_limiter = rate_limit.ModelRateLimiter(OPENAI_RPM, OPENAI_TPM)
+
+
+def _prompt_tokens(prompt_batch, model_name):
+    return sum(
+        count_tokens(prompt if isinstance(prompt, str) else json.dumps(prompt), model_name)
+        for prompt in prompt_batch
+    )
+
+
+def _retry_after(error):
+    # Retry-After header of an OpenAI rate-limit error, when the SDK exposes one
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    return rate_limit.retry_after_seconds(headers.get("retry-after"))
+
+
 @dataclasses.dataclass
 class OpenAIDecodingArguments(object):
     #max_tokens: int = 1800
@@ -42,6 +75,129 @@ class OpenAIDecodingArguments(object):
     # logprobs: Optional[int] = None
 
 
+def _complete_batch(client, prompt_batch, decoding_args, model_name, is_chat_model, sleep_time, decoding_kwargs):
+    """Send one prompt batch, retrying rate limits with backoff. Returns its choices."""
+    batch_decoding_args = copy.deepcopy(decoding_args)  # cloning the decoding_args
+
+    backoff = 5
+    attempt = 0
+    prompt_tokens = _prompt_tokens(prompt_batch, model_name)
+
+    while True:
+        # Book request and token capacity instead of sleeping blindly before every
+        # call; OpenAI counts the most the completion can use against TPM
+        output_tokens = batch_decoding_args.max_tokens * batch_decoding_args.n
+        _openai_limiter.acquire(prompt_tokens, output_tokens=output_tokens)
+        try:
+            shared_kwargs = dict(
+                model=model_name,
+                **batch_decoding_args.__dict__,
+                **decoding_kwargs,
+            )
+
+            if OPENAI_OLD_API:
+                # Use old API format
+                if is_chat_model:
+                    completion_batch = openai.ChatCompletion.create(
+                        messages=[
+                            {"role": "system", "content": "You are a helpful assistant."},
+                            {"role": "user", "content": prompt_batch[0]}
+                        ],
+                        **shared_kwargs
+                    )
+                else:
+                    completion_batch = openai.Completion.create(prompt=prompt_batch, **shared_kwargs)
+
+                choices = completion_batch.choices
+
+                for choice in choices:
+                    choice["total_tokens"] = completion_batch.usage.total_tokens
+            else:
+                # Use new API format
+                if is_chat_model:
+                    completion_batch = client.chat.completions.create(
+                        model=model_name,
+                        messages=[
+                            {"role": "system", "content": "You are a helpful assistant."},
+                            {"role": "user", "content": prompt_batch[0]}
+                        ],
+                        temperature=batch_decoding_args.temperature,
+                        max_tokens=batch_decoding_args.max_tokens,
+                        top_p=batch_decoding_args.top_p,
+                        n=batch_decoding_args.n,
+                        stream=batch_decoding_args.stream,
+                        presence_penalty=batch_decoding_args.presence_penalty,
+                        frequency_penalty=batch_decoding_args.frequency_penalty,
+                        **decoding_kwargs
+                    )
+
+                    # Convert completion to dictionary format for consistency
+                    choices = []
+                    for choice in completion_batch.choices:
+                        choice_dict = {
+                            "message": {
+                                "content": choice.message.content,
+                                "role": choice.message.role
+                            },
+                            "index": choice.index,
+                            "finish_reason": choice.finish_reason,
+                            "total_tokens": completion_batch.usage.total_tokens
+                        }
+                        choices.append(choice_dict)
+                else:
+                    completion_batch = client.completions.create(
+                        model=model_name,
+                        prompt=prompt_batch, 
+                        temperature=batch_decoding_args.temperature,
+                        max_tokens=batch_decoding_args.max_tokens,
+                        top_p=batch_decoding_args.top_p,
+                        n=batch_decoding_args.n,
+                        stream=batch_decoding_args.stream,
+                        presence_penalty=batch_decoding_args.presence_penalty,
+                        frequency_penalty=batch_decoding_args.frequency_penalty,
+                        **decoding_kwargs
+                    )
+
+                    # Convert completion to dictionary format for consistency
+                    choices = []
+                    for choice in completion_batch.choices:
+                        choice_dict = {
+                            "text": choice.text,
+                            "index": choice.index,
+                            "finish_reason": choice.finish_reason,
+                            "total_tokens": completion_batch.usage.total_tokens
+                        }
+                        choices.append(choice_dict)
+        except Exception as e:
+            # A failed request used none of its reservation
+            _openai_limiter.refund(prompt_tokens, output_tokens=output_tokens)
+            logging.warning(f"OpenAI API Error: {e}.")
+            if "Please reduce your prompt" in str(e):
+                batch_decoding_args.max_tokens = int(batch_decoding_args.max_tokens * 0.8)
+                logging.warning(f"Reducing target length to {batch_decoding_args.max_tokens}, Retrying...")
+            elif not backoff:
+                logging.error("Hit too many failures, exiting")
+                raise e
+            else:
+                backoff -= 1
+                retry_after = _retry_after(e)
+                delay = rate_limit.backoff_delay(attempt, retry_after, cap=sleep_time)
+                if retry_after is not None:
+                    # The limit is per organization, so every worker waits
+                    _openai_limiter.pause(delay)
+                attempt += 1
+                logging.warning(f"Hit request rate limit; retrying in {delay:.1f}s...")
+                time.sleep(delay)
+                continue
+        else:
+            # Give back what the request reserved but did not use
+            usage = getattr(completion_batch, "usage", None)
+            if usage is not None:
+                _openai_limiter.refund(max(0, prompt_tokens - usage.prompt_tokens),
+                                       output_tokens=max(0, output_tokens - usage.completion_tokens))
+            return choices
+
+
 def openai_completion(
     prompts, #: Union[str, Sequence[str], Sequence[dict[str, str]], dict[str, str]],
     decoding_args: OpenAIDecodingArguments,
@@ -55,6 +211,10 @@ def openai_completion(
 ) -> Union[Union[StrOrOpenAIObject], Sequence[StrOrOpenAIObject], Sequence[Sequence[StrOrOpenAIObject]],]:
     """Decode with OpenAI API.
 
+    Prompt batches are sent concurrently, up to OPENAI_MAX_CONCURRENCY at a time
+    and paced by the process-wide OPENAI_RPM/OPENAI_TPM buckets; completions
+    come back in prompt order.
+
     Args:
         prompts: A string or a list of strings to complete. If it is a chat model the strings should be formatted
             as explained here: https://github.com/openai/openai-python/blob/main/chatml.md. If it is a chat model
@@ -62,7 +222,7 @@ def openai_completion(
             https://github.com/openai/openai-cookbook/blob/main/examples/How_to_format_inputs_to_ChatGPT_models.ipynb
         decoding_args: Decoding arguments.
         model_name: Model name. Can be either in the format of "org/model" or just "model".
-        sleep_time: Time to sleep once the rate-limit is hit.
+        sleep_time: Longest backoff after hitting the rate limit.
         batch_size: Number of prompts to send in a single request. Only for non chat model.
         max_instances: Maximum number of prompts to decode.
         max_batches: Maximum number of batches to decode. This argument will be deprecated in the future.
@@ -95,116 +255,20 @@ def openai_completion(
         for batch_id in range(int(math.ceil(num_prompts / batch_size)))
     ]
 
+    # Batches run concurrently, paced by the shared client-side RPM/TPM buckets;
+    # map() returns them in their original order
+    client = None if OPENAI_OLD_API else openai.OpenAI()
+
+    def _complete(prompt_batch):
+        return _complete_batch(client, prompt_batch, decoding_args, model_name, is_chat_model, sleep_time,
+                               decoding_kwargs)
+
     completions = []
-    for batch_id, prompt_batch in tqdm.tqdm(
-        enumerate(prompt_batches),
-        desc="prompt_batches",
-        total=len(prompt_batches),
-    ):
-        batch_decoding_args = copy.deepcopy(decoding_args)  # cloning the decoding_args
-
-        backoff = 5
-
-        while True:
-            try:
-                time.sleep(3)
-                shared_kwargs = dict(
-                    model=model_name,
-                    **batch_decoding_args.__dict__,
-                    **decoding_kwargs,
-                )
-                
-                if OPENAI_OLD_API:
-                    # Use old API format
-                    if is_chat_model:
-                        completion_batch = openai.ChatCompletion.create(
-                            messages=[
-                                {"role": "system", "content": "You are a helpful assistant."},
-                                {"role": "user", "content": prompt_batch[0]}
-                            ],
-                            **shared_kwargs
-                        )
-                    else:
-                        completion_batch = openai.Completion.create(prompt=prompt_batch, **shared_kwargs)
-                    
-                    choices = completion_batch.choices
-                    
-                    for choice in choices:
-                        choice["total_tokens"] = completion_batch.usage.total_tokens
-                else:
-                    # Use new API format
-                    client = openai.OpenAI()
-                    
-                    if is_chat_model:
-                        completion_batch = client.chat.completions.create(
-                            model=model_name,
-                            messages=[
-                                {"role": "system", "content": "You are a helpful assistant."},
-                                {"role": "user", "content": prompt_batch[0]}
-                            ],
-                            temperature=batch_decoding_args.temperature,
-                            max_tokens=batch_decoding_args.max_tokens,
-                            top_p=batch_decoding_args.top_p,
-                            n=batch_decoding_args.n,
-                            stream=batch_decoding_args.stream,
-                            presence_penalty=batch_decoding_args.presence_penalty,
-                            frequency_penalty=batch_decoding_args.frequency_penalty,
-                            **decoding_kwargs
-                        )
-                        
-                        # Convert completion to dictionary format for consistency
-                        choices = []
-                        for choice in completion_batch.choices:
-                            choice_dict = {
-                                "message": {
-                                    "content": choice.message.content,
-                                    "role": choice.message.role
-                                },
-                                "index": choice.index,
-                                "finish_reason": choice.finish_reason,
-                                "total_tokens": completion_batch.usage.total_tokens
-                            }
-                            choices.append(choice_dict)
-                    else:
-                        completion_batch = client.completions.create(
-                            model=model_name,
-                            prompt=prompt_batch, 
-                            temperature=batch_decoding_args.temperature,
-                            max_tokens=batch_decoding_args.max_tokens,
-                            top_p=batch_decoding_args.top_p,
-                            n=batch_decoding_args.n,
-                            stream=batch_decoding_args.stream,
-                            presence_penalty=batch_decoding_args.presence_penalty,
-                            frequency_penalty=batch_decoding_args.frequency_penalty,
-                            **decoding_kwargs
-                        )
-                        
-                        # Convert completion to dictionary format for consistency
-                        choices = []
-                        for choice in completion_batch.choices:
-                            choice_dict = {
-                                "text": choice.text,
-                                "index": choice.index,
-                                "finish_reason": choice.finish_reason,
-                                "total_tokens": completion_batch.usage.total_tokens
-                            }
-                            choices.append(choice_dict)
-                
-                completions.extend(choices)
-                break
-            except Exception as e:
-                logging.warning(f"OpenAI API Error: {e}.")
-                if "Please reduce your prompt" in str(e):
-                    batch_decoding_args.max_tokens = int(batch_decoding_args.max_tokens * 0.8)
-                    logging.warning(f"Reducing target length to {batch_decoding_args.max_tokens}, Retrying...")
-                elif not backoff:
-                    logging.error("Hit too many failures, exiting")
-                    raise e
-                else:
-                    backoff -= 1
-                    logging.warning("Hit request rate limit; retrying...")
-                    time.sleep(sleep_time)  # Annoying rate limit on requests.
-                    continue
+    max_workers = max(1, min(OPENAI_MAX_CONCURRENCY, len(prompt_batches)))
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for choices in tqdm.tqdm(executor.map(_complete, prompt_batches), desc="prompt_batches",
+                                 total=len(prompt_batches)):
+            completions.extend(choices)
 
     if return_text:
         if is_chat_model:
@@ -228,3 +292,21 @@ def write_ans_to_file(ans_data, file_prefix, output_dir="./output"):
     with open(filename, "w") as f:
         for ans in ans_data:
             f.write(ans + "\n")
+
+
+def count_tokens(text, model_name="gpt-3.5-turbo"):
+    """
+    Count the tokens a piece of text costs in a prompt.
+
+    Uses tiktoken's encoding for the model when tiktoken is installed, and a
+    4-characters-per-token estimate otherwise.
+    """
+    if not text:
+        return 0
+    if TIKTOKEN_AVAILABLE:
+        try:
+            encoding = tiktoken.encoding_for_model(model_name)
+        except KeyError:
+            encoding = tiktoken.get_encoding("cl100k_base")
+        return len(encoding.encode(text, disallowed_special=()))
+    return math.ceil(len(text) / 4)